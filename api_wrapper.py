@@ -3,82 +3,241 @@
 FastAPI wrapper que expone /query y utiliza los módulos internos de src
 para hacer una sola consulta por DNI y devolver un mensaje amigable para Chatwoot.
 """
-import os
-import sys
-from typing import Optional
-
-# Asegurar que /app/src esté en el path cuando el contenedor working_dir es /app
-ROOT = os.path.dirname(os.path.abspath(__file__))
-SRC = os.path.join(ROOT, "src")
-if SRC not in sys.path:
-    sys.path.insert(0, SRC)
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-import uvicorn
-import time
-import threading
-
-# Importar funciones internas
-try:
-    from api.auth import login
-    from api.client import consultar_dni
-    from utils.messages import generar_mensaje_personalizado, determinar_estado_consulta
-except Exception as e:
-    raise
+from typing import List, Literal, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
+import asyncio
+import logging
+import secrets
+
+# Importar funciones internas (paquete src, relativo a /app)
+from src.config import get_settings
+from src.api.session import AsyncSessionManager
+from src.api.token_store import crear_token_store
+from src.api.transport import close_async_client, calentar_conexiones, get_webhook_client
+from src.utils.store import crear_result_store
+from src.utils.indice import crear_indice_dni
+from src.utils.singleflight import AsyncSingleFlight
+from src.utils.jobs import ColaLlena, ColaTrabajos
+from src.utils.messages import generar_mensajes, generar_mensaje_personalizado
+from src.utils.formatters import extraer_dni
+from src.api import metrics
+from src.utils import fastjson, trace
+from src.utils.logs import configurar_logging
+from src.utils.perfil import crear_perfilador
+from src.api.governor import get_governor, get_governor_lote
+from src.api.circuit import get_circuit
+from src.api.scheduler import INTERACTIVA, MASIVA, Planificador
+from src.api.resultado import ConsultaResult, Estado
 
 app = FastAPI(title="Calidda API", version="1.0")
+logger = logging.getLogger(__name__)
+# Loaded and validated once; the service cannot start without credentials
+settings = get_settings()
+# Records go through an in-memory queue; a listener thread formats and writes them,
+# so requests never wait on log I/O
+configurar_logging()
 
-# Session cache to avoid logging in on every request when running as a long-lived
-# FastAPI process. The CLI (`src/main.py`) already keeps a session for the duration
-# of the process. For the wrapper we keep a module-level cached session and refresh
-# it after SESSION_TTL seconds or when login fails.
-SESSION_TTL = int(os.environ.get("CALIDDA_SESSION_TTL", 60 * 60))  # 1 hour by default
-_session_lock = threading.Lock()
-_session_cache = {
-    "session": None,
-    "id_aliado": None,
-    "ts": 0,
-}
+# Session manager: one logged-in httpx.AsyncClient for the whole process. The token
+# is refreshed in the background shortly before its JWT `exp`, so no request pays
+# login latency, and a 401 triggers one transparent re-login and retry. With
+# TOKEN_STORE_PATH set, all uvicorn workers share one token instead of N logins.
+_sessions = AsyncSessionManager(token_store=crear_token_store())
+# Set by the startup warm-up once the service has logged in and opened connections
+_warmup = {"warm": False, "connections": 0}
 
+# Result cache in front of consultar_dni. Users often resend their DNI in the same
+# conversation and n8n retries, so repeated lookups are served from the store
+# (in-memory LRU, or SQLite shared by all workers when RESULT_STORE=sqlite).
+_result_cache = crear_result_store()
+_refreshing = {}  # dni -> background refresh task
+# Cross-run bitmap of seen DNIs (DNI_INDEX_PATH): a DNI already found "no encontrado"
+# is answered without calling Calidda; the index is saved every DNI_INDEX_SAVE_SECONDS
+_indice = crear_indice_dni()
+_guardado_indice = None  # periodic save task
+# Concurrent requests for the same DNI share one in-flight upstream call
+_inflight = AsyncSingleFlight()
+# Upstream slots shared by interactive /query traffic and bulk work (batch, stale
+# refreshes): interactive lookups go first, bulk keeps a weighted share
+_scheduler = Planificador(settings.UPSTREAM_CONCURRENCY, peso=settings.SCHEDULER_INTERACTIVE_WEIGHT)
+# cProfile for a PROFILE_SAMPLE_RATE fraction of /query requests, aggregated for
+# /admin/profile. None when the rate is 0, so the request path only checks for None.
+_perfilador = crear_perfilador(settings.PROFILE_SAMPLE_RATE)
 
-def get_session(force: bool = False):
-    """Return a logged-in requests.Session and id_aliado. Re-login when needed.
 
-    force: if True, forces a fresh login.
-    """
-    now = time.time()
-    # Fast path: valid session
-    sess = _session_cache.get("session")
-    if not force and sess and (now - _session_cache.get("ts", 0) < SESSION_TTL):
-        return sess, _session_cache.get("id_aliado")
-
-    # Acquire lock to perform a single login across threads
-    with _session_lock:
-        # Check again after acquiring lock
-        sess = _session_cache.get("session")
-        if (
-            not force
-            and sess
-            and (time.time() - _session_cache.get("ts", 0) < SESSION_TTL)
-        ):
-            return sess, _session_cache.get("id_aliado")
-
-        # Perform login
-        s, id_aliado = login()
-        if not s:
-            # keep old session if exists but mark ts to 0 so next call will retry
-            _session_cache["ts"] = 0
-            raise RuntimeError("No se pudo iniciar sesión en Calidda")
-
-        _session_cache["session"] = s
-        _session_cache["id_aliado"] = id_aliado
-        _session_cache["ts"] = time.time()
-        return s, id_aliado
+async def _consultar_upstream(dni: str, clase: str = INTERACTIVA):
+    """Query Calidda for a DNI (coalescing concurrent calls) and cache the result."""
+    if clase == INTERACTIVA:
+        # A bulk lookup of this DNI still waiting for a slot now has a user waiting on it
+        _scheduler.promover(dni)
+    return await _inflight.do(dni, lambda: _consultar_y_cachear(dni, clase))
+
+
+async def _consultar_y_cachear(dni: str, clase: str):
+    try:
+        async with _scheduler.turno(clase, dni):
+            resultado = await _sessions.consultar(dni)
+    except RuntimeError as e:
+        # No se pudo iniciar sesión
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        # Invalidate cached session on unexpected errors so next request re-logins
+        _sessions.invalidate()
+        raise HTTPException(status_code=500, detail=f"Error consultando DNI: {e}")
+
+    await _result_cache.put_async(dni, resultado)
+    if _indice is not None:
+        _indice.registrar(dni, resultado)
+    return resultado
+
+
+async def _refrescar(dni: str):
+    """Background refresh of a stale cache entry."""
+    # Created inside a request: do not report into that request's trace
+    trace.desvincular()
+    try:
+        await _consultar_upstream(dni, MASIVA)
+    except Exception as e:
+        logger.warning("No se pudo refrescar DNI %s: %s", dni, e)
+    finally:
+        _refreshing.pop(dni, None)
+
+
+async def obtener_resultado(dni: str):
+    """Return the ConsultaResult for a DNI, using the cache when possible."""
+    with trace.medir("cache"):
+        resultado, stale = await _result_cache.get_async(dni)
+    if resultado is not None:
+        trace.anotar("cache", "stale" if stale else "hit")
+        if stale and dni not in _refreshing:
+            _refreshing[dni] = asyncio.create_task(_refrescar(dni))
+        return resultado
+
+    trace.anotar("cache", "miss")
+    resultado = _resultado_indice(dni)
+    if resultado is not None:
+        return resultado
+    return await _consultar_upstream(dni)
+
+
+def _resultado_indice(dni: str):
+    """ConsultaResult from the seen-DNI index, or None if Calidda must be queried."""
+    if _indice is None:
+        return None
+    resultado = _indice.resultado_conocido(dni)
+    if resultado is not None:
+        trace.anotar("index", "hit")
+    return resultado
+
+
+async def _guardar_indice_periodicamente():
+    while True:
+        await asyncio.sleep(settings.DNI_INDEX_SAVE_SECONDS)
+        try:
+            # Merging and writing 37.5 MB must not block the event loop
+            await asyncio.to_thread(_indice.guardar_si_cambio, 0)
+        except Exception as e:
+            logger.warning("No se pudo guardar el índice de DNIs: %s", e)
+
+
+async def _procesar_trabajo(trabajo):
+    """Run an async /query job; the returned dict is its result."""
+    traza = trace.Traza(trabajo.id)
+    estado = None
+    try:
+        with traza.activa():
+            resultado = await obtener_resultado(trabajo.dni)
+            estado = resultado.etiqueta
+            return construir_respuesta(trabajo.dni, resultado)
+    except HTTPException as e:
+        estado = f"http_{e.status_code}"
+        raise RuntimeError(e.detail) from None
+    finally:
+        traza.log(event="job", dni=trabajo.dni, estado=estado)
+
+
+async def _entregar_callback(url: str, payload: dict):
+    response = await get_webhook_client().post(url, json=payload, headers={"X-Job-ID": payload["job_id"]})
+    response.raise_for_status()
+
+
+# Async mode for /query: a lookup can outlive n8n/Chatwoot webhook timeouts, so the
+# request only enqueues a job. JOB_WORKERS tasks run the lookups, the result is POSTed
+# to callback_url (with retries) and kept for GET /jobs/{id} for JOB_TTL seconds.
+_jobs = ColaTrabajos(
+    _procesar_trabajo,
+    workers=settings.JOB_WORKERS,
+    max_pendientes=settings.JOB_QUEUE_MAX,
+    ttl=settings.JOB_TTL,
+    entregar=_entregar_callback,
+    reintentos=settings.CALLBACK_RETRIES,
+)
+
+
+async def _procesar_chatwoot(trabajo):
+    """Look up the DNI of a Chatwoot message; the returned dict is the reply message."""
+    traza = trace.Traza(trabajo.id)
+    estado = None
+    try:
+        with traza.activa():
+            # The customer always gets an answer: on any failure, the generic error
+            # template (a failed job would have nothing to post to Chatwoot)
+            try:
+                resultado = await obtener_resultado(trabajo.dni)
+            except HTTPException as e:
+                resultado = ConsultaResult(Estado.ERROR, e.detail)
+            except Exception as e:
+                logger.warning("Consulta del DNI %s para Chatwoot falló: %r", trabajo.dni, e)
+                resultado = ConsultaResult(Estado.EXCEPTION, str(e))
+            estado = resultado.etiqueta
+            with trace.medir("render"):
+                texto, _ = generar_mensaje_personalizado(resultado)
+    finally:
+        traza.log(event="chatwoot", dni=trabajo.dni, estado=estado)
+    return {"content": texto, "message_type": "outgoing", "private": False}
+
+
+async def _enviar_chatwoot(url: str, payload: dict):
+    response = await get_webhook_client().post(
+        url, json=payload["result"], headers={"api_access_token": settings.CHATWOOT_API_TOKEN},
+    )
+    response.raise_for_status()
+
+
+# Native Chatwoot webhook (CHATWOOT_URL): replies go straight to the conversation through
+# the Chatwoot API instead of Chatwoot -> n8n -> /query -> n8n -> Chatwoot. Same worker,
+# queue and retry settings as async /query jobs, over the pooled webhook client.
+_chatwoot = ColaTrabajos(
+    _procesar_chatwoot,
+    workers=settings.JOB_WORKERS,
+    max_pendientes=settings.JOB_QUEUE_MAX,
+    ttl=settings.JOB_TTL,
+    entregar=_enviar_chatwoot,
+    reintentos=settings.CALLBACK_RETRIES,
+) if settings.CHATWOOT_URL else None
+
+# Prometheus metrics: upstream latency by phase and results by estado are recorded
+# on the hot path; session, cache, single-flight, job and scheduler counters are read on scrape
+metrics.activar(
+    sesiones=_sessions, cache=_result_cache, singleflight=_inflight,
+    trabajos=_jobs, planificador=_scheduler,
+)
 
 
 class DNIRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
     dni: str = Field(..., min_length=8, max_length=8)
+    # Reply at once with a job id instead of waiting for Calidda (implied by callback_url)
+    async_mode: bool = Field(False, alias="async")
+    # The finished JobResponse is POSTed here
+    callback_url: Optional[HttpUrl] = None
+
+
+class BatchRequest(BaseModel):
+    dnis: List[str] = Field(..., min_length=1, max_length=settings.BATCH_MAX_DNIS)
 
 
 class QueryResponse(BaseModel):
@@ -86,66 +245,383 @@ class QueryResponse(BaseModel):
     dni: str
     client_message: Optional[str] = None
     # Versión compacta (una sola línea) adecuada para plataformas que no manejan bien saltos
-    # client_message_compact: Optional[str] = None
+    client_message_compact: Optional[str] = None
     # Versión HTML donde los saltos de línea se convierten en <br/> para Chatwoot u otros clientes
-    # client_message_html: Optional[str] = None
+    client_message_html: Optional[str] = None
+    # Versión con negritas de WhatsApp (*texto*)
+    client_message_whatsapp: Optional[str] = None
     raw_output: Optional[str] = None
     error: Optional[str] = None
     return_code: int
     tiene_oferta: bool = False
 
 
+class JobResponse(BaseModel):
+    job_id: str
+    dni: str
+    status: str  # pending, running, done, failed
+    created_at: float
+    finished_at: Optional[float] = None
+    result: Optional[QueryResponse] = None
+    error: Optional[str] = None
+    # Callback delivery: delivered, failed, or None (no callback / not attempted yet)
+    callback: Optional[str] = None
+
+
+async def _precalentar():
+    """Log in and open keep-alive connections so the first request is not slower."""
+    try:
+        await asyncio.wait_for(_sessions.get(), timeout=settings.QUICK_TIMEOUT)
+        conexiones = await calentar_conexiones()
+    except Exception as e:
+        logger.warning("Precalentamiento incompleto: %r", e)
+        return
+    _warmup.update(warm=True, connections=conexiones)
+    logger.info("Servicio precalentado (%s conexiones abiertas)", conexiones)
+
+
+@app.on_event("startup")
+async def startup():
+    global _guardado_indice
+    _sessions.start()
+    _jobs.start()
+    if _chatwoot is not None:
+        _chatwoot.start()
+    if _indice is not None:
+        _guardado_indice = asyncio.create_task(_guardar_indice_periodicamente())
+    await _precalentar()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await _jobs.stop()
+    if _chatwoot is not None:
+        await _chatwoot.stop()
+    await _sessions.stop()
+    await close_async_client()
+    if _indice is not None:
+        _guardado_indice.cancel()
+        await asyncio.to_thread(_indice.guardar_si_cambio, 0)
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    circuit = get_circuit()
+    return {
+        "status": "degraded" if circuit.abierto() else "ok",
+        "warm": _warmup["warm"],
+        "warm_connections": _warmup["connections"],
+        "circuit": circuit.stats(),
+        "session": _sessions.stats(),
+        "cache": _result_cache.stats(),
+        "inflight": _inflight.stats(),
+        "governor": get_governor().stats(),
+        "batch_governor": get_governor_lote().stats(),
+        "jobs": _jobs.stats(),
+        "chatwoot": _chatwoot.stats() if _chatwoot is not None else None,
+        "scheduler": _scheduler.stats(),
+        "dni_index": _indice.stats() if _indice is not None else None,
+    }
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    expuestas = metrics.exponer()
+    if expuestas is None:
+        raise HTTPException(status_code=503, detail="Métricas no disponibles (instalar prometheus_client)")
+    contenido, content_type = expuestas
+    return Response(content=contenido, media_type=content_type)
+
+
+def _token_valido(recibido: Optional[str], esperado: str) -> bool:
+    return bool(recibido) and secrets.compare_digest(recibido.encode(), esperado.encode())
+
+
+def _verificar_admin(token: Optional[str]):
+    """Admin endpoints exist only with ADMIN_TOKEN set and require it in X-Admin-Token."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _token_valido(token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+
+@app.get("/admin/profile")
+def admin_profile(
+    sort: Literal["cumulative", "tottime", "ncalls"] = "cumulative",
+    limit: int = Query(30, ge=1, le=200),
+    format: Literal["json", "text", "pstats"] = "json",
+    reset: bool = False,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """Aggregated cProfile stats of the sampled /query requests (hottest functions first).
+
+    format=text is the pstats report and format=pstats a .prof file for pstats/snakeviz.
+    reset=true clears the stats after reading them.
+    """
+    _verificar_admin(x_admin_token)
+    if _perfilador is None:
+        raise HTTPException(status_code=404, detail="Perfilado desactivado (PROFILE_SAMPLE_RATE=0)")
+
+    if format == "json":
+        salida = _perfilador.resumen(sort, limit)
+    else:
+        contenido = _perfilador.texto(sort, limit) if format == "text" else _perfilador.volcar()
+        if contenido is None:
+            raise HTTPException(status_code=404, detail="Todavía no hay solicitudes perfiladas")
+        if format == "text":
+            salida = PlainTextResponse(contenido)
+        else:
+            salida = Response(
+                content=contenido,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="query.prof"'},
+            )
+    if reset:
+        _perfilador.reiniciar()
+    return salida
 
 
 @app.post("/query", response_model=QueryResponse)
-def query_dni(body: DNIRequest):
+async def query_dni(body: DNIRequest, request: Request, response: Response):
     dni = body.dni.strip()
     if not dni or not dni.isdigit() or len(dni) != 8:
         raise HTTPException(status_code=400, detail="DNI inválido")
 
-    # Obtener sesión (usa cache para no login en cada request)
+    if body.async_mode or body.callback_url:
+        return _encolar(dni, body.callback_url)
+
+    # Per-phase timings for this request: Server-Timing header + one JSON log line
+    traza = trace.Traza(request.headers.get("x-request-id"))
+    estado = None
+    salida = None
+    perfil = _perfilador.iniciar() if _perfilador is not None else None
+    metrics.SOLICITUDES_EN_CURSO.inc()
     try:
-        session, id_aliado = get_session()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        with traza.activa():
+            resultado = await obtener_resultado(dni)
+            estado = resultado.etiqueta
+            salida = _responder(construir_respuesta(dni, resultado))
+            return salida
+    except HTTPException as e:
+        e.headers = {**(e.headers or {}), **_headers_traza(traza)}
+        estado = f"http_{e.status_code}"
+        raise
+    finally:
+        if perfil is not None:
+            _perfilador.terminar(perfil)
+        metrics.SOLICITUDES_EN_CURSO.dec()
+        headers = _headers_traza(traza)
+        response.headers.update(headers)
+        if isinstance(salida, Response):
+            # Returned as-is, so FastAPI does not copy the injected response's headers
+            salida.headers.update(headers)
+        traza.log(event="query", dni=dni, estado=estado)
+
+
+def _responder(campos: dict):
+    """With FAST_JSON, serialize straight to orjson bytes instead of through QueryResponse."""
+    if fastjson.activo():
+        return ORJSONResponse(campos)
+    return QueryResponse(**campos)
+
 
+def _linea_ndjson(campos: dict):
+    if fastjson.activo():
+        return fastjson.dumps(campos) + b"\n"
+    return QueryResponse(**campos).model_dump_json() + "\n"
+
+
+def _callback_permitido(url: HttpUrl) -> bool:
+    """callback_url must be http(s) to a host in CALLBACK_ALLOWED_HOSTS (no SSRF to internal hosts)."""
+    host = (url.host or "").lower().rstrip(".")
+    if url.scheme not in ("http", "https") or not host:
+        return False
+    for permitido in settings.CALLBACK_ALLOWED_HOSTS:
+        if host == permitido.lstrip(".") or (permitido.startswith(".") and host.endswith(permitido)):
+            return True
+    return False
+
+
+def _encolar(dni: str, callback_url: Optional[HttpUrl]) -> JSONResponse:
+    """Create an async job and answer 202 with its id and where to poll it."""
+    if callback_url is not None and not _callback_permitido(callback_url):
+        raise HTTPException(status_code=400, detail="callback_url no permitido (ver CALLBACK_ALLOWED_HOSTS)")
     try:
-        data, estado, mensaje_api = consultar_dni(session, dni, id_aliado)
-    except Exception as e:
-        # Invalidate cached session on unexpected errors so next request re-logins
-        _session_cache["ts"] = 0
-        raise HTTPException(status_code=500, detail=f"Error consultando DNI: {e}")
+        trabajo = _jobs.crear(dni, str(callback_url) if callback_url else None)
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=f"Cola de trabajos llena: {e}",
+                            headers={"Retry-After": "30"})
+    return JSONResponse(
+        status_code=202,
+        content=JobResponse(**trabajo.a_dict()).model_dump(),
+        headers={"Location": f"/jobs/{trabajo.id}"},
+    )
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str):
+    trabajo = _jobs.get(job_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o expirado")
+    return JobResponse(**trabajo.a_dict())
+
 
+def _headers_traza(traza: trace.Traza) -> dict:
+    return {"Server-Timing": traza.server_timing(), "X-Request-ID": traza.request_id}
+
+
+def construir_respuesta(dni: str, resultado: ConsultaResult) -> dict:
+    """Build the QueryResponse fields for a lookup result."""
     # Generar mensaje al cliente usando utilidades internas
-    estado_consulta = determinar_estado_consulta(data, estado, mensaje_api)
-    mensaje_completo, tiene_oferta = generar_mensaje_personalizado(
-        estado_consulta, data, mensaje_api
-    )
+    # All variants are rendered in one pass from precompiled templates
+    with trace.medir("render"):
+        mensaje, tiene_oferta = generar_mensajes(resultado)
 
-    # Formatear versiones alternativas del mensaje
-    # compact: eliminar saltos de línea y colapsar espacios
-    compact = " ".join(mensaje_completo.split()) if mensaje_completo else None
-    # html: reemplazar saltos de línea por <br/> (preserva texto)
-    html = mensaje_completo.replace("\n", "<br/>") if mensaje_completo else None
-
-    # Retornar un JSON conciso para n8n/Chatwoot
-    resp = QueryResponse(
-        success=(estado == "success" and data is not None),
-        dni=dni,
-        client_message=mensaje_completo,
-        # client_message_compact=compact,
-        # client_message_html=html,
-        raw_output=None,
-        error=mensaje_api if mensaje_api else None,
-        return_code=0 if estado == "success" else 1,
-        tiene_oferta=tiene_oferta,
+    # Retornar un JSON conciso para n8n/Chatwoot (every QueryResponse field, in order)
+    return {
+        "success": resultado.exito,
+        "dni": dni,
+        "client_message": mensaje.texto,
+        "client_message_compact": mensaje.compacto,
+        "client_message_html": mensaje.html,
+        "client_message_whatsapp": mensaje.whatsapp,
+        "raw_output": None,
+        "error": resultado.mensaje or None,
+        "return_code": 0 if resultado.estado is Estado.SUCCESS else 1,
+        "tiene_oferta": tiene_oferta,
+    }
+
+
+def _respuesta_error(dni: str, error: str) -> dict:
+    return QueryResponse(success=False, dni=dni, error=error, return_code=1).model_dump()
+
+
+async def _procesar_lote(dnis: List[str]):
+    """Yield one NDJSON line per DNI as soon as its lookup finishes.
+
+    At most BATCH_CONCURRENCY workers query Calidda at once, as bulk traffic that
+    yields upstream slots to interactive /query requests. Each upstream lookup first
+    takes a turn from the batch governor, paced by DELAY_MIN/DELAY_MAX like the CLI,
+    and then goes through the process-wide governor (cache hits are free). A 429 is
+    retried once after the governor's pause, and a 403 stops the remaining lookups.
+    """
+    cola = asyncio.Queue()
+    pendientes = iter(dnis)  # shared by all workers
+    lote = {"bloqueado": False}
+
+    async def procesar(dni):
+        if not dni.isdigit() or len(dni) != 8:
+            return _respuesta_error(dni, "DNI inválido")
+        if lote["bloqueado"]:
+            return _respuesta_error(dni, "Acceso bloqueado")
+
+        resultado, _ = await _result_cache.get_async(dni)
+        if resultado is None:
+            resultado = _resultado_indice(dni)
+        if resultado is not None:
+            return construir_respuesta(dni, resultado)
+
+        for intento in range(2):
+            # Before the lookup starts: a /query for this DNI is not held behind the pacing
+            await get_governor_lote().acquire_async()
+            try:
+                resultado = await _consultar_upstream(dni, MASIVA)
+            except HTTPException as e:
+                return _respuesta_error(dni, e.detail)
+
+            estado = resultado.estado
+            if estado is Estado.RATE_LIMIT and intento == 0:
+                logger.warning("RATE LIMIT en lote - reintentando tras la pausa del regulador")
+                continue
+            if estado is Estado.BLOCKED:
+                logger.error("ACCESO BLOQUEADO - deteniendo lote")
+                lote["bloqueado"] = True
+            break
+
+        return construir_respuesta(dni, resultado)
+
+    async def worker():
+        for dni in pendientes:
+            resp = await procesar(dni)
+            await cola.put(_linea_ndjson(resp))
+
+    async def todos():
+        try:
+            await asyncio.gather(*(worker() for _ in range(settings.BATCH_CONCURRENCY)))
+        finally:
+            await cola.put(None)
+
+    tarea = asyncio.create_task(todos())
+    try:
+        while True:
+            linea = await cola.get()
+            if linea is None:
+                break
+            yield linea
+    finally:
+        # Client disconnected or batch finished: stop pending lookups
+        tarea.cancel()
+
+
+def _motivo_ignorar(evento: dict) -> Optional[str]:
+    """Why a Chatwoot webhook event gets no reply, or None if it should be answered."""
+    if evento.get("event") != "message_created":
+        return "event"
+    # Our own replies also fire message_created, as outgoing messages
+    if evento.get("message_type") not in ("incoming", 0) or evento.get("private"):
+        return "not_incoming"
+    # The ids go into the reply URL: only accept Chatwoot's integer ids
+    ids = ((evento.get("conversation") or {}).get("id"), (evento.get("account") or {}).get("id"))
+    if not all(type(i) is int and i > 0 for i in ids):
+        return "no_conversation"
+    return None
+
+
+@app.post("/webhooks/chatwoot")
+async def chatwoot_webhook(request: Request, token: Optional[str] = None):
+    """Chatwoot `message_created` webhook: answer the DNI found in an incoming message.
+
+    The event is acknowledged at once; a background worker runs the lookup and posts
+    the personalized message to the conversation through the Chatwoot API.
+    """
+    if _chatwoot is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _token_valido(token, settings.CHATWOOT_WEBHOOK_TOKEN):
+        raise HTTPException(status_code=403, detail="Token de webhook inválido")
+    try:
+        evento = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if not isinstance(evento, dict):
+        raise HTTPException(status_code=400, detail="Se esperaba un objeto JSON")
+
+    motivo = _motivo_ignorar(evento)
+    dni = extraer_dni(evento.get("content")) if motivo is None else None
+    if motivo is None and dni is None:
+        motivo = "no_dni"
+    if motivo is not None:
+        return {"status": "ignored", "reason": motivo}
+
+    url = (
+        f"{settings.CHATWOOT_URL}/api/v1/accounts/{evento['account']['id']}"
+        f"/conversations/{evento['conversation']['id']}/messages"
     )
+    try:
+        trabajo = _chatwoot.crear(dni, url)
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=f"Cola de trabajos llena: {e}",
+                            headers={"Retry-After": "30"})
+    return {"status": "queued", "job_id": trabajo.id, "dni": dni}
+
 
-    return resp
+@app.post("/query/batch")
+async def query_batch(body: BatchRequest):
+    """Query several DNIs, streaming one QueryResponse per NDJSON line."""
+    dnis = list(dict.fromkeys(d.strip() for d in body.dnis))
+    return StreamingResponse(_procesar_lote(dnis), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("api_wrapper:app", host="0.0.0.0", port=5000, log_level="info")
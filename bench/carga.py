@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga del wrapper y del modo lote contra el stub local de Calidda
+
+Levanta bench/stub_calidda.py en un puerto libre, apunta BASE_URL a él (todo
+corre sin red) y mide throughput, latencia p50/p95/p99 y llamadas a Calidda
+por solicitud en uno de cuatro modos:
+
+    query     POST /query contra api_wrapper.app servido por uvicorn en un hilo
+    batch     POST /query/batch en lotes de --lote DNIs (latencia = llegada de cada línea)
+    cli       main_lote del CLI sobre un archivo temporal de DNIs
+    chatwoot  eventos message_created a POST /webhooks/chatwoot; la respuesta llega a
+              bench/stub_chatwoot.py (latencia = evento -> mensaje en la conversación)
+
+Uso:
+    python bench/carga.py query -n 2000 -c 50 --latencia lognormal:0.05,0.5
+    python bench/carga.py batch -n 1000 --lote 100 -c 4 --tasa-429 0.01
+    python bench/carga.py cli -n 200 --latencia fija:0.01
+    python bench/carga.py chatwoot -n 500 -c 20 --latencia lognormal:0.05,0.5
+
+El cliente de carga corre en el mismo proceso que el wrapper, así que el
+throughput medido es una cota inferior del de un despliegue real.
+
+Las variables de entorno ya definidas (p.ej. LOOKUP_MODE=single o
+GOVERNOR_RATE_MAX) tienen prioridad sobre los valores del benchmark.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_calidda import agregar_argumentos, stub_desde_args  # noqa: E402
+from stub_chatwoot import StubChatwoot, evento  # noqa: E402
+
+def preparar_entorno(stub, args, chatwoot=None):
+    """Configurar el servicio para hablar solo con los stubs (antes de importarlo)"""
+    os.environ['BASE_URL'] = stub.base_url
+    if chatwoot is not None:
+        os.environ['CHATWOOT_URL'] = chatwoot.base_url
+        os.environ['CHATWOOT_API_TOKEN'] = chatwoot.token
+        os.environ.setdefault('CHATWOOT_WEBHOOK_TOKEN', 'bench')
+        os.environ.setdefault('JOB_WORKERS', str(args.concurrencia))
+    defaults = {
+        'CALIDDA_USUARIO': 'bench',
+        'CALIDDA_PASSWORD': 'bench',
+        # El regulador no debe ser el cuello de botella salvo que se pida
+        'GOVERNOR_RATE_MIN': '1',
+        'GOVERNOR_RATE_INICIAL': str(args.rate),
+        'GOVERNOR_RATE_MAX': str(args.rate),
+        'GOVERNOR_BURST': str(max(args.concurrencia, 1)),
+        # Sin ritmo DELAY_* para /query/batch (regulador del tráfico masivo)
+        'DELAY_MIN': '0',
+        'DELAY_MAX': '0',
+        'HTTP_WARM_CONNECTIONS': '0',
+        'BATCH_CONCURRENCY': str(args.concurrencia),
+        'OUTPUT_DIR': tempfile.mkdtemp(prefix='bench-'),
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': '',
+    }
+    for clave, valor in defaults.items():
+        os.environ.setdefault(clave, valor)
+
+def generar_dnis(n, unicos, seed):
+    rnd = random.Random(seed)
+    pool = [f"{rnd.randrange(10_000_000, 100_000_000)}" for _ in range(unicos or n)]
+    if not unicos:
+        return pool
+    return [rnd.choice(pool) for _ in range(n)]
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+def resumen(modo, args, latencias, duracion, resultados, stub):
+    ordenadas = sorted(latencias)
+    upstream = stub.stats()
+    llamadas = upstream['consulta'] + upstream['login']
+    total = len(latencias)
+    return {
+        'modo': modo,
+        'solicitudes': total,
+        'concurrencia': args.concurrencia,
+        'duracion_s': round(duracion, 3),
+        'throughput_rps': round(total / duracion, 1) if duracion else 0.0,
+        'latencia_ms': {
+            'p50': round(percentil(ordenadas, 50) * 1000, 1),
+            'p95': round(percentil(ordenadas, 95) * 1000, 1),
+            'p99': round(percentil(ordenadas, 99) * 1000, 1),
+            'max': round(ordenadas[-1] * 1000, 1) if ordenadas else 0.0,
+        },
+        'upstream_por_solicitud': round(llamadas / total, 3) if total else 0.0,
+        'upstream': upstream,
+        'resultados': resultados,
+        'stub_seed': stub.seed,
+    }
+
+def imprimir(r):
+    lat = r['latencia_ms']
+    print(f"modo          {r['modo']}")
+    print(f"solicitudes   {r['solicitudes']} (concurrencia {r['concurrencia']})")
+    print(f"duración      {r['duracion_s']:.2f} s")
+    print(f"throughput    {r['throughput_rps']:.1f} solicitudes/s")
+    print(f"latencia      p50 {lat['p50']:.1f} ms | p95 {lat['p95']:.1f} ms | "
+          f"p99 {lat['p99']:.1f} ms | max {lat['max']:.1f} ms")
+    print(f"upstream      {r['upstream_por_solicitud']:.3f} llamadas/solicitud "
+          f"(consultas {r['upstream']['consulta']}, logins {r['upstream']['login']})")
+    print(f"status stub   {r['upstream']['por_status']}")
+    print(f"resultados    {r['resultados']}")
+
+def _contar(resultados, clave):
+    resultados[clave] = resultados.get(clave, 0) + 1
+
+@contextlib.contextmanager
+def servir_wrapper():
+    """Levantar api_wrapper.app con uvicorn en un hilo, en un puerto libre; devuelve su URL"""
+    import socket
+    import threading
+    import uvicorn
+    import api_wrapper
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    servidor = uvicorn.Server(uvicorn.Config(api_wrapper.app, log_level='warning', access_log=False))
+    hilo = threading.Thread(target=servidor.run, kwargs={'sockets': [sock]}, name='wrapper', daemon=True)
+    hilo.start()
+    while not servidor.started:
+        if not hilo.is_alive():
+            raise RuntimeError("El wrapper no pudo iniciar")
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        servidor.should_exit = True
+        hilo.join(timeout=10)
+        sock.close()
+
+def clasificar(respuesta):
+    """Categoría de una QueryResponse para el resumen"""
+    if respuesta['tiene_oferta']:
+        return 'oferta'
+    if respuesta['success']:
+        return 'sin_oferta'
+    return respuesta.get('error') or 'sin_datos'
+
+async def bench_query(args, stub, url):
+    import httpx
+
+    dnis = generar_dnis(args.solicitudes, args.unicos, args.seed)
+    latencias = []
+    resultados = {}
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limites) as client:
+
+        async def una(dni):
+            async with semaforo:
+                inicio = time.perf_counter()
+                r = await client.post('/query', json={'dni': dni})
+                latencias.append(time.perf_counter() - inicio)
+            _contar(resultados, clasificar(r.json()) if r.status_code == 200 else f"http_{r.status_code}")
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(una(d) for d in dnis))
+        duracion = time.perf_counter() - inicio
+
+    return resumen('query', args, latencias, duracion, resultados, stub)
+
+async def bench_batch(args, stub, url):
+    import httpx
+
+    dnis = generar_dnis(args.solicitudes, args.unicos, args.seed)
+    lotes = [dnis[i:i + args.lote] for i in range(0, len(dnis), args.lote)]
+    latencias = []
+    resultados = {}
+    semaforo = asyncio.Semaphore(args.concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+
+        async def un_lote(lote):
+            async with semaforo:
+                inicio = time.perf_counter()
+                async with client.stream('POST', '/query/batch', json={'dnis': lote}) as r:
+                    # Una línea NDJSON por DNI distinto del lote, en orden de llegada
+                    async for linea in r.aiter_lines():
+                        if linea:
+                            latencias.append(time.perf_counter() - inicio)
+                            _contar(resultados, clasificar(json.loads(linea)))
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(un_lote(l) for l in lotes))
+        duracion = time.perf_counter() - inicio
+
+    return resumen('batch', args, latencias, duracion, resultados, stub)
+
+async def bench_chatwoot(args, stub, url, chatwoot):
+    import httpx
+
+    dnis = generar_dnis(args.solicitudes, args.unicos, args.seed)
+    enviados = {}  # conversación -> hora de envío del evento
+    resultados = {}
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    webhook = f"/webhooks/chatwoot?token={os.environ['CHATWOOT_WEBHOOK_TOKEN']}"
+
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+
+        async def un_evento(conversacion, dni):
+            async with semaforo:
+                enviados[conversacion] = time.time()
+                r = await client.post(webhook, json=evento(f"Hola, mi DNI es {dni}", conversacion))
+            if r.status_code != 200 or r.json()['status'] != 'queued':
+                _contar(resultados, f"ack_{r.status_code}")
+                enviados.pop(conversacion)
+
+        chatwoot.reset()
+        inicio = time.perf_counter()
+        await asyncio.gather(*(un_evento(i + 1, d) for i, d in enumerate(dnis)))
+        mensajes = await asyncio.to_thread(chatwoot.esperar, len(enviados), 120)
+        duracion = time.perf_counter() - inicio
+
+    latencias = []
+    for mensaje in mensajes:
+        latencias.append(mensaje['recibido'] - enviados[mensaje['conversation_id']])
+        # Primera línea de la plantilla: oferta, sin crédito / no califica o error
+        _contar(resultados, mensaje['content'].splitlines()[0])
+    if len(mensajes) < len(enviados):
+        resultados['sin_respuesta'] = len(enviados) - len(mensajes)
+    return resumen('chatwoot', args, latencias, duracion, resultados, stub)
+
+def bench_cli(args, stub):
+    from src.main import main_lote
+
+    dnis = generar_dnis(args.solicitudes, args.unicos, args.seed)
+    salida = os.environ['OUTPUT_DIR']
+    ruta = os.path.join(salida, 'dnis.txt')
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(dnis) + '\n')
+
+    stub.reset()
+    inicio_epoch = time.time()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        main_lote(ruta, desde_cero=True)
+    duracion = time.perf_counter() - inicio
+
+    # Latencia por DNI: diferencia entre registros consecutivos de resultados.jsonl
+    latencias = []
+    resultados = {}
+    anterior = inicio_epoch
+    with open(os.path.join(salida, 'resultados.jsonl'), encoding='utf-8') as f:
+        for linea in f:
+            registro = json.loads(linea)
+            latencias.append(registro['ts'] - anterior)
+            anterior = registro['ts']
+            _contar(resultados, registro.get('estado_consulta') or registro['estado'])
+
+    return resumen('cli', args, latencias, duracion, resultados, stub)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('modo', choices=('query', 'batch', 'cli', 'chatwoot'))
+    parser.add_argument('-n', '--solicitudes', type=int, default=500, help="DNIs a consultar")
+    parser.add_argument('-c', '--concurrencia', type=int, default=20,
+                        help="Solicitudes (o lotes) simultáneos; en modo batch también BATCH_CONCURRENCY")
+    parser.add_argument('--unicos', type=int, default=0,
+                        help="Tamaño del pool de DNIs (0 = todos distintos; menor = repetidos/cache)")
+    parser.add_argument('--lote', type=int, default=100, help="DNIs por POST /query/batch")
+    parser.add_argument('--rate', type=float, default=1000, help="Tasa máxima del regulador (llamadas/s)")
+    parser.add_argument('--json', action='store_true', help="Imprimir el resultado como JSON")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+    if args.seed is None:
+        args.seed = random.randrange(1 << 30)
+
+    stub = stub_desde_args(args).start()
+    chatwoot = StubChatwoot(port=0).start() if args.modo == 'chatwoot' else None
+    preparar_entorno(stub, args, chatwoot)
+    try:
+        if args.modo == 'cli':
+            resultado = bench_cli(args, stub)
+        else:
+            with servir_wrapper() as url:
+                stub.reset()  # no contar el login del arranque
+                if args.modo == 'chatwoot':
+                    resultado = asyncio.run(bench_chatwoot(args, stub, url, chatwoot))
+                else:
+                    bench = bench_query if args.modo == 'query' else bench_batch
+                    resultado = asyncio.run(bench(args, stub, url))
+    finally:
+        stub.stop()
+        if chatwoot is not None:
+            chatwoot.stop()
+
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    else:
+        imprimir(resultado)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark del tiempo de importación (arranque en frío) de los módulos del proyecto
+
+Cada import se mide en un proceso nuevo, varias veces, y se reporta la mediana.
+
+Uso:
+    python bench/import_time.py [--repeticiones 7] [modulo ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULOS = [
+    'src.config',
+    'src.utils.messages',
+    'src.api.client',
+    'src.api.session',
+    'api_wrapper',
+]
+
+CODIGO = (
+    "import time; t = time.perf_counter(); import {modulo}; "
+    "print(time.perf_counter() - t)"
+)
+
+def medir(modulo, repeticiones):
+    """Mediana (en ms) del tiempo de importar modulo en un intérprete nuevo"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([str(ROOT), str(ROOT / 'src')])
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, '-c', CODIGO.format(modulo=modulo)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if salida.returncode != 0:
+            error = salida.stderr.strip().splitlines()[-1] if salida.stderr else 'error'
+            return None, error
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(tiempos), None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('modulos', nargs='*', default=MODULOS)
+    parser.add_argument('--repeticiones', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'módulo':<24} {'mediana (ms)':>12}")
+    print('-' * 37)
+    for modulo in args.modulos:
+        ms, error = medir(modulo, args.repeticiones)
+        if error:
+            print(f"{modulo:<24} {'falla':>12}  ({error})")
+        else:
+            print(f"{modulo:<24} {ms:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del camino JSON: json/pydantic (actual) contra orjson (FAST_JSON)
+
+Mide tiempo de CPU por operación (time.process_time) en tres etapas:
+
+    parse       cuerpo de consulta de Calidda -> dict (response.json() contra
+                orjson reducido a los campos usados)
+    respuesta   campos de QueryResponse -> bytes JSON (modelo pydantic validado y
+                json.dumps, como hace FastAPI, contra orjson.dumps del dict)
+    endpoint    POST /query completo vía ASGI con el resultado en cache (sin red)
+
+Uso:
+    python bench/json_path.py                 # cuerpo sintético
+    python bench/json_path.py --cuerpo respuesta_real.json -n 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+def cuerpo_sintetico():
+    """Respuesta de consulta con los campos usados y el resto de datos del cliente"""
+    return {
+        'valid': True,
+        'message': '',
+        'data': {
+            'id': 1234567,
+            'nombre': 'JUAN CARLOS',
+            'apellidoPaterno': 'PEREZ',
+            'apellidoMaterno': 'GARCIA',
+            'tieneLineaCredito': True,
+            'lineaCredito': 3500.0,
+            'lineaCreditoDisponible': 2875.5,
+            'direccion': 'AV. LOS INCAS 1234 DPTO 502 URB. SANTA ROSA',
+            'ubigeo': '150132',
+            'distrito': 'SAN JUAN DE LURIGANCHO',
+            'telefono': '987654321',
+            'correo': 'cliente@example.com',
+            'numeroSuministro': '4455667788',
+            'fechaRegistro': '2019-03-14T10:22:31',
+            'segmento': 'RESIDENCIAL',
+            'estrato': 'C',
+            'cuotas': [{'plazo': p, 'tasa': 0.0299, 'cuota': round(3500 / p, 2)} for p in (3, 6, 12, 18, 24)],
+            'historial': [
+                {'periodo': f'2024-{m:02d}', 'consumo': 12.5 + m, 'pagado': True, 'monto': 45.3 + m}
+                for m in range(1, 13)
+            ],
+        },
+    }
+
+def medir(fn, n):
+    """Microsegundos de CPU por llamada (mediana de 5 rondas de n llamadas)"""
+    rondas = []
+    for _ in range(5):
+        inicio = time.process_time()
+        for _ in range(n):
+            fn()
+        rondas.append((time.process_time() - inicio) / n * 1e6)
+    return statistics.median(rondas)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cuerpo', help="Archivo JSON con una respuesta real de la consulta")
+    parser.add_argument('-n', type=int, default=5000, help="Iteraciones por ronda")
+    args = parser.parse_args()
+
+    os.environ.setdefault('CALIDDA_USUARIO', 'bench')
+    os.environ.setdefault('CALIDDA_PASSWORD', 'bench')
+    os.environ.setdefault('BASE_URL', 'http://127.0.0.1:9')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('LOG_FILE', '')
+
+    import httpx
+    import orjson
+    from pydantic import TypeAdapter
+    from src.api.resultado import Cliente, ConsultaResult, Estado
+    from src.utils import fastjson
+
+    cuerpo = Path(args.cuerpo).read_bytes() if args.cuerpo else json.dumps(cuerpo_sintetico()).encode()
+    respuesta = httpx.Response(200, content=cuerpo, headers={'content-type': 'application/json'})
+
+    import api_wrapper
+    dni = '12345678'
+    resultado = ConsultaResult(Estado.SUCCESS, cliente=Cliente.desde_api(fastjson.cargar_consulta(cuerpo)['data']))
+    campos = api_wrapper.construir_respuesta(dni, resultado)
+    modelo = TypeAdapter(api_wrapper.QueryResponse)
+
+    def respuesta_pydantic():
+        validada = modelo.validate_python(api_wrapper.QueryResponse(**campos))
+        json.dumps(modelo.dump_python(validada, mode='json'), ensure_ascii=False,
+                   allow_nan=False, separators=(',', ':')).encode()
+
+    etapas = [
+        ('parse', lambda: respuesta.json(), lambda: fastjson.cargar_consulta(respuesta.content)),
+        ('respuesta', respuesta_pydantic, lambda: orjson.dumps(campos)),
+    ]
+
+    # Endpoint completo: el resultado ya está en cache, así que no hay llamadas a Calidda
+    api_wrapper._result_cache.put(dni, resultado)
+    transport = httpx.ASGITransport(app=api_wrapper.app)
+
+    def endpoint(rapido):
+        async def correr(n):
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                for _ in range(n):
+                    r = await client.post('/query', json={'dni': dni})
+                    assert r.status_code == 200
+        api_wrapper.fastjson.activo = lambda: rapido
+        rondas = []
+        for _ in range(5):
+            inicio = time.process_time()
+            asyncio.run(correr(args.n // 10))
+            rondas.append((time.process_time() - inicio) / (args.n // 10) * 1e6)
+        return statistics.median(rondas)
+
+    print(f"Cuerpo: {len(cuerpo)} bytes ({'archivo' if args.cuerpo else 'sintético'}), n={args.n}")
+    print(f"{'etapa':<12}{'json/pydantic':>16}{'orjson':>12}{'ahorro':>10}")
+    for nombre, actual, rapido in etapas:
+        a, r = medir(actual, args.n), medir(rapido, args.n)
+        print(f"{nombre:<12}{a:>13.1f} µs{r:>9.1f} µs{(1 - r / a) * 100:>9.0f}%")
+    activo = fastjson.activo
+    a, r = endpoint(False), endpoint(True)
+    fastjson.activo = activo
+    print(f"{'endpoint':<12}{a:>13.1f} µs{r:>9.1f} µs{(1 - r / a) * 100:>9.0f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la API de Calidda (login y consulta de línea de crédito)
+
+Emite JWT con 'exp', valida el Bearer de cada consulta y permite configurar la
+distribución de latencia, la proporción de DNIs no encontrados / sin crédito y
+la inyección de respuestas 401, 429 y 403. Sirve para correr el wrapper, el
+CLI y bench/carga.py sin red apuntando BASE_URL a este servidor.
+
+Uso:
+    python bench/stub_calidda.py --port 8765 --latencia lognormal:0.3,0.5 --tasa-429 0.01
+    BASE_URL=http://127.0.0.1:8765 python api_wrapper.py
+
+Endpoints auxiliares: GET /__stats (contadores) y POST /__reset.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+
+LOGIN_PATH = '/FNB_Services/api/Seguridad/autenticar'
+CONSULTA_PATH = '/FNB_Services/api/financiamiento/lineaCredito'
+SECRETO = 'stub-calidda'
+
+def parse_latencia(spec):
+    """
+    Crear un generador de latencias (segundos) a partir de una especificación:
+
+        fija:0.2            siempre 0.2 s
+        uniforme:0.1,0.5    uniforme entre 0.1 y 0.5 s
+        exponencial:0.3     exponencial con media 0.3 s
+        lognormal:0.3,0.5   lognormal con mediana 0.3 s y sigma 0.5
+    """
+    tipo, _, args = spec.partition(':')
+    valores = [float(v) for v in args.split(',')] if args else []
+    if tipo == 'fija':
+        return lambda rnd: valores[0]
+    if tipo == 'uniforme':
+        return lambda rnd: rnd.uniform(valores[0], valores[1])
+    if tipo == 'exponencial':
+        return lambda rnd: rnd.expovariate(1 / valores[0])
+    if tipo == 'lognormal':
+        import math
+        mu = math.log(valores[0])
+        return lambda rnd: rnd.lognormvariate(mu, valores[1])
+    raise ValueError(f"Distribución de latencia desconocida: {spec!r}")
+
+class StubCalidda:
+    """Servidor stub en un hilo, con su configuración y contadores"""
+
+    def __init__(self, host='127.0.0.1', port=8765, latencia='fija:0', latencia_login='fija:0',
+                 no_encontrado=0.2, sin_credito=0.3, tasa_401=0.0, tasa_429=0.0, tasa_403=0.0,
+                 retry_after=1, token_ttl=3600, seed=None):
+        self.host = host
+        self.port = port
+        self.latencia = parse_latencia(latencia)
+        self.latencia_login = parse_latencia(latencia_login)
+        self.no_encontrado = no_encontrado
+        self.sin_credito = sin_credito
+        self.tasa_401 = tasa_401
+        self.tasa_429 = tasa_429
+        self.tasa_403 = tasa_403
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.seed = seed if seed is not None else random.randrange(1 << 30)
+        self._rnd = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.reset()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def reset(self):
+        with self._lock:
+            self.contadores = {'login': 0, 'consulta': 0}
+            self.por_status = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'login': self.contadores['login'],
+                'consulta': self.contadores['consulta'],
+                'por_status': dict(self.por_status),
+            }
+
+    def _contar(self, endpoint, status):
+        with self._lock:
+            self.contadores[endpoint] += 1
+            self.por_status[status] = self.por_status.get(status, 0) + 1
+
+    def _aleatorio(self):
+        with self._lock:
+            return self._rnd.random()
+
+    def _esperar(self, generador):
+        with self._lock:
+            segundos = generador(self._rnd)
+        if segundos > 0:
+            time.sleep(segundos)
+
+    def _perfil(self, dni):
+        """Resultado estable por DNI: 'no_encontrado', 'sin_credito' u 'oferta'"""
+        r = random.Random(f"{self.seed}:{dni}").random()
+        if r < self.no_encontrado:
+            return 'no_encontrado'
+        if r < self.no_encontrado + self.sin_credito:
+            return 'sin_credito'
+        return 'oferta'
+
+    def emitir_token(self):
+        ahora = int(time.time())
+        return jwt.encode(
+            {'id': 1, 'commercialAllyId': 77, 'iat': ahora, 'exp': ahora + self.token_ttl,
+             'jti': uuid.uuid4().hex},
+            SECRETO, algorithm='HS256',
+        )
+
+    def token_valido(self, authorization):
+        if not authorization.startswith('Bearer '):
+            return False
+        try:
+            jwt.decode(authorization[7:], SECRETO, algorithms=['HS256'])
+        except jwt.PyJWTError:
+            return False
+        return True
+
+    def login(self, body):
+        self._esperar(self.latencia_login)
+        if self._aleatorio() < self.tasa_403:
+            return 403, {'valid': False, 'message': 'Acceso bloqueado'}, {}
+        if not body.get('usuario') or not body.get('password'):
+            return 200, {'valid': False, 'message': 'Credenciales inválidas'}, {}
+        return 200, {'valid': True, 'data': {'authToken': self.emitir_token()}}, {}
+
+    def consulta(self, dni, authorization):
+        self._esperar(self.latencia)
+        if not self.token_valido(authorization):
+            return 401, {'message': 'Token inválido o expirado'}, {}
+        r = self._aleatorio()
+        if r < self.tasa_401:
+            return 401, {'message': 'Token inválido o expirado'}, {}
+        r -= self.tasa_401
+        if r < self.tasa_429:
+            return 429, {'message': 'Too Many Requests'}, {'Retry-After': str(self.retry_after)}
+        r -= self.tasa_429
+        if r < self.tasa_403:
+            return 403, {'message': 'Forbidden'}, {'Retry-After': str(self.retry_after)}
+
+        perfil = self._perfil(dni)
+        if perfil == 'no_encontrado':
+            return 200, {'valid': False, 'message': 'Cliente no encontrado'}, {}
+        datos = {
+            'id': int(dni) % 100000,
+            'nombre': 'CLIENTE',
+            'tieneLineaCredito': perfil == 'oferta',
+            'lineaCredito': 1500.0 if perfil == 'oferta' else 0,
+        }
+        return 200, {'valid': True, 'data': datos}, {}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, cuerpo, headers=None):
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                for clave, valor in (headers or {}).items():
+                    self.send_header(clave, valor)
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _leer_json(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                crudo = self.rfile.read(largo) if largo else b''
+                try:
+                    return json.loads(crudo or b'{}')
+                except ValueError:
+                    return {}
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                ruta = urlparse(self.path).path
+                if ruta == LOGIN_PATH:
+                    status, cuerpo, headers = stub.login(self._leer_json())
+                    stub._contar('login', status)
+                    return self._responder(status, cuerpo, headers)
+                if ruta == '/__reset':
+                    self._leer_json()
+                    stub.reset()
+                    return self._responder(200, {'ok': True})
+                self._responder(404, {'message': 'No encontrado'})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == CONSULTA_PATH:
+                    dni = parse_qs(url.query).get('numeroDocumento', [''])[0]
+                    status, cuerpo, headers = stub.consulta(dni, self.headers.get('authorization', ''))
+                    stub._contar('consulta', status)
+                    return self._responder(status, cuerpo, headers)
+                if url.path == '/__stats':
+                    return self._responder(200, stub.stats())
+                self._responder(404, {'message': 'No encontrado'})
+
+        return Handler
+
+    def start(self):
+        """Iniciar el servidor en un hilo daemon"""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='stub-calidda', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def agregar_argumentos(parser):
+    """Opciones del stub, compartidas con bench/carga.py"""
+    grupo = parser.add_argument_group('stub de Calidda')
+    grupo.add_argument('--latencia', default='fija:0', help="Latencia de la consulta (fija:S, uniforme:A,B, exponencial:MEDIA, lognormal:MEDIANA,SIGMA)")
+    grupo.add_argument('--latencia-login', default='fija:0', help="Latencia del login (mismo formato)")
+    grupo.add_argument('--no-encontrado', type=float, default=0.2, help="Proporción de DNIs no encontrados")
+    grupo.add_argument('--sin-credito', type=float, default=0.3, help="Proporción de DNIs sin línea de crédito")
+    grupo.add_argument('--tasa-401', type=float, default=0.0, help="Probabilidad de responder 401 a una consulta")
+    grupo.add_argument('--tasa-429', type=float, default=0.0, help="Probabilidad de responder 429")
+    grupo.add_argument('--tasa-403', type=float, default=0.0, help="Probabilidad de responder 403 (consulta y login)")
+    grupo.add_argument('--retry-after', type=int, default=1, help="Valor de Retry-After en 429/403")
+    grupo.add_argument('--token-ttl', type=int, default=3600, help="Vida de los JWT emitidos (segundos)")
+    grupo.add_argument('--seed', type=int, default=None, help="Semilla para resultados reproducibles")
+    return parser
+
+def stub_desde_args(args, port=0):
+    return StubCalidda(
+        port=port, latencia=args.latencia, latencia_login=args.latencia_login,
+        no_encontrado=args.no_encontrado, sin_credito=args.sin_credito,
+        tasa_401=args.tasa_401, tasa_429=args.tasa_429, tasa_403=args.tasa_403,
+        retry_after=args.retry_after, token_ttl=args.token_ttl, seed=args.seed,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    stub = stub_desde_args(args, port=args.port).start()
+    print(f"Stub de Calidda en {stub.base_url} (seed {stub.seed}) - Ctrl+C para salir")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == '__main__':
+    main()
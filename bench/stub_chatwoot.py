@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la API de mensajes de Chatwoot
+
+Acepta POST /api/v1/accounts/<cuenta>/conversations/<conversación>/messages
+con el header api_access_token, guarda cada mensaje con su hora de llegada y
+responde como Chatwoot. Sirve para probar POST /webhooks/chatwoot del wrapper
+sin un Chatwoot real; evento() arma el payload message_created que Chatwoot
+envía al webhook.
+
+Uso:
+    python bench/stub_chatwoot.py --port 8766 --token secreto
+    CHATWOOT_URL=http://127.0.0.1:8766 CHATWOOT_API_TOKEN=secreto CHATWOOT_WEBHOOK_TOKEN=wh python api_wrapper.py
+
+Endpoints auxiliares: GET /__mensajes (mensajes recibidos) y POST /__reset.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from stub_calidda import parse_latencia
+
+_MENSAJES = re.compile(r'^/api/v1/accounts/(\d+)/conversations/(\d+)/messages$')
+
+def evento(contenido, conversacion, cuenta=1, tipo='incoming', privado=False):
+    """Payload de un webhook message_created de Chatwoot (campos que usa el wrapper y algunos más)"""
+    return {
+        'event': 'message_created',
+        'id': conversacion * 1000,
+        'content': contenido,
+        'content_type': 'text',
+        'message_type': tipo,
+        'private': privado,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+        'account': {'id': cuenta, 'name': 'Calidda FNB'},
+        'conversation': {'id': conversacion, 'display_id': conversacion, 'inbox_id': 1, 'status': 'open'},
+        'inbox': {'id': 1, 'name': 'WhatsApp'},
+        'sender': {'id': 10, 'name': 'Cliente', 'type': 'contact'},
+    }
+
+class StubChatwoot:
+    """Servidor stub en un hilo que registra los mensajes enviados a cada conversación"""
+
+    def __init__(self, host='127.0.0.1', port=8766, token='stub-chatwoot', latencia='fija:0'):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.latencia = parse_latencia(latencia)
+        self._rnd = random.Random()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._server = None
+        self.reset()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def reset(self):
+        with self._cond:
+            self.mensajes = []
+            self.rechazados = 0
+
+    def esperar(self, n, timeout=30):
+        """Esperar a que lleguen al menos n mensajes; retorna los recibidos"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.mensajes) >= n, timeout)
+            return list(self.mensajes)
+
+    def recibir(self, cuenta, conversacion, token, cuerpo):
+        with self._cond:
+            segundos = self.latencia(self._rnd)
+        if segundos > 0:
+            time.sleep(segundos)
+        if token != self.token:
+            with self._cond:
+                self.rechazados += 1
+            return 401, {'error': 'You need to sign in or sign up before continuing.'}
+        mensaje = {
+            'id': next(self._ids),
+            'account_id': cuenta,
+            'conversation_id': conversacion,
+            'content': cuerpo.get('content'),
+            'message_type': cuerpo.get('message_type'),
+            'private': bool(cuerpo.get('private')),
+            'recibido': time.time(),
+        }
+        with self._cond:
+            self.mensajes.append(mensaje)
+            self._cond.notify_all()
+        return 200, mensaje
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, cuerpo):
+                datos = json.dumps(cuerpo, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _leer_json(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                crudo = self.rfile.read(largo) if largo else b''
+                try:
+                    return json.loads(crudo or b'{}')
+                except ValueError:
+                    return {}
+
+            def do_POST(self):
+                ruta = urlparse(self.path).path
+                encontrado = _MENSAJES.match(ruta)
+                if encontrado:
+                    status, cuerpo = stub.recibir(
+                        int(encontrado.group(1)), int(encontrado.group(2)),
+                        self.headers.get('api_access_token'), self._leer_json(),
+                    )
+                    return self._responder(status, cuerpo)
+                self._leer_json()
+                if ruta == '/__reset':
+                    stub.reset()
+                    return self._responder(200, {'ok': True})
+                self._responder(404, {'error': 'Not Found'})
+
+            def do_GET(self):
+                if urlparse(self.path).path == '/__mensajes':
+                    with stub._cond:
+                        return self._responder(200, {'mensajes': stub.mensajes, 'rechazados': stub.rechazados})
+                self._responder(404, {'error': 'Not Found'})
+
+        return Handler
+
+    def start(self):
+        """Iniciar el servidor en un hilo daemon"""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='stub-chatwoot', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--token', default='stub-chatwoot', help="api_access_token aceptado")
+    parser.add_argument('--latencia', default='fija:0', help="Latencia de cada POST (mismo formato que stub_calidda)")
+    args = parser.parse_args()
+
+    stub = StubChatwoot(port=args.port, token=args.token, latencia=args.latencia).start()
+    print(f"Stub de Chatwoot en {stub.base_url} (token {stub.token!r}) - Ctrl+C para salir")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == '__main__':
+    main()
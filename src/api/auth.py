@@ -2,76 +2,209 @@
 Funciones de autenticación con la API de Calidda
 """
 
-import jwt
-import requests
+import asyncio
 import logging
+import time
 
-from src.config import (
-    USUARIO, PASSWORD, LOGIN_API, TIMEOUT
-)
+from src.config import get_settings
+from src.api import metrics
+from src.utils import trace
+from src.api.transport import crear_sesion, get_async_client, REFERER_LOGIN, REFERER_CONSULTA
+from src.api.governor import get_governor
+from src.api.circuit import get_circuit
+from src.api.resultado import ConsultaResult, Estado
 
 logger = logging.getLogger(__name__)
 
-def login():
-    """Login a la API de Calidda"""
-    http_session = requests.Session()
-    
-    http_session.headers.update({
-        'accept': 'application/json, text/plain, */*',
-        'accept-language': 'es-419,es;q=0.9',
-        'content-type': 'application/json',
-        'origin': 'https://appweb.calidda.com.pe',
-        'referer': 'https://appweb.calidda.com.pe/WebFNB/login',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    })
-    
-    logger.info("Iniciando sesión...")
-    
-    payload = {
-        "usuario": USUARIO,
-        "password": PASSWORD,
+def _payload_login():
+    s = get_settings()
+    return {
+        "usuario": s.USUARIO,
+        "password": s.PASSWORD,
         "captcha": "exitoso",
         "Latitud": "",
         "Longitud": ""
     }
+
+def _extraer_token(data):
+    """
+    Validar la respuesta de login y decodificar el token
+
+    Returns:
+        Dict con token, id_aliado, user_id y exp (epoch, o None si el token
+        no lo trae), o None si el login no es válido
+    """
+    if not data.get('valid'):
+        logger.error("Login inválido: %s", data.get('message'))
+        return None
+    
+    auth_data = data.get('data', {})
+    token = auth_data.get('authToken')
+    
+    if not token:
+        logger.error("No se encontró authToken en respuesta")
+        return None
+    
+    # Decodificar token
+    import jwt
+    decoded = jwt.decode(token, options={"verify_signature": False})
+    
+    id_aliado = decoded.get('commercialAllyId')
+    user_id = decoded.get('id')
+    
+    logger.info("Login exitoso - User ID: %s, ID Aliado: %s", user_id, id_aliado)
+    return {
+        'token': token,
+        'id_aliado': id_aliado,
+        'user_id': user_id,
+        'exp': decoded.get('exp'),
+    }
+
+def _headers_autenticados(token):
+    return {
+        'authorization': f'Bearer {token}',
+        'referer': REFERER_CONSULTA
+    }
+
+def _resultado_login(status_code):
+    """ConsultaResult de una respuesta de login para el circuit breaker"""
+    if status_code == 403 or status_code >= 500:
+        return ConsultaResult.desde_status(status_code)
+    return ConsultaResult(Estado.SUCCESS)
+
+def sesion_desde_token(token_info):
+    """Crear una requests.Session autenticada con un token ya obtenido (sin login)"""
+    http_session = crear_sesion()
+    http_session.headers.update(_headers_autenticados(token_info['token']))
+    return http_session
+
+def cliente_desde_token(token_info):
+    """Autenticar el cliente httpx compartido con un token ya obtenido (sin login)"""
+    client = get_async_client()
+    client.headers.update(_headers_autenticados(token_info['token']))
+    return client
+
+def autenticar():
+    """
+    Login a la API de Calidda conservando los datos del token
+
+    Returns:
+        Tupla (session, token_info) o (None, None) si falla.
+        token_info es el dict de _extraer_token.
+    """
+    circuit = get_circuit()
+    governor = get_governor()
+    if not circuit.permitir():
+        logger.error("Circuito abierto: login omitido")
+        return None, None
+    
+    http_session = crear_sesion()
+    
+    logger.info("Iniciando sesión...")
     
+    registrado = False
     try:
-        response = http_session.post(LOGIN_API, json=payload, timeout=TIMEOUT)
+        # El login no consume turnos de consulta, pero respeta la pausa tras un 429/403
+        governor.esperar_pausa()
+        s = get_settings()
+        metrics.UPSTREAM_EN_CURSO.inc()
+        inicio = time.perf_counter()
+        try:
+            response = http_session.post(s.LOGIN_API, json=_payload_login(), timeout=s.TIMEOUT)
+        finally:
+            duracion = time.perf_counter() - inicio
+            metrics.observar_latencia('login', duracion)
+            trace.registrar('login', duracion)
+            metrics.UPSTREAM_EN_CURSO.dec()
+        governor.registrar(response.status_code, response.headers.get('Retry-After'))
+        circuit.registrar(_resultado_login(response.status_code))
+        registrado = True
         
         if response.status_code == 200:
-            data = response.json()
-            
-            if not data.get('valid'):
-                logger.error(f"Login inválido: {data.get('message')}")
-                return None, None
-            
-            auth_data = data.get('data', {})
-            token = auth_data.get('authToken')
-            
-            if not token:
-                logger.error("No se encontró authToken en respuesta")
+            token_info = _extraer_token(response.json())
+            if not token_info:
+                http_session.close()
                 return None, None
             
-            # Decodificar token
-            decoded = jwt.decode(token, options={"verify_signature": False})
+            # Configurar headers
+            http_session.headers.update(_headers_autenticados(token_info['token']))
             
-            id_aliado = decoded.get('commercialAllyId')
-            user_id = decoded.get('id')
+            return http_session, token_info
+        
+        else:
+            logger.error("Error en login: Status %s", response.status_code)
+            http_session.close()
+            return None, None
             
-            logger.info(f"Login exitoso - User ID: {user_id}, ID Aliado: {id_aliado}")
+    except Exception as e:
+        logger.error("Error en login: %s", e)
+        if not registrado:
+            circuit.registrar(ConsultaResult(Estado.EXCEPTION, str(e)))
+        http_session.close()
+        return None, None
+
+async def autenticar_async():
+    """
+    Login asíncrono a la API de Calidda.
+
+    Usa el cliente httpx compartido del proceso; tras un login exitoso el
+    token queda en los headers de ese cliente.
+
+    Returns:
+        Tupla (client, token_info) o (None, None) si falla
+    """
+    circuit = get_circuit()
+    governor = get_governor()
+    if not circuit.permitir():
+        logger.error("Circuito abierto: login omitido")
+        return None, None
+    
+    client = get_async_client()
+    
+    logger.info("Iniciando sesión (async)...")
+    
+    registrado = False
+    try:
+        await governor.esperar_pausa_async()
+        s = get_settings()
+        metrics.UPSTREAM_EN_CURSO.inc()
+        inicio = time.perf_counter()
+        try:
+            response = await client.post(
+                s.LOGIN_API,
+                json=_payload_login(),
+                headers={'referer': REFERER_LOGIN},
+                timeout=s.TIMEOUT,
+            )
+        finally:
+            duracion = time.perf_counter() - inicio
+            metrics.observar_latencia('login', duracion)
+            trace.registrar('login', duracion)
+            metrics.UPSTREAM_EN_CURSO.dec()
+        governor.registrar(response.status_code, response.headers.get('Retry-After'))
+        circuit.registrar(_resultado_login(response.status_code))
+        registrado = True
+        
+        if response.status_code == 200:
+            token_info = _extraer_token(response.json())
+            if not token_info:
+                return None, None
             
-            # Configurar headers
-            http_session.headers.update({
-                'authorization': f'Bearer {token}',
-                'referer': 'https://appweb.calidda.com.pe/WebFNB/consulta-credito'
-            })
+            client.headers.update(_headers_autenticados(token_info['token']))
             
-            return http_session, id_aliado
+            return client, token_info
         
         else:
-            logger.error(f"Error en login: Status {response.status_code}")
+            logger.error("Error en login: Status %s", response.status_code)
             return None, None
             
+    except asyncio.CancelledError:
+        # Sin resultado: no dejar ocupada una prueba del half-open
+        if not registrado:
+            circuit.liberar()
+        raise
     except Exception as e:
-        logger.error(f"Error en login: {e}")
-        return None, None
\ No newline at end of file
+        logger.error("Error en login: %s", e)
+        if not registrado:
+            circuit.registrar(ConsultaResult(Estado.EXCEPTION, str(e)))
+        return None, None
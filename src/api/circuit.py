@@ -0,0 +1,144 @@
+"""
+Circuit breaker para la API de Calidda
+
+Tras CIRCUIT_FAILURE_THRESHOLD fallas seguidas (timeouts, errores 5xx,
+excepciones de red o 403 'blocked') el circuito se abre y las llamadas fallan
+de inmediato durante CIRCUIT_OPEN_SECONDS. Luego pasa a half-open y deja salir
+hasta CIRCUIT_HALF_OPEN_PROBES llamadas de prueba: si una tiene éxito se
+cierra, si falla vuelve a abrirse.
+"""
+
+import logging
+import threading
+import time
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CERRADO = 'closed'
+ABIERTO = 'open'
+SEMIABIERTO = 'half_open'
+
+class CircuitBreaker:
+    """Circuit breaker compartido por hilos y corutinas"""
+
+    def __init__(self, umbral, segundos_abierto, pruebas):
+        self.umbral = umbral
+        self.segundos_abierto = segundos_abierto
+        self.pruebas = pruebas
+        self._lock = threading.Lock()
+        self.estado = CERRADO
+        self.fallas_seguidas = 0
+        self._abierto_hasta = 0.0
+        self._pruebas_en_curso = 0
+        self.aperturas = 0
+        self.rechazadas = 0
+        self.ultima_falla = None
+
+    def permitir(self):
+        """
+        Indicar si se puede llamar al upstream
+
+        Si retorna True el llamador debe informar el resultado con registrar(),
+        o llamar a liberar() si la llamada no llegó a tener resultado.
+        """
+        with self._lock:
+            if self.estado == ABIERTO:
+                if time.monotonic() < self._abierto_hasta:
+                    self.rechazadas += 1
+                    return False
+                self.estado = SEMIABIERTO
+                self._pruebas_en_curso = 0
+                logger.info("Circuito half-open: enviando llamadas de prueba")
+
+            if self.estado == SEMIABIERTO:
+                if self._pruebas_en_curso >= self.pruebas:
+                    self.rechazadas += 1
+                    return False
+                self._pruebas_en_curso += 1
+            return True
+
+    def registrar(self, resultado):
+        """Informar el resultado (ConsultaResult) de una llamada permitida"""
+        with self._lock:
+            if self.estado == SEMIABIERTO:
+                self._pruebas_en_curso = max(self._pruebas_en_curso - 1, 0)
+
+            if not resultado.es_falla:
+                if self.estado != CERRADO:
+                    logger.info("Circuito cerrado: la API respondió correctamente")
+                self.estado = CERRADO
+                self.fallas_seguidas = 0
+                return
+
+            self.fallas_seguidas += 1
+            self.ultima_falla = resultado.etiqueta
+            if self.estado == SEMIABIERTO or self.fallas_seguidas >= self.umbral:
+                self._abrir()
+
+    def liberar(self):
+        """
+        Devolver el lugar de una llamada permitida que terminó sin resultado
+
+        Para llamadas canceladas (cliente desconectado, timeout de asyncio): no
+        cuentan como éxito ni como falla, pero en half-open liberan la prueba.
+        """
+        with self._lock:
+            if self.estado == SEMIABIERTO:
+                self._pruebas_en_curso = max(self._pruebas_en_curso - 1, 0)
+
+    def _abrir(self):
+        self.estado = ABIERTO
+        self._abierto_hasta = time.monotonic() + self.segundos_abierto
+        self.aperturas += 1
+        logger.error(
+            "Circuito abierto tras %s fallas (última: %s) - reintento en %ss",
+            self.fallas_seguidas, self.ultima_falla, self.segundos_abierto,
+        )
+
+    def abierto(self):
+        """Indicar si el circuito está abierto y aún no toca enviar pruebas"""
+        return self.estado == ABIERTO and time.monotonic() < self._abierto_hasta
+
+    def rechazo_rapido(self):
+        """Como abierto(), contando la llamada como rechazada si lo está"""
+        if not self.abierto():
+            return False
+        with self._lock:
+            self.rechazadas += 1
+        return True
+
+    def restante(self):
+        """Segundos que faltan para que un circuito abierto pase a half-open"""
+        if self.estado != ABIERTO:
+            return 0.0
+        return max(self._abierto_hasta - time.monotonic(), 0.0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.estado,
+                "consecutive_failures": self.fallas_seguidas,
+                "last_failure": self.ultima_falla,
+                "retry_in_s": round(self.restante(), 1),
+                "opened": self.aperturas,
+                "rejected": self.rechazadas,
+            }
+
+_circuit = None
+_circuit_lock = threading.Lock()
+
+def get_circuit():
+    """Retornar el circuit breaker compartido por todo el proceso, creándolo si no existe"""
+    global _circuit
+    if _circuit is None:
+        with _circuit_lock:
+            if _circuit is None:
+                s = get_settings()
+                _circuit = CircuitBreaker(
+                    umbral=s.CIRCUIT_FAILURE_THRESHOLD,
+                    segundos_abierto=s.CIRCUIT_OPEN_SECONDS,
+                    pruebas=s.CIRCUIT_HALF_OPEN_PROBES,
+                )
+    return _circuit
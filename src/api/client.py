@@ -2,79 +2,242 @@
 Funciones de consulta de clientes en la API de Calidda
 """
 
+import asyncio
 import logging
-import requests
-from config import CONSULTA_API, TIMEOUT, QUICK_TIMEOUT
+import time
+from src.config import get_settings
+from src.api import metrics
+from src.utils import fastjson, trace
+from src.api.resultado import Cliente, ConsultaResult, Estado
+from src.api.governor import get_governor
+from src.api.circuit import get_circuit
 
 logger = logging.getLogger(__name__)
 
-def consultar_dni(session, dni, id_aliado):
-    """Consultar línea de crédito por DNI"""
-    params = {
+def _get(session, params, timeout, fase):
+    """
+    GET a la API de consulta; la respuesta ajusta el regulador de llamadas
+
+    fase: 'probe' o 'full', para las métricas y la traza. El turno del
+    regulador se toma una vez por DNI en consultar_dni, no por cada GET.
+    """
+    governor = get_governor()
+    metrics.UPSTREAM_EN_CURSO.inc()
+    inicio = time.perf_counter()
+    try:
+        response = session.get(get_settings().CONSULTA_API, params=params, timeout=timeout)
+    finally:
+        duracion = time.perf_counter() - inicio
+        metrics.observar_latencia(fase, duracion)
+        trace.registrar(fase, duracion)
+        metrics.UPSTREAM_EN_CURSO.dec()
+    governor.registrar(response.status_code, response.headers.get('Retry-After'))
+    return response
+
+async def _get_async(client, params, timeout, fase):
+    """Versión asyncio de _get"""
+    governor = get_governor()
+    metrics.UPSTREAM_EN_CURSO.inc()
+    inicio = time.perf_counter()
+    try:
+        response = await client.get(get_settings().CONSULTA_API, params=params, timeout=timeout)
+    finally:
+        duracion = time.perf_counter() - inicio
+        metrics.observar_latencia(fase, duracion)
+        trace.registrar(fase, duracion)
+        metrics.UPSTREAM_EN_CURSO.dec()
+    governor.registrar(response.status_code, response.headers.get('Retry-After'))
+    return response
+
+def _json(response):
+    """
+    Cuerpo JSON de la respuesta, registrando su tiempo como fase 'parse'
+
+    Con FAST_JSON se parsea con orjson. Lo que se conserva del cliente lo
+    define Cliente.desde_api, con o sin FAST_JSON.
+    """
+    with trace.medir('parse'):
+        if fastjson.activo():
+            return fastjson.cargar_consulta(response.content)
+        return response.json()
+
+def _parametros(dni, id_aliado):
+    """Parámetros de consulta de línea de crédito"""
+    return {
         'numeroDocumento': dni,
         'tipoDocumento': 'PE2',
         'idAliado': id_aliado,
         'canal': 'FNB'
     }
+
+def _verificar_no_encontrado(dni, response):
+    """
+    Revisar la respuesta de la consulta rápida.
+
+    Returns:
+        ConsultaResult si la consulta puede terminar aquí,
+        None si hay que hacer la consulta completa.
+    """
+    if response.status_code != 200:
+        return None
+
+    data = _json(response)
+    if data is None:
+        logger.error("Respuesta vacía de la API para DNI %s", dni)
+        return ConsultaResult(Estado.ERROR, 'Error en la respuesta de la API')
+
+    if not data.get('valid'):
+        resultado = ConsultaResult(Estado.INVALID, data.get('message'))
+        if resultado.no_encontrado:
+            logger.info("DNI %s no encontrado (respuesta rápida)", dni)
+            return resultado
+
+    return None
+
+def _procesar_respuesta(dni, response):
+    """Convertir la respuesta completa en un ConsultaResult"""
+    if response.status_code != 200:
+        return ConsultaResult.desde_status(response.status_code)
+
+    data = _json(response)
+
+    if data is None:
+        logger.error("Respuesta vacía de la API para DNI %s", dni)
+        return ConsultaResult(Estado.ERROR, 'Error en la respuesta de la API')
+
+    if data.get('valid'):
+        if not isinstance(data.get('data'), dict):
+            logger.error("Respuesta sin campo 'data' para DNI %s", dni)
+            return ConsultaResult(Estado.ERROR, 'Error en el formato de la respuesta')
+        return ConsultaResult(Estado.SUCCESS, cliente=Cliente.desde_api(data['data']))
+
+    mensaje = data.get('message', 'Sin mensaje')
+    logger.info("DNI %s inválido: %s", dni, mensaje)
+    return ConsultaResult(Estado.INVALID, mensaje)
+
+def _resultado_timeout(dni):
+    timeout = get_settings().TIMEOUT
+    logger.error("Tiempo de espera agotado (%s segundos) consultando DNI %s", timeout, dni)
+    return ConsultaResult(
+        Estado.TIMEOUT,
+        f'La consulta excedió el tiempo máximo de espera de {timeout} segundos. Por favor, inténtelo nuevamente.',
+    )
+
+def resultado_circuito_abierto(dni):
+    """Resultado degradado cuando el circuit breaker está abierto"""
+    logger.warning("Circuito abierto: consulta de DNI %s rechazada sin llamar a la API", dni)
+    metrics.contar_estado(Estado.CIRCUIT_OPEN)
+    return ConsultaResult(Estado.CIRCUIT_OPEN, 'Servicio de consulta no disponible temporalmente')
+
+def consultar_dni(session, dni, id_aliado):
+    """
+    Consultar línea de crédito por DNI
+
+    Toma un solo turno del regulador por DNI (la espera queda en la fase
+    'governor'): el probe y la consulta completa salen seguidos.
+    """
+    circuit = get_circuit()
+    if not circuit.permitir():
+        return resultado_circuito_abierto(dni)
+    with trace.medir('governor'):
+        get_governor().acquire()
+    resultado = _consultar_dni(session, dni, id_aliado)
+    circuit.registrar(resultado)
+    metrics.contar_estado(resultado.estado)
+    return resultado
+
+def _consultar_dni(session, dni, id_aliado):
+    import requests
+
+    s = get_settings()
+    params = _parametros(dni, id_aliado)
     
     try:
-        print(f"\nConsultando... (tiempo máximo de espera: {TIMEOUT} segundos)")
+        print(f"\nConsultando... (tiempo máximo de espera: {s.TIMEOUT} segundos)")
         print("Por favor espere mientras se procesa su solicitud...")
         
+        if s.LOOKUP_MODE == 'single':
+            # Una sola consulta: la respuesta se clasifica al llegar
+            response = _get(session, params, s.TIMEOUT, 'full')
+            return _procesar_respuesta(dni, response)
+        
         # Primera consulta rápida para verificar si el DNI existe
         try:
-            response = session.get(CONSULTA_API, params=params, timeout=30)
+            response = _get(session, params, s.QUICK_TIMEOUT, 'probe')
             
             # Si la respuesta es rápida y el DNI no existe, retornamos inmediatamente
-            if response.status_code == 200:
-                data = response.json()
-                if data is None:
-                    logger.error(f"Respuesta vacía de la API para DNI {dni}")
-                    return None, 'error', 'Error en la respuesta de la API'
-                    
-                mensaje = data.get('message', '')
-                if mensaje:  # Solo procesar si hay mensaje
-                    mensaje = mensaje.lower()
-                    if not data.get('valid') and ('no encontrado' in mensaje or 'no existe' in mensaje):
-                        logger.info(f"DNI {dni} no encontrado (respuesta rápida)")
-                        return None, f'invalid: {data.get("message")}', data.get('message')
+            resultado = _verificar_no_encontrado(dni, response)
+            if resultado is not None:
+                return resultado
                     
         except requests.exceptions.Timeout:
             # Si la consulta rápida falla por timeout, continuamos con la consulta normal
-            logger.debug(f"Timeout en consulta rápida para DNI {dni}, intentando consulta completa")
+            logger.debug("Timeout en consulta rápida para DNI %s, intentando consulta completa", dni)
         
         # Si no es una respuesta rápida de DNI no encontrado, hacemos la consulta completa
-        response = session.get(CONSULTA_API, params=params, timeout=TIMEOUT)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if data is None:
-                logger.error(f"Respuesta vacía de la API para DNI {dni}")
-                return None, 'error', 'Error en la respuesta de la API'
-            
-            if data.get('valid'):
-                if 'data' not in data:
-                    logger.error(f"Respuesta sin campo 'data' para DNI {dni}")
-                    return None, 'error', 'Error en el formato de la respuesta'
-                return data['data'], 'success', None
-            else:
-                mensaje = data.get('message', 'Sin mensaje')
-                logger.info(f"DNI {dni} inválido: {mensaje}")
-                return None, f'invalid: {mensaje}', mensaje
-        
-        elif response.status_code == 401:
-            return None, 'expired', 'Sesión expirada'
-        elif response.status_code == 403:
-            return None, 'blocked', 'Acceso bloqueado'
-        elif response.status_code == 429:
-            return None, 'rate_limit', 'Demasiadas consultas'
-        else:
-            return None, f'error_{response.status_code}', f'Error HTTP {response.status_code}'
+        response = _get(session, params, s.TIMEOUT, 'full')
+        return _procesar_respuesta(dni, response)
             
     except requests.exceptions.Timeout:
-        logger.error(f"Tiempo de espera agotado ({TIMEOUT} segundos) consultando DNI {dni}")
-        return None, 'timeout', f'La consulta excedió el tiempo máximo de espera de {TIMEOUT} segundos. Por favor, inténtelo nuevamente.'
+        return _resultado_timeout(dni)
+    except Exception as e:
+        logger.error("Error consultando DNI %s: %s", dni, e)
+        return ConsultaResult(Estado.EXCEPTION, str(e))
+
+async def consultar_dni_async(client, dni, id_aliado):
+    """
+    Versión asyncio de consultar_dni.
+
+    Args:
+        client: httpx.AsyncClient autenticado (ver api.auth.autenticar_async)
+        dni: DNI de 8 dígitos
+        id_aliado: ID de aliado comercial obtenido en el login
+
+    Returns:
+        ConsultaResult, igual que consultar_dni
+    """
+    circuit = get_circuit()
+    if not circuit.permitir():
+        return resultado_circuito_abierto(dni)
+    try:
+        with trace.medir('governor'):
+            await get_governor().acquire_async()
+        resultado = await _consultar_dni_async(client, dni, id_aliado)
+    except asyncio.CancelledError:
+        # Sin resultado: no dejar ocupada una prueba del half-open
+        circuit.liberar()
+        raise
+    circuit.registrar(resultado)
+    metrics.contar_estado(resultado.estado)
+    return resultado
+
+async def _consultar_dni_async(client, dni, id_aliado):
+    import httpx
+
+    s = get_settings()
+    params = _parametros(dni, id_aliado)
+
+    try:
+        if s.LOOKUP_MODE == 'single':
+            response = await _get_async(client, params, s.TIMEOUT, 'full')
+            return _procesar_respuesta(dni, response)
+
+        # Primera consulta rápida para verificar si el DNI existe
+        try:
+            response = await _get_async(client, params, s.QUICK_TIMEOUT, 'probe')
+
+            resultado = _verificar_no_encontrado(dni, response)
+            if resultado is not None:
+                return resultado
+
+        except httpx.TimeoutException:
+            logger.debug("Timeout en consulta rápida para DNI %s, intentando consulta completa", dni)
+
+        response = await _get_async(client, params, s.TIMEOUT, 'full')
+        return _procesar_respuesta(dni, response)
+
+    except httpx.TimeoutException:
+        return _resultado_timeout(dni)
     except Exception as e:
-        logger.error(f"Error consultando DNI {dni}: {e}")
-        return None, f'exception: {str(e)}', str(e)
\ No newline at end of file
+        logger.error("Error consultando DNI %s: %s", dni, e)
+        return ConsultaResult(Estado.EXCEPTION, str(e))
@@ -0,0 +1,211 @@
+"""
+Regulador adaptativo de llamadas a la API de Calidda
+
+Un único token bucket por proceso, compartido por el CLI, los hilos y las
+corutinas del wrapper. La tasa baja de forma multiplicativa ante un 429
+(respetando Retry-After) o un 403 y sube de forma gradual mientras las
+llamadas tienen éxito (AIMD).
+
+El wrapper usa los límites GOVERNOR_RATE_* (por defecto amplios: solo frena
+ante un 429/403). El CLI llama a usar_ritmo_cli() al arrancar para que la tasa
+se mueva entre 1/DELAY_MAX y 1/DELAY_MIN, el ritmo de las pausas que usaba
+antes entre consultas. El tráfico masivo del wrapper (POST /query/batch) pasa
+además por get_governor_lote(), con ese mismo ritmo de DELAY_*.
+"""
+
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+def parse_retry_after(valor):
+    """Segundos indicados por un header Retry-After (número o fecha HTTP), o None"""
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(fecha.timestamp() - time.time(), 0.0)
+
+class RateGovernor:
+    """Token bucket con tasa adaptativa (llamadas por segundo)"""
+
+    def __init__(self, rate, rate_min, rate_max, burst=1, backoff=0.5, incremento=0.01,
+                 pausa_defecto=60):
+        """
+        Args:
+            rate: Tasa inicial
+            rate_min / rate_max: Límites de la tasa
+            burst: Llamadas que pueden salir seguidas sin esperar
+            backoff: Factor por el que se multiplica la tasa ante un 429
+            incremento: Llamadas/s que se suman a la tasa por cada éxito
+            pausa_defecto: Pausa ante 429/403 cuando no hay Retry-After
+        """
+        self.rate = rate
+        self.rate_min = rate_min
+        self.rate_max = rate_max
+        self.burst = burst
+        self.backoff = backoff
+        self.incremento = incremento
+        self.pausa_defecto = pausa_defecto
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._ts = time.monotonic()
+        self._pausa_hasta = 0.0
+        self.llamadas = 0
+        self.esperas = 0
+        self.tiempo_espera = 0.0
+        self.rate_limits = 0
+        self.bloqueos = 0
+
+    def _reservar(self):
+        """Tomar un token y retornar cuántos segundos hay que esperar para usarlo"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            self._tokens -= 1
+            espera = max(self._pausa_hasta - now, -self._tokens / self.rate, 0.0)
+            self.llamadas += 1
+            if espera > 0:
+                self.esperas += 1
+                self.tiempo_espera += espera
+            return espera
+
+    def acquire(self):
+        """Esperar (bloqueando el hilo) hasta poder hacer una llamada"""
+        espera = self._reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+    async def acquire_async(self):
+        """Esperar (sin bloquear el event loop) hasta poder hacer una llamada"""
+        espera = self._reservar()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    def esperar_pausa(self):
+        """Esperar solo la pausa de un 429/403 (sin tomar un token), p. ej. para el login"""
+        espera = self.pausa_restante()
+        if espera > 0:
+            time.sleep(espera)
+
+    async def esperar_pausa_async(self):
+        espera = self.pausa_restante()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    def registrar(self, status_code, retry_after=None):
+        """
+        Ajustar la tasa según la respuesta de una llamada
+
+        Args:
+            status_code: Código HTTP de la respuesta
+            retry_after: Valor del header Retry-After, si vino
+        """
+        with self._lock:
+            now = time.monotonic()
+            if status_code in (429, 403):
+                if status_code == 429:
+                    self.rate_limits += 1
+                    self.rate = max(self.rate_min, self.rate * self.backoff)
+                else:
+                    self.bloqueos += 1
+                    self.rate = self.rate_min
+                pausa = parse_retry_after(retry_after)
+                if pausa is None:
+                    pausa = self.pausa_defecto
+                self._pausa_hasta = max(self._pausa_hasta, now + pausa)
+                self._tokens = min(self._tokens, 0.0)
+                logger.warning(
+                    "HTTP %s - tasa reducida a %.3f llamadas/s, pausa de %.0fs",
+                    status_code, self.rate, pausa,
+                )
+            elif status_code < 400:
+                self.rate = min(self.rate_max, self.rate + self.incremento)
+
+    def pausa_restante(self):
+        return max(self._pausa_hasta - time.monotonic(), 0.0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 4),
+                "rate_min": self.rate_min,
+                "rate_max": self.rate_max,
+                "paused_for_s": round(max(self._pausa_hasta - time.monotonic(), 0.0), 1),
+                "calls": self.llamadas,
+                "waits": self.esperas,
+                "wait_time_s": round(self.tiempo_espera, 1),
+                "rate_limits": self.rate_limits,
+                "blocked": self.bloqueos,
+            }
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def _crear_governor(por_delay=False):
+    s = get_settings()
+    if not por_delay:
+        return RateGovernor(
+            rate=s.GOVERNOR_RATE_INICIAL,
+            rate_min=s.GOVERNOR_RATE_MIN,
+            rate_max=s.GOVERNOR_RATE_MAX,
+            burst=s.GOVERNOR_BURST,
+            backoff=s.GOVERNOR_BACKOFF,
+            incremento=s.GOVERNOR_INCREMENTO,
+            pausa_defecto=s.RATE_LIMIT_PAUSE,
+        )
+    rate_min = 1 / max(s.DELAY_MAX, 0.001)
+    rate_max = 1 / max(s.DELAY_MIN, 0.001)
+    return RateGovernor(
+        rate=2 / max(s.DELAY_MIN + s.DELAY_MAX, 0.002),
+        rate_min=rate_min,
+        rate_max=rate_max,
+        burst=1,
+        backoff=s.GOVERNOR_BACKOFF,
+        incremento=(rate_max - rate_min) / 20,
+        pausa_defecto=s.RATE_LIMIT_PAUSE,
+    )
+
+def get_governor():
+    """Retornar el regulador compartido por todo el proceso, creándolo si no existe"""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = _crear_governor()
+    return _governor
+
+def usar_ritmo_cli():
+    """Regular el proceso con el ritmo del CLI (DELAY_MIN/DELAY_MAX) en lugar de GOVERNOR_RATE_*"""
+    global _governor
+    with _governor_lock:
+        _governor = _crear_governor(por_delay=True)
+    return _governor
+
+_governor_lote = None
+
+def get_governor_lote():
+    """
+    Regulador del tráfico masivo del wrapper, con el ritmo de DELAY_MIN/DELAY_MAX
+
+    Se toma un turno por DNI antes de consultarlo; las llamadas pasan después
+    también por get_governor(), que es el que reacciona a los 429/403.
+    """
+    global _governor_lote
+    if _governor_lote is None:
+        with _governor_lock:
+            if _governor_lote is None:
+                _governor_lote = _crear_governor(por_delay=True)
+    return _governor_lote
@@ -0,0 +1,204 @@
+"""
+Métricas Prometheus del servicio
+
+Las métricas se crean con activar() (lo llama api_wrapper). Hasta entonces son
+objetos nulos: el CLI no importa prometheus_client ni paga nada por medir.
+En el hot path solo se usan hijos con labels resueltos al activar; los
+contadores de sesión, cache, single-flight, trabajos, planificador, regulador
+y circuit breaker se leen de sus stats() al momento del scrape.
+"""
+
+import logging
+
+from src.api.circuit import get_circuit
+from src.api.governor import get_governor
+from src.api.resultado import Estado
+
+logger = logging.getLogger(__name__)
+
+# Límites de los histogramas de latencia (la consulta completa puede tardar minutos)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Nula:
+    """Métrica que no hace nada (métricas desactivadas)"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, valor):
+        pass
+
+    def inc(self, valor=1):
+        pass
+
+    def dec(self, valor=1):
+        pass
+
+_NULA = _Nula()
+
+# Llamadas HTTP a Calidda en curso y solicitudes /query en curso
+UPSTREAM_EN_CURSO = _NULA
+SOLICITUDES_EN_CURSO = _NULA
+
+_consultas = _NULA
+_por_estado = {}
+_latencia = {}  # fase -> hijo del histograma
+_espera = {}  # clase del planificador -> hijo del histograma
+_registry = None
+
+def observar_latencia(fase, segundos):
+    """Registrar la duración de una llamada a Calidda ('probe', 'full' o 'login')"""
+    hijo = _latencia.get(fase)
+    if hijo is not None:
+        hijo.observe(segundos)
+
+def observar_espera(clase, segundos):
+    """Registrar la espera de una consulta en el planificador ('interactive' o 'bulk')"""
+    hijo = _espera.get(clase)
+    if hijo is not None:
+        hijo.observe(segundos)
+
+def contar_estado(estado):
+    """Contar el resultado de una consulta por Estado"""
+    hijo = _por_estado.get(estado)
+    if hijo is not None:
+        hijo.inc()
+
+class _EstadoCollector:
+    """Expone los stats() de los componentes del servicio al momento del scrape"""
+
+    def __init__(self, sesiones=None, cache=None, singleflight=None, trabajos=None, planificador=None):
+        self.sesiones = sesiones
+        self.cache = cache
+        self.singleflight = singleflight
+        self.trabajos = trabajos
+        self.planificador = planificador
+
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        def contador(nombre, ayuda, valor):
+            return CounterMetricFamily(nombre, ayuda, value=valor)
+
+        def medidor(nombre, ayuda, valor):
+            return GaugeMetricFamily(nombre, ayuda, value=valor)
+
+        if self.sesiones is not None:
+            s = self.sesiones.stats()
+            yield contador('calidda_session_logins', 'Sesiones instaladas (login o token compartido)', s['logins'])
+            yield contador('calidda_session_refreshes', 'Renovaciones del token en segundo plano', s['refreshes'])
+            yield contador('calidda_session_expired', 'Respuestas 401 que forzaron un re-login', s['expired_401'])
+            yield contador('calidda_session_failures', 'Intentos de login fallidos', s['failures'])
+            if s['expires_in_s'] is not None:
+                yield medidor('calidda_session_expires_in_seconds', 'Segundos de vida del token actual', s['expires_in_s'])
+            token_store = s.get('token_store')
+            if token_store:
+                yield contador('calidda_token_store_logins', 'Logins hechos por este proceso en el token compartido', token_store['logins'])
+                yield contador('calidda_token_store_reused', 'Tokens compartidos reutilizados', token_store['reused'])
+
+        if self.cache is not None:
+            c = self.cache.stats()
+            yield contador('calidda_cache_hits', 'Resultados servidos desde el cache', c['hits'])
+            yield contador('calidda_cache_stale_hits', 'Resultados vencidos servidos mientras se refrescan', c['stale_hits'])
+            yield contador('calidda_cache_misses', 'Consultas sin resultado en cache', c['misses'])
+            yield contador('calidda_cache_evictions', 'Entradas descartadas por tamaño', c['evictions'])
+            yield medidor('calidda_cache_entries', 'Entradas en el cache', c['size'])
+
+        if self.singleflight is not None:
+            f = self.singleflight.stats()
+            yield contador('calidda_singleflight_calls', 'Consultas que pasaron por single-flight', f['calls'])
+            yield contador('calidda_singleflight_shared', 'Consultas que reutilizaron una llamada en curso', f['shared'])
+            yield medidor('calidda_singleflight_in_flight', 'DNIs con una consulta en curso', f['in_flight'])
+
+        if self.trabajos is not None:
+            t = self.trabajos.stats()
+            yield medidor('calidda_jobs_queued', 'Trabajos async esperando un worker', t['queued'])
+            yield medidor('calidda_jobs_running', 'Trabajos async en ejecución', t['running'])
+            yield contador('calidda_jobs_created', 'Trabajos async creados', t['created'])
+            yield contador('calidda_jobs_failed', 'Trabajos async fallidos', t['failed'])
+            yield contador('calidda_jobs_callbacks_delivered', 'Resultados entregados al callback', t['callbacks_delivered'])
+            yield contador('calidda_jobs_callbacks_failed', 'Callbacks que fallaron tras todos los intentos', t['callbacks_failed'])
+
+        if self.planificador is not None:
+            p = self.planificador.stats()
+            yield medidor('calidda_scheduler_in_use', 'Consultas a Calidda con turno del planificador', p['in_use'])
+            en_cola = GaugeMetricFamily('calidda_scheduler_queued', 'Consultas esperando turno por clase', labels=['clase'])
+            for clase, c in p['classes'].items():
+                en_cola.add_metric([clase], c['queued'])
+            yield en_cola
+
+        g = get_governor().stats()
+        yield medidor('calidda_governor_rate', 'Tasa actual del regulador (llamadas/s)', g['rate'])
+        yield contador('calidda_governor_waits', 'Llamadas que esperaron al regulador', g['waits'])
+        yield contador('calidda_governor_wait_seconds', 'Tiempo total de espera en el regulador', g['wait_time_s'])
+
+        circuito = get_circuit()
+        yield medidor('calidda_circuit_open', 'Circuit breaker abierto (1) o cerrado (0)', int(circuito.abierto()))
+        yield contador('calidda_circuit_opened', 'Veces que se abrió el circuito', circuito.aperturas)
+        yield contador('calidda_circuit_rejected', 'Llamadas rechazadas con el circuito abierto', circuito.rechazadas)
+
+def activar(sesiones=None, cache=None, singleflight=None, trabajos=None, planificador=None):
+    """
+    Crear las métricas y registrar los componentes a exponer
+
+    Returns:
+        True si quedaron activas, False si prometheus_client no está instalado
+    """
+    global UPSTREAM_EN_CURSO, SOLICITUDES_EN_CURSO, _consultas, _por_estado, _latencia, _espera, _registry
+
+    if _registry is not None:
+        return True
+    try:
+        from prometheus_client import (
+            CollectorRegistry, Counter, Gauge, Histogram,
+            GCCollector, PlatformCollector, ProcessCollector,
+        )
+    except ImportError:
+        logger.warning("prometheus_client no está instalado; /metrics desactivado")
+        return False
+
+    registry = CollectorRegistry()
+    ProcessCollector(registry=registry)
+    PlatformCollector(registry=registry)
+    GCCollector(registry=registry)
+
+    latencia = Histogram(
+        'calidda_upstream_request_seconds', 'Latencia de las llamadas HTTP a Calidda',
+        ['fase'], buckets=BUCKETS, registry=registry,
+    )
+    _latencia = {fase: latencia.labels(fase) for fase in ('probe', 'full', 'login')}
+
+    espera = Histogram(
+        'calidda_scheduler_wait_seconds', 'Espera de una consulta por su turno en el planificador',
+        ['clase'], buckets=(0,) + BUCKETS, registry=registry,
+    )
+    _espera = {clase: espera.labels(clase) for clase in ('interactive', 'bulk')}
+
+    UPSTREAM_EN_CURSO = Gauge(
+        'calidda_upstream_in_flight', 'Llamadas HTTP a Calidda en curso', registry=registry,
+    )
+    SOLICITUDES_EN_CURSO = Gauge(
+        'calidda_requests_in_flight', 'Solicitudes /query en curso', registry=registry,
+    )
+
+    _consultas = Counter(
+        'calidda_consultas', 'Resultados de consultar_dni por estado', ['estado'], registry=registry,
+    )
+    _por_estado = {estado: _consultas.labels(estado.value) for estado in Estado}
+
+    registry.register(_EstadoCollector(sesiones, cache, singleflight, trabajos, planificador))
+    _registry = registry
+    return True
+
+def exponer():
+    """
+    Serializar las métricas en el formato de texto de Prometheus
+
+    Returns:
+        Tupla (contenido, content_type), o None si las métricas no están activas
+    """
+    if _registry is None:
+        return None
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return generate_latest(_registry), CONTENT_TYPE_LATEST
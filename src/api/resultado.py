@@ -0,0 +1,157 @@
+"""
+Resultado tipado de una consulta de DNI
+
+consultar_dni retorna un ConsultaResult: un Estado (enum), el mensaje de la
+API, los datos del cliente que usa el servicio y la clasificación "no
+encontrado" / "no califica", calculada una sola vez al crear el resultado.
+Con __slots__ miles de resultados ocupan poco en el cache y en los lotes.
+"""
+
+import enum
+
+class Estado(enum.Enum):
+    """Estado de una consulta (el valor es el label de métricas y logs)"""
+
+    SUCCESS = 'success'
+    INVALID = 'invalid'  # la API respondió valid=false (ver no_encontrado)
+    EXPIRED = 'expired'  # 401
+    BLOCKED = 'blocked'  # 403
+    RATE_LIMIT = 'rate_limit'  # 429
+    HTTP_ERROR = 'http_error'  # otro status HTTP (ver status_code)
+    TIMEOUT = 'timeout'
+    CIRCUIT_OPEN = 'circuit_open'
+    ERROR = 'error'  # respuesta vacía o con formato inesperado
+    EXCEPTION = 'exception'  # error de red u otra excepción
+
+# Mensajes de la API que indican que el DNI no está registrado
+_NO_ENCONTRADO = ('no encontrado', 'no existe')
+# Mensajes que se responden con la plantilla NO_CALIFICA
+_SIN_CAMPANA = ('no encontrado', 'no califica', 'no tiene campaña')
+
+class Cliente:
+    """Campos del cliente que usa el servicio"""
+
+    __slots__ = ('id', 'nombre', 'linea_credito', 'tiene_linea_credito')
+
+    def __init__(self, id=None, nombre=None, linea_credito=0, tiene_linea_credito=False):
+        self.id = id
+        self.nombre = nombre
+        self.linea_credito = linea_credito
+        self.tiene_linea_credito = tiene_linea_credito
+
+    @classmethod
+    def desde_api(cls, data):
+        """Crear desde el campo 'data' de la respuesta de Calidda"""
+        return cls(
+            id=data.get('id'),
+            nombre=data.get('nombre'),
+            linea_credito=data.get('lineaCredito') or 0,
+            tiene_linea_credito=bool(data.get('tieneLineaCredito')),
+        )
+
+    def a_dict(self):
+        """Dict con los nombres de campo de la API (JSONL, SQLite)"""
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'lineaCredito': self.linea_credito,
+            'tieneLineaCredito': self.tiene_linea_credito,
+        }
+
+    def __repr__(self):
+        return f"Cliente(id={self.id!r}, nombre={self.nombre!r}, linea_credito={self.linea_credito!r})"
+
+class ConsultaResult:
+    """Resultado de consultar_dni"""
+
+    __slots__ = ('estado', 'mensaje', 'cliente', 'status_code', 'no_encontrado', 'no_califica')
+
+    def __init__(self, estado, mensaje=None, cliente=None, status_code=None):
+        """
+        Args:
+            estado: Estado de la consulta
+            mensaje: Mensaje de la API o descripción del error
+            cliente: Cliente (solo con Estado.SUCCESS)
+            status_code: Status HTTP (Estado.HTTP_ERROR)
+        """
+        self.estado = estado
+        self.mensaje = mensaje
+        self.cliente = cliente
+        self.status_code = status_code
+        texto = mensaje.lower() if mensaje else ''
+        self.no_encontrado = estado is Estado.INVALID and any(m in texto for m in _NO_ENCONTRADO)
+        self.no_califica = self.no_encontrado or any(m in texto for m in _SIN_CAMPANA)
+
+    @classmethod
+    def desde_status(cls, status_code):
+        """Resultado para una respuesta HTTP distinta de 200"""
+        if status_code == 401:
+            return cls(Estado.EXPIRED, 'Sesión expirada')
+        if status_code == 403:
+            return cls(Estado.BLOCKED, 'Acceso bloqueado')
+        if status_code == 429:
+            return cls(Estado.RATE_LIMIT, 'Demasiadas consultas')
+        return cls(Estado.HTTP_ERROR, f'Error HTTP {status_code}', status_code=status_code)
+
+    @property
+    def exito(self):
+        """La consulta encontró al cliente"""
+        return self.estado is Estado.SUCCESS and self.cliente is not None
+
+    @property
+    def tiene_oferta(self):
+        return self.exito and self.cliente.tiene_linea_credito
+
+    @property
+    def categoria(self):
+        """'success' (con oferta), 'sin_credito', 'dni_invalido' o 'error'"""
+        if self.exito:
+            return 'success' if self.cliente.tiene_linea_credito else 'sin_credito'
+        if self.no_encontrado:
+            return 'dni_invalido'
+        return 'error'
+
+    @property
+    def es_falla(self):
+        """Cuenta como falla del upstream para el circuit breaker"""
+        return (
+            self.estado in (Estado.TIMEOUT, Estado.BLOCKED, Estado.EXCEPTION)
+            or (self.estado is Estado.HTTP_ERROR and self.status_code >= 500)
+        )
+
+    @property
+    def transitorio(self):
+        """Falla pasajera: volver a consultar el DNI puede dar otro resultado"""
+        return (
+            self.estado in (Estado.TIMEOUT, Estado.EXCEPTION, Estado.RATE_LIMIT, Estado.CIRCUIT_OPEN)
+            or (self.estado is Estado.HTTP_ERROR and self.status_code >= 500)
+        )
+
+    @property
+    def etiqueta(self):
+        """Estado legible para logs ('http_error' incluye el status: 'error_502')"""
+        if self.estado is Estado.HTTP_ERROR:
+            return f'error_{self.status_code}'
+        return self.estado.value
+
+    def a_dict(self):
+        """Campos serializables (JSONL, SQLite)"""
+        return {
+            'estado': self.estado.value,
+            'mensaje': self.mensaje,
+            'data': self.cliente.a_dict() if self.cliente is not None else None,
+            'status_code': self.status_code,
+        }
+
+    @classmethod
+    def desde_dict(cls, d):
+        data = d.get('data')
+        return cls(
+            Estado(d['estado']),
+            d.get('mensaje'),
+            cliente=Cliente.desde_api(data) if data else None,
+            status_code=d.get('status_code'),
+        )
+
+    def __repr__(self):
+        return f"ConsultaResult({self.etiqueta}, mensaje={self.mensaje!r}, cliente={self.cliente!r})"
@@ -0,0 +1,146 @@
+"""
+Planificador por prioridad de las consultas a Calidda (wrapper)
+
+Las consultas interactivas (POST /query y trabajos async de una conversación)
+y las masivas (POST /query/batch, refrescos en segundo plano) comparten un
+número fijo de consultas simultáneas. Mientras ambas clases esperan, se
+atienden hasta `peso` interactivas por cada masiva: un lote grande no deja a
+un cliente del chat detrás de cientos de consultas y el lote nunca se detiene
+del todo. Como solo quien tiene turno llega al regulador (api.governor), el
+mismo orden reparte también la tasa de llamadas.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from src.api import metrics
+from src.utils import trace
+
+INTERACTIVA = 'interactive'
+MASIVA = 'bulk'
+CLASES = (INTERACTIVA, MASIVA)
+
+class _Turno:
+    __slots__ = ('clase', 'clave', 'future', 'encolado')
+
+    def __init__(self, clase, clave, future):
+        self.clase = clase
+        self.clave = clave
+        self.future = future
+        self.encolado = time.monotonic()
+
+class Planificador:
+    """Semáforo asyncio con colas por clase de prioridad"""
+
+    def __init__(self, concurrencia, peso=4):
+        """
+        Args:
+            concurrencia: Consultas a Calidda en curso como máximo
+            peso: Turnos interactivos seguidos antes de ceder uno a la cola masiva
+        """
+        self.concurrencia = concurrencia
+        self.peso = peso
+        self._libres = concurrencia
+        self._colas = {clase: deque() for clase in CLASES}
+        self._seguidas = 0
+        self.atendidas = dict.fromkeys(CLASES, 0)
+        self.espera_total = dict.fromkeys(CLASES, 0.0)
+        self.espera_max = dict.fromkeys(CLASES, 0.0)
+        self.promovidas = 0
+
+    @asynccontextmanager
+    async def turno(self, clase, clave=None):
+        """Ocupar un lugar de consulta mientras dure el bloque"""
+        await self.adquirir(clase, clave)
+        try:
+            yield
+        finally:
+            self.liberar()
+
+    async def adquirir(self, clase, clave=None):
+        """
+        Esperar un lugar libre según la prioridad de la clase
+
+        Args:
+            clase: INTERACTIVA o MASIVA
+            clave: Identificador (DNI) para poder promover el turno con promover()
+        """
+        if self._libres > 0 and not any(self._colas.values()):
+            self._libres -= 1
+            self._registrar(clase, 0.0)
+            trace.registrar('scheduler', 0.0)
+            return
+
+        turno = _Turno(clase, clave, asyncio.get_running_loop().create_future())
+        self._colas[clase].append(turno)
+        try:
+            await turno.future
+        except asyncio.CancelledError:
+            if turno.future.done() and not turno.future.cancelled():
+                # El turno llegó justo al cancelar: devolverlo
+                self.liberar()
+            else:
+                try:
+                    self._colas[turno.clase].remove(turno)
+                except ValueError:
+                    pass  # _despachar ya lo sacó de la cola al verlo cancelado
+            raise
+        # En el contexto de quien espera (no en el de quien liberó el lugar)
+        trace.registrar('scheduler', time.monotonic() - turno.encolado)
+
+    def liberar(self):
+        self._libres += 1
+        self._despachar()
+
+    def promover(self, clave):
+        """Pasar a la cola interactiva el turno masivo en espera para esta clave, si lo hay"""
+        for turno in self._colas[MASIVA]:
+            if turno.clave == clave:
+                self._colas[MASIVA].remove(turno)
+                turno.clase = INTERACTIVA
+                self._colas[INTERACTIVA].append(turno)
+                self.promovidas += 1
+                return True
+        return False
+
+    def _elegir(self):
+        interactivas, masivas = self._colas[INTERACTIVA], self._colas[MASIVA]
+        if interactivas and (not masivas or self._seguidas < self.peso):
+            self._seguidas += 1
+            return interactivas
+        self._seguidas = 0
+        return masivas or interactivas
+
+    def _despachar(self):
+        while self._libres > 0 and any(self._colas.values()):
+            turno = self._elegir().popleft()
+            if turno.future.done():  # cancelado
+                continue
+            self._libres -= 1
+            self._registrar(turno.clase, time.monotonic() - turno.encolado)
+            turno.future.set_result(None)
+
+    def _registrar(self, clase, espera):
+        self.atendidas[clase] += 1
+        self.espera_total[clase] += espera
+        self.espera_max[clase] = max(self.espera_max[clase], espera)
+        metrics.observar_espera(clase, espera)
+
+    def stats(self):
+        return {
+            "capacity": self.concurrencia,
+            "in_use": self.concurrencia - self._libres,
+            "promoted": self.promovidas,
+            "classes": {
+                clase: {
+                    "queued": len(self._colas[clase]),
+                    "granted": self.atendidas[clase],
+                    "wait_avg_s": round(self.espera_total[clase] / self.atendidas[clase], 3)
+                    if self.atendidas[clase] else 0.0,
+                    "wait_max_s": round(self.espera_max[clase], 3),
+                }
+                for clase in CLASES
+            },
+        }
@@ -0,0 +1,323 @@
+"""
+Manejo de sesiones autenticadas con la API de Calidda
+
+Los managers conocen la expiración real del token (claim `exp` del JWT),
+lo renuevan en segundo plano antes de que venza, vuelven a iniciar sesión y
+reintentan una vez cuando la API responde 401, y cierran las sesiones retiradas.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from src.config import get_settings
+from src.api.auth import autenticar, autenticar_async, sesion_desde_token, cliente_desde_token
+from src.api.client import consultar_dni, consultar_dni_async, resultado_circuito_abierto
+from src.api.circuit import get_circuit
+from src.api.resultado import Estado
+from src.utils import trace
+
+logger = logging.getLogger(__name__)
+
+# Si el login falla en segundo plano, reintentar tras estos segundos
+REINTENTO_LOGIN = 30
+
+class _EstadoSesion:
+    """Estado compartido por los managers síncrono y asíncrono"""
+
+    def __init__(self, refresh_margin=None, fallback_ttl=None):
+        # Por defecto SESSION_REFRESH_MARGIN y SESSION_TTL
+        if refresh_margin is None or fallback_ttl is None:
+            s = get_settings()
+            refresh_margin = s.SESSION_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+            fallback_ttl = s.SESSION_TTL if fallback_ttl is None else fallback_ttl
+        self.refresh_margin = refresh_margin
+        self.fallback_ttl = fallback_ttl
+        self.session = None
+        self.token = None
+        self.id_aliado = None
+        self.login_ts = 0.0
+        self.expires_at = 0.0
+        self.logins = 0
+        self.refreshes = 0
+        self.expired_401 = 0
+        self.failures = 0
+
+    def instalar(self, session, token_info):
+        """Guardar una sesión nueva y retornar la anterior (para cerrarla)"""
+        now = time.time()
+        retirada = self.session
+        self.session = session
+        self.token = token_info['token']
+        self.id_aliado = token_info['id_aliado']
+        self.login_ts = now
+        exp = token_info.get('exp')
+        self.expires_at = float(exp) if exp else now + self.fallback_ttl
+        self.logins += 1
+        return retirada if retirada is not session else None
+
+    @property
+    def refresh_at(self):
+        """Momento en que conviene renovar el token"""
+        margen = min(self.refresh_margin, (self.expires_at - self.login_ts) / 2)
+        return self.expires_at - margen
+
+    def vigente(self, now=None):
+        now = time.time() if now is None else now
+        return self.session is not None and now < self.expires_at
+
+    def stats(self):
+        now = time.time()
+        activa = self.session is not None
+        return {
+            "active": activa,
+            "token_age_s": round(now - self.login_ts, 1) if activa else None,
+            "expires_in_s": round(self.expires_at - now, 1) if activa else None,
+            "logins": self.logins,
+            "refreshes": self.refreshes,
+            "expired_401": self.expired_401,
+            "failures": self.failures,
+        }
+
+class SessionManager:
+    """Sesión requests.Session compartida entre hilos"""
+
+    def __init__(self, login_fn=autenticar, refresh_margin=None,
+                 fallback_ttl=None, token_store=None, desde_token=sesion_desde_token):
+        """
+        token_store: TokenStore opcional para compartir el token entre procesos
+        desde_token: crea una sesión a partir de un token del token_store
+        """
+        self._login_fn = login_fn
+        self._token_store = token_store
+        self._desde_token = desde_token
+        self._estado = _EstadoSesion(refresh_margin, fallback_ttl)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._despertar = threading.Event()
+        self._thread = None
+
+    def get(self):
+        """
+        Retornar (session, id_aliado), iniciando sesión si hace falta
+
+        Raises:
+            RuntimeError: si no se pudo iniciar sesión
+        """
+        estado = self._estado
+        now = time.time()
+        if estado.vigente(now) and (self._thread or now < estado.refresh_at):
+            return estado.session, estado.id_aliado
+        return self.refresh(generacion=estado.logins)
+
+    def refresh(self, generacion=None, rechazado=False, forzar=False):
+        """
+        Iniciar sesión de nuevo y cerrar la sesión retirada
+
+        generacion: número de login (estado.logins) que el llamador considera
+        vencido. Si otro hilo ya inició sesión después, se reutiliza esa sesión
+        en lugar de hacer otro login.
+        rechazado: la API rechazó el token actual (401); no reutilizarlo desde
+        el token_store aunque no haya vencido.
+        forzar: hacer login aunque el token_store tenga un token vigente, y
+        reemplazarlo (rotación de sesión cada MAX_CONSULTAS_POR_SESION).
+        """
+        with self._lock:
+            estado = self._estado
+            if generacion is not None and estado.logins != generacion and estado.vigente():
+                return estado.session, estado.id_aliado
+
+            if self._token_store is not None:
+                session, token_info = self._token_store.autenticar(
+                    self._login_fn, self._desde_token,
+                    token_rechazado=estado.token if rechazado else None,
+                    forzar=forzar,
+                )
+            else:
+                session, token_info = self._login_fn()
+            if not session:
+                estado.failures += 1
+                raise RuntimeError("No se pudo iniciar sesión en Calidda")
+
+            retirada = estado.instalar(session, token_info)
+            if retirada is not None:
+                retirada.close()
+            self._despertar.set()
+            return session, estado.id_aliado
+
+    def invalidate(self):
+        """Forzar un login en la próxima llamada a get()"""
+        self._estado.expires_at = 0.0
+
+    def consultar(self, dni):
+        """consultar_dni con re-login y un reintento si la sesión expiró (401)"""
+        if get_circuit().rechazo_rapido():
+            # Fallar rápido sin intentar login ni consulta
+            return resultado_circuito_abierto(dni)
+        with trace.medir('session'):
+            session, id_aliado = self.get()
+        generacion = self._estado.logins
+        resultado = consultar_dni(session, dni, id_aliado)
+        if resultado.estado is Estado.EXPIRED:
+            logger.warning("Sesión expirada - Reconectando...")
+            self._estado.expired_401 += 1
+            with trace.medir('session'):
+                session, id_aliado = self.refresh(generacion=generacion, rechazado=True)
+            resultado = consultar_dni(session, dni, id_aliado)
+        return resultado
+
+    def start(self):
+        """Iniciar la renovación del token en segundo plano"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._renovar, name="calidda-session-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._despertar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            if self._estado.session is not None:
+                self._estado.session.close()
+                self._estado.session = None
+
+    def _renovar(self):
+        while not self._stop.is_set():
+            estado = self._estado
+            # Sin sesión: esperar a que get() inicie la primera
+            espera = estado.refresh_at - time.time() if estado.session else None
+            if espera is None or espera > 0:
+                self._despertar.wait(espera)
+                self._despertar.clear()
+                continue
+            try:
+                self.refresh()
+                estado.refreshes += 1
+            except Exception as e:
+                logger.error("Error renovando sesión: %s", e)
+                self._stop.wait(REINTENTO_LOGIN)
+
+    def stats(self):
+        stats = self._estado.stats()
+        if self._token_store is not None:
+            stats["token_store"] = self._token_store.stats()
+        return stats
+
+class AsyncSessionManager:
+    """Sesión httpx.AsyncClient compartida entre corutinas"""
+
+    def __init__(self, login_fn=autenticar_async, refresh_margin=None,
+                 fallback_ttl=None, token_store=None, desde_token=cliente_desde_token):
+        self._login_fn = login_fn
+        self._token_store = token_store
+        self._desde_token = desde_token
+        self._estado = _EstadoSesion(refresh_margin, fallback_ttl)
+        self._lock = asyncio.Lock()
+        self._despertar = asyncio.Event()
+        self._task = None
+
+    async def get(self):
+        """
+        Retornar (client, id_aliado), iniciando sesión si hace falta
+
+        Raises:
+            RuntimeError: si no se pudo iniciar sesión
+        """
+        estado = self._estado
+        now = time.time()
+        if estado.vigente(now) and (self._task or now < estado.refresh_at):
+            return estado.session, estado.id_aliado
+        return await self.refresh(generacion=estado.logins)
+
+    async def refresh(self, generacion=None, rechazado=False, forzar=False):
+        """Iniciar sesión de nuevo (ver SessionManager.refresh)"""
+        async with self._lock:
+            estado = self._estado
+            if generacion is not None and estado.logins != generacion and estado.vigente():
+                return estado.session, estado.id_aliado
+
+            if self._token_store is not None:
+                session, token_info = await self._token_store.autenticar_async(
+                    self._login_fn, self._desde_token,
+                    token_rechazado=estado.token if rechazado else None,
+                    forzar=forzar,
+                )
+            else:
+                session, token_info = await self._login_fn()
+            if not session:
+                estado.failures += 1
+                raise RuntimeError("No se pudo iniciar sesión en Calidda")
+
+            retirada = estado.instalar(session, token_info)
+            if retirada is not None:
+                await retirada.aclose()
+            self._despertar.set()
+            return session, estado.id_aliado
+
+    def invalidate(self):
+        """Forzar un login en la próxima llamada a get()"""
+        self._estado.expires_at = 0.0
+
+    async def consultar(self, dni):
+        """consultar_dni_async con re-login y un reintento si la sesión expiró (401)"""
+        if get_circuit().rechazo_rapido():
+            return resultado_circuito_abierto(dni)
+        with trace.medir('session'):
+            session, id_aliado = await self.get()
+        generacion = self._estado.logins
+        resultado = await consultar_dni_async(session, dni, id_aliado)
+        if resultado.estado is Estado.EXPIRED:
+            logger.warning("Sesión expirada - Reconectando...")
+            self._estado.expired_401 += 1
+            with trace.medir('session'):
+                session, id_aliado = await self.refresh(generacion=generacion, rechazado=True)
+            resultado = await consultar_dni_async(session, dni, id_aliado)
+        return resultado
+
+    def start(self):
+        """Iniciar la renovación del token en segundo plano (requiere event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._renovar())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _renovar(self):
+        while True:
+            estado = self._estado
+            # Sin sesión: esperar a que get() inicie la primera
+            espera = estado.refresh_at - time.time() if estado.session else None
+            if espera is None or espera > 0:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+                self._despertar.clear()
+                continue
+            try:
+                await self.refresh()
+                estado.refreshes += 1
+            except Exception as e:
+                logger.error("Error renovando sesión: %s", e)
+                await asyncio.sleep(REINTENTO_LOGIN)
+
+    def stats(self):
+        stats = self._estado.stats()
+        if self._token_store is not None:
+            stats["token_store"] = self._token_store.stats()
+        return stats
@@ -0,0 +1,159 @@
+"""
+Token de Calidda compartido entre procesos (workers de uvicorn, CLI)
+
+El token y el id_aliado se guardan en un archivo JSON protegido con un lock
+de archivo (fcntl.flock). Un solo proceso hace login; los demás reutilizan el
+token mientras le quede vida suficiente, así que los logins por hora no
+dependen del número de workers.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre intentos de tomar el lock sin bloquear el event loop
+_ESPERA_LOCK = 0.05
+
+class TokenStore:
+    """Archivo de token compartido con lock exclusivo para el login"""
+
+    def __init__(self, path, refresh_margin=None, fallback_ttl=None):
+        """refresh_margin / fallback_ttl: por defecto SESSION_REFRESH_MARGIN y SESSION_TTL"""
+        s = get_settings()
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.refresh_margin = s.SESSION_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self.fallback_ttl = s.SESSION_TTL if fallback_ttl is None else fallback_ttl
+        self.logins = 0
+        self.reusos = 0
+
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def _adquirir(self):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    async def _adquirir_async(self):
+        """
+        _adquirir sin bloquear el event loop ni un hilo
+
+        Se reintenta flock(LOCK_NB) con asyncio.sleep: si la corutina se cancela
+        mientras espera, no queda un hilo que tome el lock después sin liberarlo.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    await asyncio.sleep(_ESPERA_LOCK)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    @staticmethod
+    def _liberar(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    @contextmanager
+    def _bloqueo(self):
+        fd = self._adquirir()
+        try:
+            yield
+        finally:
+            self._liberar(fd)
+
+    def leer(self):
+        """Retornar el token_info guardado, o None si no existe o no se puede leer"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _escribir(self, token_info):
+        datos = dict(token_info)
+        datos['expires_at'] = float(token_info.get('exp') or time.time() + self.fallback_ttl)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(datos, f)
+        os.replace(tmp, self.path)
+
+    def _reutilizable(self, token_rechazado):
+        """token_info guardado si le queda más vida que refresh_margin y no fue rechazado"""
+        info = self.leer()
+        if not info or info.get('token') == token_rechazado:
+            return None
+        if info.get('expires_at', 0) - time.time() <= self.refresh_margin:
+            return None
+        return info
+
+    def autenticar(self, login_fn, desde_token, token_rechazado=None, forzar=False):
+        """
+        Obtener una sesión reutilizando el token compartido o haciendo login
+
+        Args:
+            login_fn: función de login que retorna (session, token_info)
+            desde_token: función que crea una sesión a partir de un token_info
+            token_rechazado: token que la API rechazó (401) o que está por vencer
+                en este proceso; no se reutiliza aunque siga en el archivo
+            forzar: hacer login aunque el token guardado siga vigente y
+                reemplazarlo (rotación cada MAX_CONSULTAS_POR_SESION)
+
+        Returns:
+            Tupla (session, token_info) o (None, None) si el login falla
+        """
+        with self._bloqueo():
+            info = None if forzar else self._reutilizable(token_rechazado)
+            if info is not None:
+                self.reusos += 1
+                logger.info("Reutilizando token compartido")
+                return desde_token(info), info
+
+            session, info = login_fn()
+            if session:
+                self.logins += 1
+                self._escribir(info)
+            return session, info
+
+    async def autenticar_async(self, login_fn, desde_token, token_rechazado=None, forzar=False):
+        """Versión asyncio de autenticar (ver _adquirir_async)"""
+        fd = await self._adquirir_async()
+        try:
+            info = None if forzar else self._reutilizable(token_rechazado)
+            if info is not None:
+                self.reusos += 1
+                logger.info("Reutilizando token compartido")
+                return desde_token(info), info
+
+            session, info = await login_fn()
+            if session:
+                self.logins += 1
+                self._escribir(info)
+            return session, info
+        finally:
+            self._liberar(fd)
+
+    def stats(self):
+        return {"path": self.path, "logins": self.logins, "reused": self.reusos}
+
+def crear_token_store():
+    """TokenStore configurado con TOKEN_STORE_PATH, o None si está desactivado"""
+    path = get_settings().TOKEN_STORE_PATH
+    if not path:
+        return None
+    return TokenStore(path)
@@ -0,0 +1,128 @@
+"""
+Capa de transporte HTTP hacia la API de Calidda
+
+Define una sola vez los headers del portal y crea los clientes HTTP con pools
+de conexiones configurables: requests.Session para el CLI y un httpx.AsyncClient
+compartido por todo el proceso para el wrapper (keep-alive y HTTP/2 opcional).
+Los callbacks salientes del wrapper usan otro httpx.AsyncClient, también con pool.
+
+requests y httpx se importan al crear el primer cliente: el CLI no carga httpx
+y el wrapper no carga requests.
+"""
+
+import asyncio
+import logging
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PORTAL_URL = 'https://appweb.calidda.com.pe'
+REFERER_LOGIN = f'{PORTAL_URL}/WebFNB/login'
+REFERER_CONSULTA = f'{PORTAL_URL}/WebFNB/consulta-credito'
+
+HEADERS = {
+    'accept': 'application/json, text/plain, */*',
+    'accept-language': 'es-419,es;q=0.9',
+    'content-type': 'application/json',
+    'origin': PORTAL_URL,
+    'referer': REFERER_LOGIN,
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+def crear_sesion():
+    """Crear una requests.Session con los headers del portal y pool de conexiones configurado"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=get_settings().HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+def _http2_disponible():
+    if not get_settings().HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2=true pero el paquete 'h2' no está instalado; se usa HTTP/1.1")
+        return False
+    return True
+
+_client = None
+
+def get_async_client():
+    """Retornar el cliente asíncrono compartido, creándolo si no existe"""
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+
+        s = get_settings()
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            http2=_http2_disponible(),
+            limits=httpx.Limits(
+                max_connections=s.HTTP_POOL_SIZE,
+                max_keepalive_connections=s.HTTP_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=s.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+_webhook_client = None
+
+def get_webhook_client():
+    """
+    Retornar el cliente asíncrono para llamadas salientes a otros servicios
+    (callbacks de trabajos, API de Chatwoot), sin los headers del portal y con
+    su propio pool
+    """
+    global _webhook_client
+    if _webhook_client is None or _webhook_client.is_closed:
+        import httpx
+
+        s = get_settings()
+        _webhook_client = httpx.AsyncClient(
+            timeout=s.CALLBACK_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=s.HTTP_POOL_SIZE,
+                max_keepalive_connections=s.HTTP_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=s.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _webhook_client
+
+async def close_async_client():
+    """Cerrar los clientes compartidos (al apagar el servicio)"""
+    global _client, _webhook_client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _webhook_client is not None:
+        await _webhook_client.aclose()
+        _webhook_client = None
+
+async def calentar_conexiones(n=None):
+    """
+    Abrir n conexiones keep-alive hacia BASE_URL (DNS + TCP + TLS) antes de
+    recibir tráfico (por defecto HTTP_WARM_CONNECTIONS)
+
+    Returns:
+        Número de conexiones que respondieron
+    """
+    s = get_settings()
+    if n is None:
+        n = s.HTTP_WARM_CONNECTIONS
+    client = get_async_client()
+
+    async def abrir():
+        await client.head(s.BASE_URL, timeout=s.QUICK_TIMEOUT)
+
+    resultados = await asyncio.gather(*(abrir() for _ in range(n)), return_exceptions=True)
+    errores = [r for r in resultados if isinstance(r, Exception)]
+    for error in errores[:1]:
+        logger.warning("No se pudo precalentar conexión a %s: %s", s.BASE_URL, error)
+    return n - len(errores)
@@ -1,102 +1,355 @@
 #!/usr/bin/env python3
 """
 Configuración del extractor - Carga desde .env
+
+Importar este módulo no tiene efectos secundarios: el .env se lee, se valida y
+se guarda en caché la primera vez que se llama a get_settings() (o se accede a
+un atributo como config.TIMEOUT). Así los módulos que no necesitan credenciales
+(por ejemplo utils.messages) se pueden importar sin .env.
 """
 
 import os
-from dotenv import load_dotenv
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from pathlib import Path
 
-# Cargar variables de entorno desde .env
-env_path = Path('.') / '.env'
-load_dotenv(dotenv_path=env_path)
-
-# Verificar que existe el archivo .env
-if not env_path.exists():
-    raise FileNotFoundError(
-        "❌ Archivo .env no encontrado.\n"
-        "   Copia .env.example a .env y configura tus credenciales:\n"
-        "   cp .env.example .env"
-    )
-
-# ========== CREDENCIALES ==========
-USUARIO = os.getenv('CALIDDA_USUARIO')
-PASSWORD = os.getenv('CALIDDA_PASSWORD')
-
-if not USUARIO or not PASSWORD:
-    raise ValueError(
-        "❌ Credenciales no configuradas.\n"
-        "   Verifica que CALIDDA_USUARIO y CALIDDA_PASSWORD estén en .env"
-    )
-
-# ========== URLs ==========
-BASE_URL = os.getenv('BASE_URL', 'https://appweb.calidda.com.pe')
-LOGIN_API = BASE_URL + os.getenv('LOGIN_API', '/FNB_Services/api/Seguridad/autenticar')
-CONSULTA_API = BASE_URL + os.getenv('CONSULTA_API', '/FNB_Services/api/financiamiento/lineaCredito')
-
-# ========== CONFIGURACIÓN DE SEGURIDAD ==========
-DELAY_MIN = float(os.getenv('DELAY_MIN', '10'))
-DELAY_MAX = float(os.getenv('DELAY_MAX', '207'))
-TIMEOUT = int(os.getenv('TIMEOUT', '300'))  # Tiempo máximo para consultas exitosas
-QUICK_TIMEOUT = int(os.getenv('QUICK_TIMEOUT', '30'))  # Tiempo para verificación rápida
-MAX_CONSULTAS_POR_SESION = int(os.getenv('MAX_CONSULTAS_POR_SESION', '50'))
-
-# ========== DIRECTORIOS ==========
-OUTPUT_DIR = os.getenv('OUTPUT_DIR', 'consultas_credito')
-DNIS_FILE = os.getenv('DNIS_FILE', 'lista_dnis.txt')
-
-# ========== LOGGING ==========
-LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-LOG_FILE = os.getenv('LOG_FILE', 'logs/extractor.log')
-
-# Crear directorio de logs si no existe
-Path('logs').mkdir(exist_ok=True)
+ENV_PATH = Path('.') / '.env'
+
+@dataclass(frozen=True)
+class Settings:
+    """Valores de configuración leídos de las variables de entorno"""
+
+    # ========== CREDENCIALES ==========
+    USUARIO: str
+    PASSWORD: str
+
+    # ========== URLs ==========
+    BASE_URL: str
+    LOGIN_API: str
+    CONSULTA_API: str
+
+    # ========== CONFIGURACIÓN DE SEGURIDAD ==========
+    DELAY_MIN: float
+    DELAY_MAX: float
+    TIMEOUT: int  # Tiempo máximo para consultas exitosas
+    QUICK_TIMEOUT: int  # Tiempo para verificación rápida
+    MAX_CONSULTAS_POR_SESION: int
+    # Pausa tras un 429/403 cuando la API no envía Retry-After
+    RATE_LIMIT_PAUSE: int
+
+    # ========== REGULADOR DE LLAMADAS (token bucket adaptativo) ==========
+    # Límites de la tasa (llamadas/s) del wrapper. El CLI no los usa: su tasa se
+    # mueve entre 1/DELAY_MAX y 1/DELAY_MIN (ver api.governor.usar_ritmo_cli)
+    GOVERNOR_RATE_MIN: float
+    GOVERNOR_RATE_MAX: float
+    GOVERNOR_RATE_INICIAL: float
+    # Llamadas que pueden salir seguidas sin esperar
+    GOVERNOR_BURST: int
+    # Factor multiplicativo ante un 429 y llamadas/s que se suman por cada éxito
+    GOVERNOR_BACKOFF: float
+    GOVERNOR_INCREMENTO: float
+
+    # ========== CIRCUIT BREAKER ==========
+    # Fallas seguidas (timeout, 5xx, 403, error de red) que abren el circuito
+    CIRCUIT_FAILURE_THRESHOLD: int
+    # Segundos que el circuito queda abierto antes de enviar llamadas de prueba
+    CIRCUIT_OPEN_SECONDS: int
+    # Llamadas de prueba simultáneas en estado half-open
+    CIRCUIT_HALF_OPEN_PROBES: int
+
+    # Consultas simultáneas a Calidda en POST /query/batch y máximo de DNIs por lote
+    BATCH_CONCURRENCY: int
+    BATCH_MAX_DNIS: int
+    # Modo de consulta: 'probe' = consulta rápida + consulta completa (comportamiento original),
+    # 'single' = una sola consulta clasificada al llegar
+    LOOKUP_MODE: str
+
+    # Parsear las respuestas y serializar las del wrapper con orjson
+    # (paquete 'orjson', incluido en requirements.txt)
+    FAST_JSON: bool
+
+    # ========== PLANIFICADOR (api_wrapper) ==========
+    # Consultas a Calidda en curso como máximo, sumando interactivas y masivas
+    UPSTREAM_CONCURRENCY: int
+    # Consultas interactivas (/query) atendidas por cada masiva (lote, refrescos) cuando ambas esperan
+    SCHEDULER_INTERACTIVE_WEIGHT: int
+
+    # ========== TRABAJOS ASÍNCRONOS (POST /query en modo async) ==========
+    # Workers que ejecutan los trabajos y máximo de trabajos esperando en cola
+    JOB_WORKERS: int
+    JOB_QUEUE_MAX: int
+    # Segundos que un trabajo terminado (y su resultado) se conserva para GET /jobs/{id}
+    JOB_TTL: int
+    # Timeout e intentos de entrega del resultado al callback_url
+    CALLBACK_TIMEOUT: int
+    CALLBACK_RETRIES: int
+    # Hosts aceptados en callback_url ('.dominio' acepta también sus subdominios).
+    # Vacío = callback_url rechazado (el resultado solo se consulta en GET /jobs/{id})
+    CALLBACK_ALLOWED_HOSTS: tuple
+
+    # ========== CHATWOOT (POST /webhooks/chatwoot) ==========
+    # URL base de Chatwoot y token de API del agente/bot que responde (vacío = desactivado)
+    CHATWOOT_URL: str
+    CHATWOOT_API_TOKEN: str
+    # Secreto que Chatwoot envía como ?token= en la URL del webhook (obligatorio con CHATWOOT_URL)
+    CHATWOOT_WEBHOOK_TOKEN: str
+
+    # ========== TRANSPORTE HTTP ==========
+    # Conexiones máximas hacia Calidda y cuántas se mantienen abiertas (keep-alive)
+    HTTP_POOL_SIZE: int
+    HTTP_KEEPALIVE_CONNECTIONS: int
+    # Segundos que una conexión ociosa se mantiene abierta
+    HTTP_KEEPALIVE_EXPIRY: float
+    # HTTP/2 para el cliente asíncrono (requiere el paquete 'h2')
+    HTTP2: bool
+    # Conexiones que el wrapper abre al arrancar
+    HTTP_WARM_CONNECTIONS: int
+
+    # ========== SESIÓN ==========
+    # Vida de la sesión cuando el token no trae 'exp'
+    SESSION_TTL: int
+    # Segundos antes del 'exp' del token en que se renueva en segundo plano
+    SESSION_REFRESH_MARGIN: int
+    # Archivo donde los workers comparten el token (vacío = cada proceso hace su login)
+    TOKEN_STORE_PATH: str
+
+    # ========== CACHE DE RESULTADOS (api_wrapper) ==========
+    CACHE_MAX_ENTRIES: int
+    # TTL en segundos por tipo de resultado (0 = no cachear)
+    CACHE_TTL_SUCCESS: int
+    CACHE_TTL_SIN_CREDITO: int
+    CACHE_TTL_NO_ENCONTRADO: int
+    # Ventana en que un resultado vencido se devuelve mientras se refresca en segundo plano
+    CACHE_STALE_TTL: int
+
+    # ========== DIRECTORIOS ==========
+    OUTPUT_DIR: str
+    DNIS_FILE: str
+
+    # ========== ALMACÉN DE RESULTADOS ==========
+    # 'memory' = cache por proceso, 'sqlite' = compartido entre workers y reinicios
+    RESULT_STORE: str
+    # Por defecto OUTPUT_DIR/resultados.sqlite3
+    RESULT_STORE_PATH: str
+
+    # ========== ÍNDICE DE DNIS VISTOS ==========
+    # Bitmap de DNIs consultados / no encontrados / con oferta (vacío = desactivado)
+    DNI_INDEX_PATH: str
+    # Cada cuántos segundos se guarda el índice si cambió
+    DNI_INDEX_SAVE_SECONDS: int
+
+    # ========== LOGGING ==========
+    LOG_LEVEL: str
+    # Archivo de log relativo al directorio raíz (vacío = solo consola)
+    LOG_FILE: str
+    # 'json' = una línea JSON por registro, 'text' = formato legible
+    LOG_FORMAT: str
+    # Tamaño en bytes a partir del cual LOG_FILE rota y archivos rotados que se conservan
+    LOG_MAX_BYTES: int
+    LOG_BACKUP_COUNT: int
+
+    # ========== PERFILADO Y ADMINISTRACIÓN (api_wrapper) ==========
+    # Fracción de solicitudes /query perfiladas con cProfile (0 = desactivado)
+    PROFILE_SAMPLE_RATE: float
+    # Token del header X-Admin-Token para /admin/* (vacío = endpoints desactivados)
+    ADMIN_TOKEN: str
+
+    @classmethod
+    def from_env(cls, env=None):
+        """Construir la configuración a partir de un mapping (por defecto os.environ)"""
+        env = os.environ if env is None else env
+
+        base_url = env.get('BASE_URL', 'https://appweb.calidda.com.pe')
+        delay_min = float(env.get('DELAY_MIN', '10'))
+        delay_max = float(env.get('DELAY_MAX', '207'))
+        rate_min = float(env.get('GOVERNOR_RATE_MIN', '0.2'))
+        rate_max = float(env.get('GOVERNOR_RATE_MAX', '20'))
+
+        return cls(
+            USUARIO=env.get('CALIDDA_USUARIO'),
+            PASSWORD=env.get('CALIDDA_PASSWORD'),
+            BASE_URL=base_url,
+            LOGIN_API=base_url + env.get('LOGIN_API', '/FNB_Services/api/Seguridad/autenticar'),
+            CONSULTA_API=base_url + env.get('CONSULTA_API', '/FNB_Services/api/financiamiento/lineaCredito'),
+            DELAY_MIN=delay_min,
+            DELAY_MAX=delay_max,
+            TIMEOUT=int(env.get('TIMEOUT', '300')),
+            QUICK_TIMEOUT=int(env.get('QUICK_TIMEOUT', '30')),
+            MAX_CONSULTAS_POR_SESION=int(env.get('MAX_CONSULTAS_POR_SESION', '50')),
+            RATE_LIMIT_PAUSE=int(env.get('RATE_LIMIT_PAUSE', '60')),
+            GOVERNOR_RATE_MIN=rate_min,
+            GOVERNOR_RATE_MAX=rate_max,
+            GOVERNOR_RATE_INICIAL=float(env.get('GOVERNOR_RATE_INICIAL', str(rate_max))),
+            GOVERNOR_BURST=int(env.get('GOVERNOR_BURST', '3')),
+            GOVERNOR_BACKOFF=float(env.get('GOVERNOR_BACKOFF', '0.5')),
+            GOVERNOR_INCREMENTO=float(env.get(
+                'GOVERNOR_INCREMENTO', str((rate_max - rate_min) / 20)
+            )),
+            CIRCUIT_FAILURE_THRESHOLD=int(env.get('CIRCUIT_FAILURE_THRESHOLD', '5')),
+            CIRCUIT_OPEN_SECONDS=int(env.get('CIRCUIT_OPEN_SECONDS', '60')),
+            CIRCUIT_HALF_OPEN_PROBES=int(env.get('CIRCUIT_HALF_OPEN_PROBES', '1')),
+            BATCH_CONCURRENCY=int(env.get('BATCH_CONCURRENCY', '2')),
+            BATCH_MAX_DNIS=int(env.get('BATCH_MAX_DNIS', '500')),
+            LOOKUP_MODE=env.get('LOOKUP_MODE', 'probe').lower(),
+            FAST_JSON=env.get('FAST_JSON', 'true').lower() in ('1', 'true', 'yes'),
+            UPSTREAM_CONCURRENCY=int(env.get('UPSTREAM_CONCURRENCY', '8')),
+            SCHEDULER_INTERACTIVE_WEIGHT=int(env.get('SCHEDULER_INTERACTIVE_WEIGHT', '4')),
+            JOB_WORKERS=int(env.get('JOB_WORKERS', '4')),
+            JOB_QUEUE_MAX=int(env.get('JOB_QUEUE_MAX', '1000')),
+            JOB_TTL=int(env.get('JOB_TTL', '3600')),
+            CALLBACK_TIMEOUT=int(env.get('CALLBACK_TIMEOUT', '10')),
+            CALLBACK_RETRIES=int(env.get('CALLBACK_RETRIES', '3')),
+            CALLBACK_ALLOWED_HOSTS=tuple(
+                h.strip().lower() for h in env.get('CALLBACK_ALLOWED_HOSTS', '').split(',') if h.strip()
+            ),
+            CHATWOOT_URL=env.get('CHATWOOT_URL', '').rstrip('/'),
+            CHATWOOT_API_TOKEN=env.get('CHATWOOT_API_TOKEN', ''),
+            CHATWOOT_WEBHOOK_TOKEN=env.get('CHATWOOT_WEBHOOK_TOKEN', ''),
+            HTTP_POOL_SIZE=int(env.get('HTTP_POOL_SIZE', '20')),
+            HTTP_KEEPALIVE_CONNECTIONS=int(env.get('HTTP_KEEPALIVE_CONNECTIONS', '10')),
+            HTTP_KEEPALIVE_EXPIRY=float(env.get('HTTP_KEEPALIVE_EXPIRY', '60')),
+            HTTP2=env.get('HTTP2', 'false').lower() in ('1', 'true', 'yes'),
+            HTTP_WARM_CONNECTIONS=int(env.get('HTTP_WARM_CONNECTIONS', '2')),
+            SESSION_TTL=int(env.get('CALIDDA_SESSION_TTL', str(60 * 60))),
+            SESSION_REFRESH_MARGIN=int(env.get('SESSION_REFRESH_MARGIN', '300')),
+            TOKEN_STORE_PATH=env.get('TOKEN_STORE_PATH', ''),
+            CACHE_MAX_ENTRIES=int(env.get('CACHE_MAX_ENTRIES', '10000')),
+            CACHE_TTL_SUCCESS=int(env.get('CACHE_TTL_SUCCESS', '3600')),
+            CACHE_TTL_SIN_CREDITO=int(env.get('CACHE_TTL_SIN_CREDITO', '21600')),
+            CACHE_TTL_NO_ENCONTRADO=int(env.get('CACHE_TTL_NO_ENCONTRADO', '86400')),
+            CACHE_STALE_TTL=int(env.get('CACHE_STALE_TTL', '0')),
+            OUTPUT_DIR=env.get('OUTPUT_DIR', 'consultas_credito'),
+            DNIS_FILE=env.get('DNIS_FILE', 'lista_dnis.txt'),
+            RESULT_STORE=env.get('RESULT_STORE', 'memory').lower(),
+            RESULT_STORE_PATH=env.get('RESULT_STORE_PATH', ''),
+            DNI_INDEX_PATH=env.get('DNI_INDEX_PATH', ''),
+            DNI_INDEX_SAVE_SECONDS=int(env.get('DNI_INDEX_SAVE_SECONDS', '60')),
+            LOG_LEVEL=env.get('LOG_LEVEL', 'INFO'),
+            LOG_FILE=env.get('LOG_FILE', 'logs/extractor.log'),
+            LOG_FORMAT=env.get('LOG_FORMAT', 'json').lower(),
+            LOG_MAX_BYTES=int(env.get('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            LOG_BACKUP_COUNT=int(env.get('LOG_BACKUP_COUNT', '5')),
+            PROFILE_SAMPLE_RATE=float(env.get('PROFILE_SAMPLE_RATE', '0')),
+            ADMIN_TOKEN=env.get('ADMIN_TOKEN', ''),
+        )
+
+@lru_cache(maxsize=1)
+def get_settings():
+    """
+    Cargar .env (si existe), leer y validar la configuración una sola vez
+
+    Las variables ya definidas en el entorno tienen prioridad sobre el .env,
+    así que en contenedores el archivo es opcional.
+
+    Raises:
+        ValueError: si la configuración no es válida o faltan credenciales
+    """
+    if ENV_PATH.exists():
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=ENV_PATH)
+
+    settings = Settings.from_env()
+    validar_configuracion(settings)
+    return settings
+
+_CAMPOS = frozenset(f.name for f in fields(Settings))
+
+def __getattr__(nombre):
+    # Compatibilidad con config.TIMEOUT / from src.config import TIMEOUT
+    if nombre in _CAMPOS:
+        return getattr(get_settings(), nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 # ========== VALIDACIÓN ==========
-def validar_configuracion():
+def validar_configuracion(settings=None):
     """Validar que la configuración es correcta"""
+    s = settings or get_settings()
     errores = []
-    
-    if not USUARIO:
-        errores.append("CALIDDA_USUARIO no configurado")
-    
-    if not PASSWORD:
-        errores.append("CALIDDA_PASSWORD no configurado")
-    
-    if DELAY_MIN > DELAY_MAX:
+
+    if not s.USUARIO or not s.PASSWORD:
+        faltantes = [n for n, v in (('CALIDDA_USUARIO', s.USUARIO), ('CALIDDA_PASSWORD', s.PASSWORD)) if not v]
+        errores.extend(f"{n} no configurado" for n in faltantes)
+        if not ENV_PATH.exists():
+            errores.append("Archivo .env no encontrado: cp .env.example .env")
+
+    if s.DELAY_MIN > s.DELAY_MAX:
         errores.append("DELAY_MIN no puede ser mayor que DELAY_MAX")
-    
-    if TIMEOUT < 5:
+
+    if s.TIMEOUT < 5:
         errores.append("TIMEOUT debe ser al menos 5 segundos")
-    
+
+    if not 0 < s.GOVERNOR_RATE_MIN <= s.GOVERNOR_RATE_INICIAL <= s.GOVERNOR_RATE_MAX:
+        errores.append("Se requiere 0 < GOVERNOR_RATE_MIN <= GOVERNOR_RATE_INICIAL <= GOVERNOR_RATE_MAX")
+
+    if not 0 < s.GOVERNOR_BACKOFF < 1:
+        errores.append("GOVERNOR_BACKOFF debe estar entre 0 y 1")
+
+    if s.GOVERNOR_BURST < 1:
+        errores.append("GOVERNOR_BURST debe ser al menos 1")
+
+    if s.CIRCUIT_FAILURE_THRESHOLD < 1 or s.CIRCUIT_HALF_OPEN_PROBES < 1:
+        errores.append("CIRCUIT_FAILURE_THRESHOLD y CIRCUIT_HALF_OPEN_PROBES deben ser al menos 1")
+
+    if s.BATCH_CONCURRENCY < 1:
+        errores.append("BATCH_CONCURRENCY debe ser al menos 1")
+
+    if s.UPSTREAM_CONCURRENCY < 1 or s.SCHEDULER_INTERACTIVE_WEIGHT < 1:
+        errores.append("UPSTREAM_CONCURRENCY y SCHEDULER_INTERACTIVE_WEIGHT deben ser al menos 1")
+
+    if s.JOB_WORKERS < 1 or s.JOB_QUEUE_MAX < 1 or s.CALLBACK_RETRIES < 1:
+        errores.append("JOB_WORKERS, JOB_QUEUE_MAX y CALLBACK_RETRIES deben ser al menos 1")
+
+    if s.CHATWOOT_URL and not (s.CHATWOOT_API_TOKEN and s.CHATWOOT_WEBHOOK_TOKEN):
+        errores.append("CHATWOOT_API_TOKEN y CHATWOOT_WEBHOOK_TOKEN son obligatorios si se configura CHATWOOT_URL")
+
+    if s.CACHE_MAX_ENTRIES < 1:
+        errores.append("CACHE_MAX_ENTRIES debe ser al menos 1")
+
+    if s.RESULT_STORE not in ('memory', 'sqlite'):
+        errores.append("RESULT_STORE debe ser 'memory' o 'sqlite'")
+
+    if not 0 <= s.PROFILE_SAMPLE_RATE <= 1:
+        errores.append("PROFILE_SAMPLE_RATE debe estar entre 0 y 1")
+
+    if s.DNI_INDEX_SAVE_SECONDS < 1:
+        errores.append("DNI_INDEX_SAVE_SECONDS debe ser al menos 1")
+
+    if s.LOG_FORMAT not in ('json', 'text'):
+        errores.append("LOG_FORMAT debe ser 'json' o 'text'")
+
+    if s.LOOKUP_MODE not in ('probe', 'single'):
+        errores.append("LOOKUP_MODE debe ser 'probe' o 'single'")
+
     if errores:
         raise ValueError(
             "❌ Errores de configuración:\n" +
             "\n".join(f"   - {e}" for e in errores)
         )
-    
-    return True
 
-# Validar al importar
-validar_configuracion()
+    return True
 
 # Función para mostrar configuración (sin credenciales)
 def mostrar_config():
     """Mostrar configuración actual (sin credenciales)"""
+    s = get_settings()
     print("=" * 70)
     print("⚙️  CONFIGURACIÓN")
     print("=" * 70)
-    print(f"Usuario: {USUARIO}")
-    print(f"Password: {'*' * len(PASSWORD or '')}")
-    print(f"\nBase URL: {BASE_URL}")
-    print(f"Login API: {LOGIN_API}")
-    print(f"Consulta API: {CONSULTA_API}")
-    print(f"\nDelay: {DELAY_MIN}-{DELAY_MAX} segundos")
-    print(f"Timeout: {TIMEOUT} segundos")
-    print(f"Max consultas/sesión: {MAX_CONSULTAS_POR_SESION}")
-    print(f"\nOutput: {OUTPUT_DIR}")
-    print(f"DNIs file: {DNIS_FILE}")
-    print(f"Log file: {LOG_FILE}")
+    print(f"Usuario: {s.USUARIO}")
+    print(f"Password: {'*' * len(s.PASSWORD or '')}")
+    print(f"\nBase URL: {s.BASE_URL}")
+    print(f"Login API: {s.LOGIN_API}")
+    print(f"Consulta API: {s.CONSULTA_API}")
+    print(f"\nDelay: {s.DELAY_MIN}-{s.DELAY_MAX} segundos")
+    print(f"Regulador CLI y /query/batch: {1 / max(s.DELAY_MAX, 0.001):.3f}-{1 / max(s.DELAY_MIN, 0.001):.3f} llamadas/s")
+    print(f"Regulador wrapper: {s.GOVERNOR_RATE_MIN:.3f}-{s.GOVERNOR_RATE_MAX:.3f} llamadas/s (burst {s.GOVERNOR_BURST})")
+    print(f"Timeout: {s.TIMEOUT} segundos")
+    print(f"Modo de consulta: {s.LOOKUP_MODE}")
+    print(f"Max consultas/sesión: {s.MAX_CONSULTAS_POR_SESION}")
+    print(f"\nOutput: {s.OUTPUT_DIR}")
+    print(f"DNIs file: {s.DNIS_FILE}")
+    print(f"Result store: {s.RESULT_STORE}")
+    print(f"Índice de DNIs: {s.DNI_INDEX_PATH or 'desactivado'}")
+    print(f"Log file: {s.LOG_FILE}")
     print("=" * 70)
     print()
-
@@ -3,44 +3,42 @@
 Consulta líneas de crédito en portal Calidda usando credenciales de FNB
 """
 
+import argparse
 import logging
+import os
 import random
-import time
-from pathlib import Path
-
 import sys
+import time
+from contextlib import nullcontext
 from pathlib import Path
 
-# Agregar el directorio src al path de Python
 root_dir = Path(__file__).parent.parent
-src_dir = Path(__file__).parent
-sys.path.insert(0, str(root_dir))
-sys.path.insert(0, str(src_dir))
-
-from config import (
-    DELAY_MIN, DELAY_MAX, MAX_CONSULTAS_POR_SESION,
-    LOG_FILE, LOG_LEVEL, mostrar_config
-)
-from api.auth import login
-from api.client import consultar_dni
-from utils.messages import mostrar_resultado
+if __package__ in (None, ''):
+    # Ejecutado como 'python src/main.py': hacer importable el paquete src
+    sys.path.insert(0, str(root_dir))
 
-# ========== CONFIGURAR LOGGING ==========
-# Asegurar que la ruta del log sea relativa al directorio raíz
-log_path = Path(root_dir) / LOG_FILE
+from src.config import get_settings, mostrar_config
+from src.api.session import SessionManager
+from src.api.token_store import crear_token_store
+from src.api.governor import get_governor, usar_ritmo_cli
+from src.api.circuit import get_circuit
+from src.utils.messages import mostrar_resultado
+from src.api.resultado import Estado
+from src.utils.trace import Traza
+from src.utils.lote import leer_dnis, contar_dnis, Checkpoint, ResultadosJSONL, Progreso
+from src.utils.store import crear_result_store
+from src.utils.indice import crear_indice_dni
+from src.utils.logs import configurar_logging
+from src.utils.perfil import perfilar_sesion
 
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_path, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def main():
-    """Función principal"""
+def main(verbose=False):
+    """
+    Función principal
+
+    verbose: mostrar el tiempo de cada fase de la consulta
+    """
     print("\n")
     print("🚀 EXTRACTOR DE LÍNEAS DE CRÉDITO - CALIDDA")
     print("   Versión segura con credenciales en .env")
@@ -55,89 +53,332 @@ def main():
     print("=" * 70)
     print()
     
-    session, id_aliado = login()
-    
-    if not session:
+    sesiones = SessionManager(token_store=crear_token_store())
+    # DNIs ya encontrados como "no encontrado" se responden sin consultar a Calidda
+    indice = crear_indice_dni()
+    try:
+        sesiones.get()
+    except RuntimeError:
         logger.error("No se pudo iniciar sesión")
         return
     
+    # Renovar el token antes de que venza mientras se espera input
+    sesiones.start()
+    
     print(f"\n✅ Sesión iniciada correctamente\n")
+    max_consultas = get_settings().MAX_CONSULTAS_POR_SESION
+    intervalo_indice = get_settings().DNI_INDEX_SAVE_SECONDS
     consultas_sesion = 0
     
-    # Bucle principal de consultas
-    while True:
-        dni = input("\nIngrese el DNI a consultar (o 'q' para salir): ").strip()
+    try:
+        # Bucle principal de consultas
+        while True:
+            dni = input("\nIngrese el DNI a consultar (o 'q' para salir): ").strip()
         
-        if dni.lower() == 'q':
-            print("\n✅ Programa finalizado")
-            return
+            if dni.lower() == 'q':
+                print("\n✅ Programa finalizado")
+                return
             
-        # Validar que sea un DNI válido (8 dígitos)
-        if not dni.isdigit() or len(dni) != 8:
-            print("❌ DNI inválido. Debe contener 8 dígitos numéricos")
-            continue
-    
-        # Reconectar si es necesario
-        if consultas_sesion >= MAX_CONSULTAS_POR_SESION:
-            logger.info("Reconectando...")
-            time.sleep(random.uniform(10, 20))
-            session, id_aliado = login()
-            if not session:
-                logger.error("Error al reconectar")
+            # Validar que sea un DNI válido (8 dígitos)
+            if not dni.isdigit() or len(dni) != 8:
+                print("❌ DNI inválido. Debe contener 8 dígitos numéricos")
                 continue
-            consultas_sesion = 0
+    
+            # Reconectar si es necesario
+            if consultas_sesion >= max_consultas:
+                logger.info("Reconectando...")
+                time.sleep(random.uniform(10, 20))
+                try:
+                    sesiones.refresh(forzar=True)
+                except RuntimeError:
+                    logger.error("Error al reconectar")
+                    continue
+                consultas_sesion = 0
+        
+            print("\n" + "=" * 70)
+            print("📋 PROCESANDO CONSULTA")
+            print("=" * 70)
+            print(f"\nConsultando DNI: {dni}")
         
-        print("\n" + "=" * 70)
-        print("📋 PROCESANDO CONSULTA")
-        print("=" * 70)
-        print(f"\nConsultando DNI: {dni}")
+            # Si la sesión expiró (401), el manager reconecta y reintenta una vez
+            traza = Traza()
+            resultado = indice.resultado_conocido(dni) if indice else None
+            if resultado is None:
+                try:
+                    with traza.activa():
+                        resultado = sesiones.consultar(dni)
+                except RuntimeError:
+                    logger.error("Error al reconectar")
+                    continue
+                consultas_sesion += 1
+                if indice:
+                    indice.registrar(dni, resultado)
+                    indice.guardar_si_cambio(intervalo_indice)
+            estado = resultado.estado
         
-        data, estado, mensaje_api = consultar_dni(session, dni, id_aliado)
-        consultas_sesion += 1
+            # ========== CASO 1: DNI VÁLIDO CON DATOS ==========
+            if resultado.exito and resultado.cliente.id:
+                with traza.activa():
+                    mostrar_resultado(dni, resultado)
         
-        # ========== CASO 1: DNI VÁLIDO CON DATOS ==========
-        if estado == 'success' and data and data.get('id'):
-            mostrar_resultado(dni, data, estado, mensaje_api)
+            # ========== CASO 2: DNI NO VÁLIDO O SIN DATOS ==========
+            elif estado is Estado.INVALID:
+                with traza.activa():
+                    mostrar_resultado(dni, resultado)
         
-        # ========== CASO 2: DNI NO VÁLIDO O SIN DATOS ==========
-        elif estado.startswith('invalid:'):
-            mostrar_resultado(dni, data, estado, mensaje_api)
+            # ========== CASO 3: SESIÓN EXPIRADA (también tras reconectar) ==========
+            elif estado is Estado.EXPIRED:
+                logger.warning("Sesión expirada tras reconectar")
+                print("⚠️ Sesión expirada - Intente nuevamente")
+                sesiones.invalidate()
         
-        # ========== CASO 3: SESIÓN EXPIRADA ==========
-        elif estado == 'expired':
-            logger.warning("Sesión expirada - Reconectando...")
-            print("⚠️ Sesión expirada - Reconectando...")
-            session, id_aliado = login()
-            if session:
-                data, estado, mensaje_api = consultar_dni(session, dni, id_aliado)
-                mostrar_resultado(dni, data, estado, mensaje_api)
+            # ========== CASO 4: RATE LIMIT ==========
+            elif estado is Estado.RATE_LIMIT:
+                # El regulador ya redujo la tasa y pausará la siguiente consulta
+                logger.warning("RATE LIMIT - Reduciendo velocidad de consultas")
+                print(f"⚠️ RATE LIMIT - La siguiente consulta esperará {get_governor().pausa_restante():.0f}s")
         
-        # ========== CASO 4: RATE LIMIT ==========
-        elif estado == 'rate_limit':
-            logger.warning("RATE LIMIT - Esperando 60 segundos...")
-            print(f"⚠️ RATE LIMIT - Esperando 60s...")
-            time.sleep(60)
-            continue
+            # ========== CASO 5: BLOQUEADO ==========
+            elif estado is Estado.BLOCKED:
+                logger.error("ACCESO BLOQUEADO")
+                print("🚨 ACCESO BLOQUEADO")
+                print("El programa se cerrará...")
+                return
         
-        # ========== CASO 5: BLOQUEADO ==========
-        elif estado == 'blocked':
-            logger.error("ACCESO BLOQUEADO")
-            print("🚨 ACCESO BLOQUEADO")
-            print("El programa se cerrará...")
-            return
+            # ========== CASO 6: API CAÍDA (CIRCUIT BREAKER ABIERTO) ==========
+            elif estado is Estado.CIRCUIT_OPEN:
+                print(f"\n⚠️ {resultado.mensaje}. Reintente en {get_circuit().restante():.0f}s")
         
-        # ========== CASO 6: TIMEOUT ==========
-        elif estado == 'timeout':
-            print(f"\n❌ Error: {mensaje_api}")
-            print("Por favor, inténtelo nuevamente.")
+            # ========== CASO 7: TIMEOUT ==========
+            elif estado is Estado.TIMEOUT:
+                print(f"\n❌ Error: {resultado.mensaje}")
+                print("Por favor, inténtelo nuevamente.")
         
-        # Delay entre consultas
-        delay = random.uniform(DELAY_MIN, DELAY_MAX)
-        print(f"\nEsperando {delay:.1f}s antes de la siguiente consulta...")
+            if verbose:
+                print(f"⏱️  {traza.texto()}")
+    finally:
+        # Los DNIs de la sesión se guardan al salir (q, bloqueo o Ctrl+C)
+        if indice:
+            indice.guardar_si_cambio(0)
+
+    
+# Consultas por DNI que puede fallar de forma pasajera (timeout, 5xx, error de
+# red) antes de detener el lote sin avanzar el checkpoint
+REINTENTOS_LOTE = 3
+
+def mensaje_detencion(estado):
+    return 'acceso bloqueado' if estado is Estado.BLOCKED else 'sesión rechazada tras reconectar'
+
+def main_lote(ruta_dnis, desde_cero=False, verbose=False, solo_nuevos=False):
+    """
+    Procesar un archivo de DNIs sin interacción, reanudando desde el checkpoint
+
+    solo_nuevos: no volver a consultar los DNIs que el índice ya tiene como consultados
+    """
+    print("\n")
+    print("🚀 EXTRACTOR DE LÍNEAS DE CRÉDITO - CALIDDA (modo lote)")
+    print()
+    
+    mostrar_config()
     
+    if not Path(ruta_dnis).exists():
+        logger.error("Archivo de DNIs no encontrado: %s", ruta_dnis)
+        return
+    
+    settings = get_settings()
+    output_dir = settings.OUTPUT_DIR
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(output_dir, 'checkpoint.json'), ruta_dnis).cargar()
+    if desde_cero:
+        checkpoint.reiniciar()
+    elif checkpoint.procesados:
+        print(f"↪️  Reanudando lote: {checkpoint.procesados} DNIs ya procesados\n")
+    
+    progreso = Progreso(contar_dnis(ruta_dnis, checkpoint.offset))
+    if not progreso.total:
+        print("✅ No hay DNIs pendientes")
+        return
+    
+    store = crear_result_store()
+    indice = crear_indice_dni()
+    resultados = ResultadosJSONL(os.path.join(output_dir, 'resultados.jsonl'))
+    sesiones = SessionManager(token_store=crear_token_store())
+    governor = get_governor()
+    circuit = get_circuit()
+    consultas_sesion = 0
+    consultas_upstream = 0
+    
+    try:
+        for dni, offset in leer_dnis(ruta_dnis, checkpoint.offset):
+            if not dni.isdigit() or len(dni) != 8:
+                logger.warning("DNI inválido en archivo: %s", dni)
+                resultados.escribir(dni, estado='dni_invalido', mensaje='DNI inválido', data=None)
+                checkpoint.avanzar(offset)
+                progreso.avanzar()
+                print(f"{progreso.resumen()} | {dni}: DNI inválido")
+                continue
+            
+            if solo_nuevos and indice.consultado(dni):
+                resultados.escribir(
+                    dni, estado='ya_consultado', mensaje=None, data=None,
+                    no_encontrado=indice.no_encontrado(dni), con_oferta=indice.con_oferta(dni),
+                )
+                checkpoint.avanzar(offset)
+                progreso.avanzar()
+                print(f"{progreso.resumen()} | {dni}: ya consultado")
+                continue
+            
+            # Resultado reciente de otra ejecución o del servicio HTTP, o
+            # "no encontrado" en el índice de DNIs
+            resultado, _ = store.get(dni)
+            origen = 'cache' if resultado is not None else None
+            if resultado is None and indice:
+                resultado = indice.resultado_conocido(dni)
+                origen = 'índice' if resultado is not None else None
+            traza = Traza()
+            intentos = 0
+            
+            while resultado is None:
+                # Reconectar si es necesario
+                if consultas_sesion >= settings.MAX_CONSULTAS_POR_SESION:
+                    logger.info("Reconectando...")
+                    time.sleep(random.uniform(10, 20))
+                    sesiones.refresh(forzar=True)
+                    consultas_sesion = 0
+                
+                # El ritmo entre consultas lo marca el regulador (api.governor)
+                with traza.activa():
+                    resultado = sesiones.consultar(dni)
+                consultas_sesion += 1
+                consultas_upstream += 1
+                estado = resultado.estado
+                
+                if estado is Estado.RATE_LIMIT:
+                    # Reintentar: el regulador espera Retry-After antes de la siguiente llamada
+                    logger.warning("RATE LIMIT - Reintentando tras la pausa del regulador")
+                    resultado = None
+                elif estado is Estado.CIRCUIT_OPEN:
+                    # API caída: esperar a que el circuito permita llamadas de prueba
+                    espera = circuit.restante() + 1
+                    logger.warning("Circuito abierto - esperando %.0fs", espera)
+                    time.sleep(espera)
+                    resultado = None
+                elif estado in (Estado.BLOCKED, Estado.EXPIRED):
+                    # El checkpoint no avanza: al reanudar se vuelve a consultar este DNI.
+                    # 'expired' aquí significa que el token fue rechazado aun tras reconectar.
+                    logger.error("Deteniendo lote: %s", mensaje_detencion(estado))
+                    print(f"🚨 {mensaje_detencion(estado).upper()}")
+                    print(f"Reanude más tarde; el avance quedó guardado en {checkpoint.ruta}")
+                    return
+                elif resultado.transitorio:
+                    # Timeout, 5xx o error de red: no es un resultado final del DNI,
+                    # así que no se escribe ni avanza el checkpoint
+                    intentos += 1
+                    if intentos >= REINTENTOS_LOTE:
+                        logger.error("Deteniendo lote: %s para DNI %s tras %s intentos",
+                                     resultado.etiqueta, dni, intentos)
+                        print(f"🚨 {dni}: {resultado.etiqueta.upper()} TRAS {intentos} INTENTOS")
+                        print(f"Reanude más tarde; el avance quedó guardado en {checkpoint.ruta}")
+                        return
+                    logger.warning("%s para DNI %s - reintento %s/%s",
+                                   resultado.etiqueta, dni, intentos + 1, REINTENTOS_LOTE)
+                    time.sleep(2 ** intentos)
+                    resultado = None
+            
+            if origen is None:
+                store.put(dni, resultado)
+            if indice:
+                indice.registrar(dni, resultado)
+                indice.guardar_si_cambio(settings.DNI_INDEX_SAVE_SECONDS)
+            
+            resultados.escribir(dni, resultado)
+            checkpoint.avanzar(offset)
+            progreso.avanzar()
+            print(
+                f"{progreso.resumen()} | {governor.rate * 60:.1f} llamadas/min | "
+                f"{dni}: {resultado.etiqueta}{f' ({origen})' if origen else ''}"
+            )
+            if verbose and origen is None:
+                print(f"   ⏱️  {traza.texto()}")
+        
+        print(f"\n✅ Lote finalizado - resultados en {resultados.ruta}")
+    finally:
+        resultados.close()
+        sesiones.close()
+        if indice:
+            indice.guardar_si_cambio(0)
+            indice.close()
+
+def fusionar_indices(rutas):
+    """Fusionar índices de DNIs de otras ejecuciones o máquinas en DNI_INDEX_PATH"""
+    indice = crear_indice_dni()
+    if indice is None:
+        print("❌ Configure DNI_INDEX_PATH para fusionar índices")
+        return
+    try:
+        for ruta in rutas:
+            indice.fusionar(ruta)
+        indice.guardar()
+        totales = indice.contar()
+    finally:
+        indice.close()
+    print(f"✅ Índice {indice.path}: " + ", ".join(f"{n} {k}" for k, n in totales.items()))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Consulta líneas de crédito en Calidda")
+    parser.add_argument(
+        '--batch', nargs='?', const='', metavar='ARCHIVO',
+        help="Procesar un archivo de DNIs sin interacción (por defecto DNIS_FILE)",
+    )
+    parser.add_argument(
+        '--desde-cero', action='store_true',
+        help="Ignorar el checkpoint y procesar el archivo desde el inicio",
+    )
+    parser.add_argument(
+        '--solo-nuevos', action='store_true',
+        help="En modo lote, no volver a consultar los DNIs ya consultados según el índice (DNI_INDEX_PATH)",
+    )
+    parser.add_argument(
+        '--fusionar-indice', nargs='+', metavar='ARCHIVO',
+        help="Fusionar índices de DNIs de otras ejecuciones en DNI_INDEX_PATH y salir",
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='', metavar='ARCHIVO',
+        help="Perfilar la sesión con cProfile y guardarla en ARCHIVO (por defecto OUTPUT_DIR/perfil_<fecha>.prof)",
+    )
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help="Mostrar el tiempo de cada fase de la consulta (sesión, regulador, probe, full, parse, render)",
+    )
+    args = parser.parse_args()
+    # La configuración se resuelve después de argparse: --help funciona sin
+    # credenciales ni .env
+    settings = get_settings()
+    if args.batch == '':
+        args.batch = settings.DNIS_FILE
+    if args.solo_nuevos and not settings.DNI_INDEX_PATH:
+        parser.error("--solo-nuevos requiere DNI_INDEX_PATH")
+    return args
+
 if __name__ == "__main__":
+    args = parse_args()
+    configurar_logging()
+    usar_ritmo_cli()
+    perfil = nullcontext()
+    if args.profile is not None:
+        ruta = args.profile or os.path.join(
+            get_settings().OUTPUT_DIR, time.strftime('perfil_%Y%m%d_%H%M%S.prof'),
+        )
+        perfil = perfilar_sesion(ruta)
     try:
-        main()
+        # El perfil se guarda también si la sesión termina con Ctrl+C o un error
+        with perfil:
+            if args.fusionar_indice:
+                fusionar_indices(args.fusionar_indice)
+            elif args.batch:
+                main_lote(args.batch, desde_cero=args.desde_cero, verbose=args.verbose, solo_nuevos=args.solo_nuevos)
+            else:
+                main(verbose=args.verbose)
     except KeyboardInterrupt:
         print("\n\n⚠️ Proceso interrumpido por el usuario")
         logger.warning("Proceso interrumpido por el usuario")
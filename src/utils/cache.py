@@ -0,0 +1,131 @@
+"""
+Cache en memoria de resultados de consulta por DNI
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+def categoria_resultado(resultado):
+    """
+    Clasificar un ConsultaResult para decidir su TTL en cache
+
+    Returns:
+        'success', 'sin_credito', 'no_encontrado' o None si no se debe cachear
+        (errores, timeouts, rate limit, sesión expirada...)
+    """
+    categoria = resultado.categoria
+    if categoria == 'dni_invalido':
+        return 'no_encontrado'
+    if categoria in ('success', 'sin_credito'):
+        return categoria
+    return None
+
+def ttl_resultado(resultado, ttls):
+    """TTL en segundos para un ConsultaResult; 0 si no se cachea"""
+    categoria = categoria_resultado(resultado)
+    return ttls.get(categoria, 0) if categoria else 0
+
+class ResultCache:
+    """
+    Cache LRU acotado con TTL por categoría de resultado
+
+    Cada entrada guarda el ConsultaResult de consultar_dni.
+    Pasado su TTL, una entrada sigue sirviéndose como "stale" durante
+    stale_ttl segundos para que el llamador la refresque en segundo plano.
+    """
+
+    def __init__(self, max_entries, ttls, stale_ttl=0):
+        """
+        Args:
+            max_entries: Número máximo de DNIs en cache (LRU)
+            ttls: Dict categoría -> segundos ('success', 'sin_credito', 'no_encontrado').
+                  Un TTL de 0 desactiva el cache para esa categoría.
+            stale_ttl: Segundos extra en que una entrada vencida se sirve como stale
+        """
+        self.max_entries = max_entries
+        self.ttls = dict(ttls)
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, dni):
+        """
+        Buscar un DNI en cache
+
+        Returns:
+            Tupla (resultado, stale). resultado es None si no hay entrada utilizable.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(dni)
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+            resultado, expires_at, stale_until = entry
+            if now < expires_at:
+                self._entries.move_to_end(dni)
+                self.hits += 1
+                return resultado, False
+
+            if now < stale_until:
+                self._entries.move_to_end(dni)
+                self.stale_hits += 1
+                return resultado, True
+
+            del self._entries[dni]
+            self.misses += 1
+            return None, False
+
+    async def get_async(self, dni):
+        """get() para el wrapper (en memoria no bloquea: se llama directo)"""
+        return self.get(dni)
+
+    def put(self, dni, resultado):
+        """
+        Guardar un resultado si su categoría es cacheable
+
+        Returns:
+            True si se guardó
+        """
+        ttl = ttl_resultado(resultado, self.ttls)
+        if ttl <= 0:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            self._entries[dni] = (resultado, now + ttl, now + ttl + self.stale_ttl)
+            self._entries.move_to_end(dni)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    async def put_async(self, dni, resultado):
+        return self.put(dni, resultado)
+
+    def invalidate(self, dni):
+        with self._lock:
+            self._entries.pop(dni, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores de uso del cache"""
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,38 @@
+"""
+Camino rápido de JSON con orjson (opcional)
+
+Con FAST_JSON=true (por defecto; orjson está en requirements.txt) los cuerpos
+de Calidda se parsean con orjson y el wrapper serializa sus respuestas con
+orjson sin pasar por el modelo pydantic. Los campos que se conservan los define
+Cliente.desde_api en ambos caminos. Sin orjson todo sigue funcionando con
+json/pydantic.
+"""
+
+import logging
+from functools import lru_cache
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
+def activo():
+    """True si FAST_JSON está activado y orjson se puede importar"""
+    if not get_settings().FAST_JSON:
+        return False
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        logger.warning("FAST_JSON=true pero el paquete 'orjson' no está instalado; se usa json")
+        return False
+    return True
+
+def cargar_consulta(contenido):
+    """Parsear los bytes de una respuesta de consulta con orjson"""
+    import orjson
+    return orjson.loads(contenido)
+
+def dumps(obj):
+    """Serializar a bytes JSON con orjson"""
+    import orjson
+    return orjson.dumps(obj)
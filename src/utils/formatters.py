@@ -3,13 +3,14 @@ Utilidades de formateo y procesamiento de texto
 """
 
 import re
-from unidecode import unidecode
 
 def procesar_direccion(direccion):
     """Procesa y formatea la dirección asegurando que termine en LIMA"""
     if not direccion:
         return "N/A"
     
+    from unidecode import unidecode
+
     try:
         # Primero intentamos normalizar caracteres especiales a sus equivalentes ASCII
         direccion_norm = unidecode(direccion)
@@ -33,4 +34,13 @@ def limpiar_mensaje_html(mensaje):
     # Remover tags HTML
     mensaje = re.sub(r'<br\s*/?>', '\n', mensaje)
     mensaje = re.sub(r'<[^>]+>', '', mensaje)
-    return mensaje.strip()
\ No newline at end of file
+    return mensaje.strip()
+# 8 dígitos seguidos o agrupados 2-3-3 con punto o espacio, sin más dígitos alrededor
+_DNI_EN_TEXTO = re.compile(r'(?<!\d)(\d{2})[. ]?(\d{3})[. ]?(\d{3})(?!\d)')
+
+def extraer_dni(texto):
+    """Primer DNI (8 dígitos) de un texto libre, o None ("mi dni es 72.364.276" -> '72364276')"""
+    if not texto:
+        return None
+    encontrado = _DNI_EN_TEXTO.search(texto)
+    return ''.join(encontrado.groups()) if encontrado else None
@@ -0,0 +1,232 @@
+"""
+Índice de DNIs ya vistos entre ejecuciones (bitmap en un archivo mapeado)
+
+Un DNI tiene 8 dígitos, así que un bit por DNI cubre todo el espacio en 12.5 MB
+por plano. Hay tres planos: CONSULTADO (hubo un resultado definitivo),
+NO_ENCONTRADO y CON_OFERTA. Los bits solo se encienden, así que fusionar
+índices de varias ejecuciones o procesos es un OR.
+
+El archivo se mapea en modo copy-on-write: solo se leen del disco las páginas
+consultadas y los cambios quedan en memoria hasta guardar(), que fusiona lo que
+otro proceso haya guardado, escribe un archivo temporal (disperso: los bloques
+en cero no ocupan disco) y lo reemplaza de forma atómica.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import get_settings
+from src.api.resultado import ConsultaResult, Estado
+
+logger = logging.getLogger(__name__)
+
+CONSULTADO = 0
+NO_ENCONTRADO = 1
+CON_OFERTA = 2
+PLANOS = 3
+
+_MAGIA = b'VCCDNI1\n'
+_BYTES_PLANO = 10 ** 8 // 8
+_TAMANO = len(_MAGIA) + PLANOS * _BYTES_PLANO
+# Bloque de lectura/escritura al guardar y fusionar
+_BLOQUE = 1 << 20
+_CEROS = bytes(_BLOQUE)
+
+# Mensaje del resultado que se responde sin consultar a Calidda
+MENSAJE_NO_ENCONTRADO = 'Cliente no encontrado'
+
+def _posicion(plano, dni):
+    n = int(dni)
+    return len(_MAGIA) + plano * _BYTES_PLANO + (n >> 3), 1 << (n & 7)
+
+class IndiceDNI:
+    """Bitmap de DNIs vistos, compartido por hilos (y por procesos al guardar)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        self._cambios = 0
+        self._guardado = time.monotonic()
+        self.consultas = 0
+        self.omitidos = 0
+        self.registrados = 0
+        self.guardados = 0
+
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._bloqueo():
+            if not os.path.exists(path):
+                self._crear_vacio(path)
+        self._mmap = self._mapear(path)
+
+    @staticmethod
+    def _crear_vacio(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIA)
+            f.truncate(_TAMANO)  # disperso: no ocupa disco hasta escribir bits
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _mapear(path):
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIA)) != _MAGIA or os.fstat(f.fileno()).st_size != _TAMANO:
+                raise ValueError(f"{path} no es un índice de DNIs")
+            return mmap.mmap(f.fileno(), _TAMANO, access=mmap.ACCESS_COPY)
+
+    @contextmanager
+    def _bloqueo(self):
+        """Lock de archivo entre procesos (fcntl.flock) para crear y guardar"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _bit(self, plano, dni):
+        pos, mascara = _posicion(plano, dni)
+        return bool(self._mmap[pos] & mascara)
+
+    def consultado(self, dni):
+        return self._bit(CONSULTADO, dni)
+
+    def no_encontrado(self, dni):
+        return self._bit(NO_ENCONTRADO, dni)
+
+    def con_oferta(self, dni):
+        return self._bit(CON_OFERTA, dni)
+
+    def resultado_conocido(self, dni):
+        """
+        Resultado que se puede dar sin llamar a Calidda
+
+        Returns:
+            ConsultaResult "no encontrado" si el DNI ya se encontró así en una
+            consulta anterior; None si hay que consultar.
+        """
+        self.consultas += 1
+        if not self.no_encontrado(dni):
+            return None
+        self.omitidos += 1
+        return ConsultaResult(Estado.INVALID, MENSAJE_NO_ENCONTRADO)
+
+    def registrar(self, dni, resultado):
+        """Encender los bits de un ConsultaResult definitivo (los errores no se registran)"""
+        categoria = resultado.categoria
+        if categoria == 'error':
+            return
+        planos = [CONSULTADO]
+        if categoria == 'dni_invalido':
+            planos.append(NO_ENCONTRADO)
+        elif categoria == 'success':
+            planos.append(CON_OFERTA)
+        with self._lock:
+            for plano in planos:
+                pos, mascara = _posicion(plano, dni)
+                self._mmap[pos] |= mascara
+            self._cambios += 1
+            self.registrados += 1
+
+    def _fusionar_archivo(self, path):
+        """OR de los planos de otro archivo de índice sobre este (bloque a bloque)"""
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIA)) != _MAGIA or os.fstat(f.fileno()).st_size != _TAMANO:
+                raise ValueError(f"{path} no es un índice de DNIs")
+            pos = len(_MAGIA)
+            while True:
+                otro = f.read(_BLOQUE)
+                if not otro:
+                    break
+                if otro != _CEROS[:len(otro)]:
+                    with self._lock:
+                        propio = self._mmap[pos:pos + len(otro)]
+                        union = int.from_bytes(propio, 'little') | int.from_bytes(otro, 'little')
+                        self._mmap[pos:pos + len(otro)] = union.to_bytes(len(otro), 'little')
+                pos += len(otro)
+
+    def fusionar(self, path):
+        """Incorporar los DNIs de otro índice (p. ej. de otra máquina); luego guardar()"""
+        self._fusionar_archivo(path)
+        with self._lock:
+            self._cambios += 1
+        logger.info("Índice %s fusionado en %s", path, self.path)
+
+    def guardar(self):
+        """
+        Guardar de forma atómica, fusionando antes lo guardado por otros procesos
+
+        Returns:
+            True si se escribió el archivo
+        """
+        with self._bloqueo():
+            with self._lock:
+                cambios = self._cambios
+            if os.path.exists(self.path):
+                self._fusionar_archivo(self.path)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                for pos in range(0, _TAMANO, _BLOQUE):
+                    with self._lock:
+                        bloque = self._mmap[pos:pos + _BLOQUE]
+                    if bloque == _CEROS[:len(bloque)]:
+                        f.seek(len(bloque), os.SEEK_CUR)
+                    else:
+                        f.write(bloque)
+                f.truncate(_TAMANO)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        with self._lock:
+            self._cambios -= cambios
+            self._guardado = time.monotonic()
+            self.guardados += 1
+        logger.debug("Índice de DNIs guardado en %s", self.path)
+        return True
+
+    def guardar_si_cambio(self, intervalo):
+        """guardar() si hay cambios y pasaron al menos intervalo segundos desde el último"""
+        if not self._cambios or time.monotonic() - self._guardado < intervalo:
+            return False
+        return self.guardar()
+
+    def contar(self):
+        """DNIs por plano (recorre los 37.5 MB: para el CLI, no para /health)"""
+        totales = []
+        for plano in range(PLANOS):
+            inicio = len(_MAGIA) + plano * _BYTES_PLANO
+            total = 0
+            for pos in range(inicio, inicio + _BYTES_PLANO, _BLOQUE):
+                bloque = self._mmap[pos:min(pos + _BLOQUE, inicio + _BYTES_PLANO)]
+                if bloque != _CEROS[:len(bloque)]:
+                    total += bin(int.from_bytes(bloque, 'little')).count('1')
+            totales.append(total)
+        return dict(zip(('consultados', 'no_encontrados', 'con_oferta'), totales))
+
+    def close(self):
+        self._mmap.close()
+
+    def stats(self):
+        """Contadores de uso del índice en este proceso"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "lookups": self.consultas,
+                "skipped": self.omitidos,
+                "registered": self.registrados,
+                "unsaved_changes": self._cambios,
+                "saves": self.guardados,
+            }
+
+def crear_indice_dni():
+    """Crear el índice configurado con DNI_INDEX_PATH, o None si está desactivado"""
+    path = get_settings().DNI_INDEX_PATH
+    return IndiceDNI(path) if path else None
@@ -0,0 +1,191 @@
+"""
+Trabajos asíncronos en memoria (POST /query en modo async)
+
+Una consulta a Calidda puede tardar hasta QUICK_TIMEOUT + TIMEOUT segundos, más
+que el timeout de los webhooks de n8n/Chatwoot. En modo async el wrapper crea un
+Trabajo, responde de inmediato con su id y un pool acotado de workers hace la
+consulta. El resultado se entrega al callback_url (con reintentos) y queda
+disponible en GET /jobs/{id} hasta que el trabajo expira.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = 'pending'
+EN_CURSO = 'running'
+TERMINADO = 'done'
+FALLIDO = 'failed'
+
+class ColaLlena(Exception):
+    """No hay lugar para más trabajos pendientes"""
+
+class Trabajo:
+    """Estado de una consulta asíncrona"""
+
+    __slots__ = ('id', 'dni', 'callback_url', 'estado', 'creado', 'terminado',
+                 'resultado', 'error', 'callback')
+
+    def __init__(self, dni, callback_url=None):
+        self.id = uuid.uuid4().hex
+        self.dni = dni
+        self.callback_url = callback_url
+        self.estado = PENDIENTE
+        self.creado = time.time()
+        self.terminado = None
+        self.resultado = None  # dict serializable (QueryResponse)
+        self.error = None
+        # Entrega al callback: None (sin callback o pendiente), 'delivered' o 'failed'
+        self.callback = None
+
+    @property
+    def finalizado(self):
+        return self.estado in (TERMINADO, FALLIDO)
+
+    def a_dict(self):
+        return {
+            'job_id': self.id,
+            'dni': self.dni,
+            'status': self.estado,
+            'created_at': self.creado,
+            'finished_at': self.terminado,
+            'result': self.resultado,
+            'error': self.error,
+            'callback': self.callback,
+        }
+
+class ColaTrabajos:
+    """
+    Cola acotada de trabajos atendida por un número fijo de workers asyncio
+
+    Los trabajos finalizados se descartan ttl segundos después de terminar,
+    sin importar los que sigan pendientes o en curso delante de ellos (los
+    pendientes nunca se pierden).
+    """
+
+    def __init__(self, procesar, workers, max_pendientes, ttl, entregar=None, reintentos=3):
+        """
+        Args:
+            procesar: async fn(trabajo) -> dict con el resultado; una excepción marca el trabajo como fallido
+            workers: Trabajos que se ejecutan a la vez
+            max_pendientes: Trabajos que pueden esperar en cola antes de rechazar nuevos
+            ttl: Segundos que se conserva un trabajo
+            entregar: async fn(url, payload) que envía el resultado al callback (lanza si falla)
+            reintentos: Intentos de entrega al callback
+        """
+        self.procesar = procesar
+        self.workers = workers
+        self.ttl = ttl
+        self.entregar = entregar
+        self.reintentos = reintentos
+        self._cola = asyncio.Queue(maxsize=max_pendientes)
+        self._trabajos = {}  # id -> Trabajo
+        self._finalizados = OrderedDict()  # id -> Trabajo, por orden de finalización
+        self._tareas = []
+        self._entregas = set()
+        self.en_curso = 0
+        self.creados = 0
+        self.terminados = 0
+        self.fallidos = 0
+        self.entregados = 0
+        self.entregas_fallidas = 0
+
+    def start(self):
+        if not self._tareas:
+            self._tareas = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for tarea in self._tareas + list(self._entregas):
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, *self._entregas, return_exceptions=True)
+        self._tareas = []
+
+    def crear(self, dni, callback_url=None):
+        """
+        Encolar un trabajo
+
+        Raises:
+            ColaLlena: si ya hay max_pendientes trabajos esperando
+        """
+        self._purgar()
+        trabajo = Trabajo(dni, callback_url)
+        try:
+            self._cola.put_nowait(trabajo)
+        except asyncio.QueueFull:
+            raise ColaLlena(f"Hay {self._cola.qsize()} trabajos en cola") from None
+        self._trabajos[trabajo.id] = trabajo
+        self.creados += 1
+        return trabajo
+
+    def get(self, job_id):
+        """Trabajo por id, o None si no existe o ya expiró"""
+        self._purgar()
+        return self._trabajos.get(job_id)
+
+    def _purgar(self):
+        limite = time.time() - self.ttl
+        while self._finalizados:
+            trabajo = next(iter(self._finalizados.values()))
+            if trabajo.terminado > limite:
+                break
+            self._finalizados.popitem(last=False)
+            self._trabajos.pop(trabajo.id, None)
+
+    async def _worker(self):
+        while True:
+            trabajo = await self._cola.get()
+            trabajo.estado = EN_CURSO
+            self.en_curso += 1
+            try:
+                trabajo.resultado = await self.procesar(trabajo)
+                trabajo.estado = TERMINADO
+                self.terminados += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Trabajo %s (DNI %s) falló: %s", trabajo.id, trabajo.dni, e)
+                trabajo.error = str(e)
+                trabajo.estado = FALLIDO
+                self.fallidos += 1
+            finally:
+                self.en_curso -= 1
+                trabajo.terminado = time.time()
+                self._finalizados[trabajo.id] = trabajo
+                self._cola.task_done()
+
+            if trabajo.callback_url and self.entregar is not None:
+                # La entrega no ocupa al worker: un callback lento no frena la cola
+                tarea = asyncio.create_task(self._entregar(trabajo))
+                self._entregas.add(tarea)
+                tarea.add_done_callback(self._entregas.discard)
+
+    async def _entregar(self, trabajo):
+        for intento in range(self.reintentos):
+            try:
+                await self.entregar(trabajo.callback_url, trabajo.a_dict())
+            except Exception as e:
+                logger.warning("Callback del trabajo %s falló (intento %s): %r", trabajo.id, intento + 1, e)
+                if intento + 1 < self.reintentos:
+                    await asyncio.sleep(2 ** intento)
+                continue
+            trabajo.callback = 'delivered'
+            self.entregados += 1
+            return
+        trabajo.callback = 'failed'
+        self.entregas_fallidas += 1
+
+    def stats(self):
+        return {
+            "queued": self._cola.qsize(),
+            "running": self.en_curso,
+            "stored": len(self._trabajos),
+            "created": self.creados,
+            "done": self.terminados,
+            "failed": self.fallidos,
+            "callbacks_delivered": self.entregados,
+            "callbacks_failed": self.entregas_fallidas,
+        }
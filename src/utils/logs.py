@@ -0,0 +1,126 @@
+"""
+Configuración de logging compartida por el CLI y el wrapper
+
+Los módulos solo hacen logger.x("mensaje %s", valor): el mensaje se arma
+únicamente si el nivel está activo. El logger raíz tiene un QueueHandler que
+deja cada registro en una cola en memoria sin bloquear; un QueueListener en su
+propio hilo lo formatea (JSON o texto) y lo escribe en consola y en LOG_FILE,
+que rota por tamaño. Ninguna consulta espera por el disco.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from pathlib import Path
+
+from src.config import get_settings
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Atributos estándar de un LogRecord (el resto son campos de extra=)
+_ATRIBUTOS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro: ts, level, logger, msg y los campos de extra="""
+
+    def format(self, record):
+        registro = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                  + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        # Las líneas de trace.Traza.log() traen sus campos en extra={'campos': ...}
+        campos = getattr(record, 'campos', None)
+        if isinstance(campos, dict):
+            registro.update(campos)
+        else:
+            registro['msg'] = record.getMessage()
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS and clave != 'campos':
+                registro[clave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            registro['exc'] = record.exc_text
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que arma el mensaje pero deja el formato final al listener
+
+    El de la librería estándar aplica su propio Formatter y mezcla el traceback
+    en el mensaje; aquí solo se resuelven los argumentos (que pueden cambiar
+    después) y el traceback queda en exc_text para el formatter del listener.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listener = None
+
+def configurar_logging(archivo=None, consola=True):
+    """
+    Instalar el pipeline de logging en el logger raíz (una sola vez por proceso)
+
+    Args:
+        archivo: Archivo de log (relativo al directorio raíz del proyecto);
+                 por defecto LOG_FILE. Vacío = sin archivo.
+        consola: Escribir también en stderr
+
+    Returns:
+        El QueueListener en ejecución (se detiene al salir del proceso)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    s = get_settings()
+    if s.LOG_FORMAT == 'json':
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    handlers = []
+    archivo = s.LOG_FILE if archivo is None else archivo
+    if archivo:
+        ruta = ROOT_DIR / archivo
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            ruta, maxBytes=s.LOG_MAX_BYTES, backupCount=s.LOG_BACKUP_COUNT, encoding='utf-8',
+        ))
+    if consola:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    cola = queue.SimpleQueue()  # sin límite: put() nunca bloquea
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(_QueueHandler(cola))
+    raiz.setLevel(getattr(logging, s.LOG_LEVEL))
+    # httpx registra cada request a INFO; la línea de la traza ya las cubre
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(cola, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(detener_logging)
+    return _listener
+
+def detener_logging():
+    """Vaciar la cola y detener el hilo del listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,127 @@
+"""
+Utilidades para procesar archivos de DNIs por lotes (modo batch del CLI)
+
+Los DNIs se leen en streaming desde DNIS_FILE, cada resultado se agrega como
+una línea JSON en OUTPUT_DIR y un checkpoint guarda la posición del archivo
+para reanudar sin volver a consultar DNIs ya procesados.
+"""
+
+import json
+import os
+import time
+
+def leer_dnis(ruta, offset=0):
+    """
+    Leer DNIs de un archivo (uno por línea) sin cargarlo completo en memoria
+
+    Las líneas vacías y las que empiezan con '#' se ignoran.
+
+    Yields:
+        Tupla (dni, offset_siguiente): offset_siguiente es la posición en bytes
+        justo después de la línea del DNI, para guardarla en el checkpoint
+    """
+    with open(ruta, 'rb') as f:
+        f.seek(offset)
+        while True:
+            linea = f.readline()
+            if not linea:
+                return
+            offset += len(linea)
+            dni = linea.decode('utf-8', errors='replace').strip()
+            if dni and not dni.startswith('#'):
+                yield dni, offset
+
+def contar_dnis(ruta, offset=0):
+    """Contar los DNIs pendientes desde offset (lectura en streaming)"""
+    return sum(1 for _ in leer_dnis(ruta, offset))
+
+class Checkpoint:
+    """Posición de avance en el archivo de DNIs, guardada de forma atómica"""
+
+    def __init__(self, ruta_checkpoint, ruta_dnis):
+        self.ruta = ruta_checkpoint
+        self.ruta_dnis = os.path.abspath(ruta_dnis)
+        self.offset = 0
+        self.procesados = 0
+
+    def cargar(self):
+        """Cargar el checkpoint si corresponde al mismo archivo de DNIs"""
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if datos.get('archivo') == self.ruta_dnis:
+            self.offset = datos.get('offset', 0)
+            self.procesados = datos.get('procesados', 0)
+        return self
+
+    def avanzar(self, offset):
+        self.offset = offset
+        self.procesados += 1
+        self.guardar()
+
+    def guardar(self):
+        tmp = self.ruta + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'archivo': self.ruta_dnis,
+                'offset': self.offset,
+                'procesados': self.procesados,
+                'actualizado': time.time(),
+            }, f)
+        os.replace(tmp, self.ruta)
+
+    def reiniciar(self):
+        self.offset = 0
+        self.procesados = 0
+        self.guardar()
+
+class ResultadosJSONL:
+    """Archivo de resultados append-only, una línea JSON por DNI"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._f = open(ruta, 'a', encoding='utf-8')
+
+    def escribir(self, dni, resultado=None, **extra):
+        """
+        Agregar la línea de un DNI
+
+        resultado: ConsultaResult (estado, mensaje, data y estado_consulta);
+        extra: campos adicionales o, sin resultado, los campos de la línea.
+        """
+        registro = {'dni': dni}
+        if resultado is not None:
+            registro.update(resultado.a_dict())
+            registro['estado_consulta'] = resultado.categoria
+        registro.update(extra)
+        registro['ts'] = time.time()
+        self._f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        # Vaciar antes de avanzar el checkpoint: un registro nunca se pierde
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+class Progreso:
+    """Throughput y ETA de un lote"""
+
+    def __init__(self, total):
+        self.total = total
+        self.hechos = 0
+        self.inicio = time.monotonic()
+
+    def avanzar(self):
+        self.hechos += 1
+
+    def resumen(self):
+        transcurrido = time.monotonic() - self.inicio
+        por_minuto = self.hechos / transcurrido * 60 if transcurrido > 0 else 0.0
+        restantes = self.total - self.hechos
+        if self.hechos and restantes > 0:
+            eta = time.strftime('%H:%M:%S', time.gmtime(transcurrido / self.hechos * restantes))
+        else:
+            eta = '--:--:--'
+        return f"[{self.hechos}/{self.total}] {por_minuto:.1f} DNIs/min | ETA {eta}"
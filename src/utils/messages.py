@@ -1,133 +1,221 @@
 """
 Generación y manejo de mensajes personalizados
+
+Las plantillas se procesan una sola vez al importar el módulo (dedent y
+análisis de campos y negritas) y cada mensaje se renderiza en un solo paso en
+cuatro variantes: texto plano, compacto (una línea), HTML y WhatsApp.
 """
 
+import html
+import re
 import textwrap
+from collections import namedtuple
+from string import Formatter
+
+from src.utils import trace
+
+# Variantes de un mensaje renderizado
+Mensaje = namedtuple('Mensaje', 'texto compacto html whatsapp')
+
+# Marca de negrita en las plantillas: **texto**
+_NEGRITA = '**'
+_ESPACIOS = re.compile(r'\s+')
+
+def _compactar(texto):
+    return _ESPACIOS.sub(' ', texto)
+
+def _a_html(texto):
+    return html.escape(texto, quote=False).replace('\n', '<br/>')
+
+# Cómo se escribe en cada variante: (texto literal, apertura de negrita, cierre de negrita)
+_VARIANTES = {
+    'texto': (lambda t: t, '', ''),
+    'compacto': (_compactar, '', ''),
+    'html': (_a_html, '<b>', '</b>'),
+    'whatsapp': (lambda t: t, '*', '*'),
+}
+
+class Plantilla:
+    """
+    Plantilla de mensaje con campos str.format ({nombre}, {monto:,.2f}) y
+    negritas (**texto**)
 
-def generar_mensaje_personalizado(estado, datos=None, mensaje_error=None):
+    El texto se normaliza con textwrap.dedent y se divide en partes una sola vez;
+    render() solo formatea los campos.
+    """
+
+    def __init__(self, texto):
+        texto = textwrap.dedent(texto).strip()
+        self.campos = []
+        partes = {variante: [] for variante in _VARIANTES}
+        negrita = False
+
+        for literal, campo, formato, conversion in Formatter().parse(texto):
+            trozos = literal.split(_NEGRITA)
+            for i, trozo in enumerate(trozos):
+                if i:
+                    negrita = not negrita
+                for variante, (convertir, abre, cierra) in _VARIANTES.items():
+                    if i:
+                        partes[variante].append(abre if negrita else cierra)
+                    if trozo:
+                        partes[variante].append(convertir(trozo))
+            if campo is not None:
+                indice = len(self.campos)
+                self.campos.append((campo, '{' + (f'!{conversion}' if conversion else '') + f':{formato}}}'))
+                for variante in _VARIANTES:
+                    partes[variante].append(indice)
+
+        if negrita:
+            raise ValueError(f"Negrita sin cerrar en plantilla: {texto[:40]!r}")
+
+        # Literales consecutivos se unen: al renderizar solo quedan los campos por formatear
+        self._partes = {v: self._unir(p) for v, p in partes.items()}
+        self.estatica = not self.campos
+        self._renderizado = self._render({}) if self.estatica else None
+
+    @staticmethod
+    def _unir(partes):
+        unidas = []
+        for parte in partes:
+            if isinstance(parte, str) and unidas and isinstance(unidas[-1], str):
+                unidas[-1] += parte
+            else:
+                unidas.append(parte)
+        return unidas
+
+    def _render(self, valores):
+        formateados = [formato.format(valores[campo]) for campo, formato in self.campos]
+        por_variante = {
+            'texto': formateados,
+            'compacto': [' '.join(v.split()) for v in formateados],
+            'html': [_a_html(v) for v in formateados],
+            'whatsapp': formateados,
+        }
+        return Mensaje(**{
+            variante: ''.join(
+                p if isinstance(p, str) else por_variante[variante][p]
+                for p in self._partes[variante]
+            )
+            for variante in _VARIANTES
+        })
+
+    def render(self, **valores):
+        """Retornar el Mensaje con las cuatro variantes (cacheado si no tiene campos)"""
+        if self._renderizado is not None:
+            return self._renderizado
+        return self._render(valores)
+
+# ========== PLANTILLAS ==========
+# Cliente CON línea de crédito - ÚNICA CONDICIÓN PARA OFERTA
+OFERTA = Plantilla("""
+    **🎉 ¡FELICITACIONES!**
+
+    Hola {nombre},
+    ¡Tenemos excelentes noticias para ti!
+
+    Tienes una línea de crédito APROBADA por:
+    **💰 S/ {monto:,.2f} soles !!!**
+""")
+
+# Cliente registrado pero SIN línea de crédito
+SIN_CREDITO = Plantilla("""
+    **ℹ️ INFORMACIÓN DE TU CONSULTA**
+
+    Hola {nombre},
+    Gracias por tu interés en nuestros servicios de crédito.
+    En este momento no cuentas con una línea de crédito disponible.
+
+    **💡 ¿Cómo puedo calificar?**
+       • Mantén tus pagos al día
+       • Continúa usando nuestro servicio regularmente
+       • Evaluamos periódicamente a nuestros clientes
+
+    Sigue usando el servicio de Calidda y muy pronto podrías calificar 
+    para una oferta crediticia.
+
+    ¡Hasta luego!
+""")
+
+# DNI no encontrado o sin campaña activa
+NO_CALIFICA = Plantilla("""
+    **ℹ️ INFORMACIÓN DE TU CONSULTA**
+
+    Gracias por tu interés en nuestros servicios de crédito.
+    En este momento no cuentas con una línea de crédito disponible.
+
+    **💡 ¿Cómo puedo calificar?**
+       • Mantén tus pagos al día
+       • Continúa usando nuestro servicio regularmente
+       • Evaluamos periódicamente a nuestros clientes
+
+    Sigue usando el servicio de Calidda y muy pronto podrías calificar 
+    para una oferta crediticia.
+
+    ¡Hasta luego!
+""")
+
+# Error genérico u otro caso (incluyendo timeout)
+ERROR = Plantilla("""
+    **⚠️ INFORMACIÓN**
+
+    Hola Cliente,
+    En este momento no podemos procesar tu consulta.
+
+    ¡Gracias por tu comprensión!
+""")
+
+def generar_mensajes(resultado):
+    """
+    Generar el mensaje personalizado en todas sus variantes
+
+    Args:
+        resultado: ConsultaResult de consultar_dni
+
+    Returns:
+        Tupla (Mensaje, tiene_oferta)
+    """
+    if resultado.tiene_oferta:
+        cliente = resultado.cliente
+        mensaje = OFERTA.render(
+            nombre=cliente.nombre or 'Cliente',
+            monto=cliente.linea_credito,
+        )
+        return mensaje, True
+
+    # Un cliente registrado sin línea de crédito sigue el mismo camino que los
+    # demás casos (NO_CALIFICA o ERROR según el mensaje de la API), como antes
+    # de ConsultaResult; SIN_CREDITO no se usa todavía
+    if resultado.no_califica:
+        return NO_CALIFICA.render(), False
+
+    return ERROR.render(), False
+
+def generar_mensaje_personalizado(resultado):
     """
     Generar mensaje personalizado según el resultado de la consulta
     
     Args:
-        estado: 'success', 'error'
-        datos: Datos del cliente (si existe)
-        mensaje_error: Mensaje de error de la API
+        resultado: ConsultaResult de consultar_dni
     
     Returns:
         Tupla (mensaje_completo, tiene_oferta)
     """
-    
-    if estado == 'success' and datos and datos.get('tieneLineaCredito'):
-        # Cliente CON línea de crédito - ÚNICA CONDICIÓN PARA OFERTA
-        nombre = datos.get('nombre', 'Cliente')
-        monto = datos.get('lineaCredito', 0)
-        
-        mensaje_completo = textwrap.dedent(f"""
-            🎉 ¡FELICITACIONES!
-                                           
-            Hola {nombre},
-            ¡Tenemos excelentes noticias para ti!
-                                           
-            Tienes una línea de crédito APROBADA por:
-            💰 S/ {monto:,.2f} soles !!!
-                                           
-        """).strip()
-        
-        return mensaje_completo, True
-    
-    elif estado == 'success' and datos and not datos.get('tieneLineaCredito'):
-        # Cliente registrado pero SIN línea de crédito
-        nombre = datos.get('nombre', 'Cliente')
-        
-        mensaje_completo = textwrap.dedent(f"""
-            ℹ️ INFORMACIÓN DE TU CONSULTA
-                                           
-            Hola {nombre},
-            Gracias por tu interés en nuestros servicios de crédito.
-            En este momento no cuentas con una línea de crédito disponible.
-                                           
-            💡 ¿Cómo puedo calificar?
-               • Mantén tus pagos al día
-               • Continúa usando nuestro servicio regularmente
-               • Evaluamos periódicamente a nuestros clientes
-                                           
-            Sigue usando el servicio de Calidda y muy pronto podrías calificar 
-            para una oferta crediticia.
-                                           
-            ¡Hasta luego!
-        """).strip()
-        
-        return mensaje_completo, False
-
-    elif estado == 'dni_invalido' or (mensaje_error and ('no encontrado' in mensaje_error.lower() or 'no califica' in mensaje_error.lower() or 'no tiene campaña' in mensaje_error.lower())):
-        # DNI no encontrado o sin campaña activa
-        mensaje_completo = textwrap.dedent("""
-            ℹ️ INFORMACIÓN DE TU CONSULTA
-                                           
-            Gracias por tu interés en nuestros servicios de crédito.
-            En este momento no cuentas con una línea de crédito disponible.
-                                           
-            💡 ¿Cómo puedo calificar?
-               • Mantén tus pagos al día
-               • Continúa usando nuestro servicio regularmente
-               • Evaluamos periódicamente a nuestros clientes
-                                           
-            Sigue usando el servicio de Calidda y muy pronto podrías calificar 
-            para una oferta crediticia.
-                                           
-            ¡Hasta luego!
-        """).strip()
-        
-        return mensaje_completo, False
-    
-    else:
-        # Error genérico u otro caso (incluyendo timeout)
-        mensaje_completo = textwrap.dedent("""
-            ⚠️ INFORMACIÓN
-                                           
-            Hola Cliente,
-            En este momento no podemos procesar tu consulta.
-                                           
-            ¡Gracias por tu comprensión!
-        """).strip()
-        
-        return mensaje_completo, False
-
-def determinar_estado_consulta(data, estado, mensaje_api):
-    """Determinar el estado de la consulta para mensaje personalizado"""
-    
-    if estado == 'success' and data:
-        if data.get('tieneLineaCredito'):
-            return 'success'
-        else:
-            return 'sin_credito'
-    
-    elif estado.startswith('invalid:'):
-        mensaje = estado.split('invalid:', 1)[1].strip().lower()
-        
-        if 'no encontrado' in mensaje or 'no existe' in mensaje:
-            return 'dni_invalido'
-        else:
-            return 'error'
-    
-    else:
-        return 'error'
+    mensaje, tiene_oferta = generar_mensajes(resultado)
+    return mensaje.texto, tiene_oferta
 
-def mostrar_resultado(dni, data, estado='success', mensaje_api=None):
-    """Mostrar resultado en consola con mensaje personalizado"""
+def mostrar_resultado(dni, resultado):
+    """Mostrar resultado (ConsultaResult) en consola con mensaje personalizado"""
     
-    # Determinar estado y generar mensaje
-    estado_consulta = determinar_estado_consulta(data, estado, mensaje_api)
-    mensaje_completo, tiene_oferta = generar_mensaje_personalizado(
-        estado_consulta, 
-        data, 
-        mensaje_api
-    )
+    # Generar mensaje
+    with trace.medir('render'):
+        mensaje_completo, tiene_oferta = generar_mensaje_personalizado(resultado)
     
     # ========== DETERMINAR ESTADO DEL DNI ==========
-    if data and data.get('id'):
+    cliente = resultado.cliente
+    if cliente is not None and cliente.id:
         # DNI existe en el sistema (tiene ID de cliente)
-        if data.get('tieneLineaCredito'):
+        if cliente.tiene_linea_credito:
             estado_dni = "✅ DNI VÁLIDO - CON OFERTA"
         else:
             estado_dni = "⚠️ DNI VÁLIDO - SIN OFERTA"
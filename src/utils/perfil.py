@@ -0,0 +1,156 @@
+"""
+Perfilado con cProfile bajo demanda (wrapper y CLI)
+
+En el wrapper, con PROFILE_SAMPLE_RATE > 0 se perfila una fracción de las
+solicitudes /query y sus estadísticas se acumulan para /admin/profile. Con la
+tasa en 0 no se crea el Perfilador y el hot path no hace nada. cProfile mide
+el hilo completo: mientras una solicitud muestreada espera, también se cuenta
+lo que el event loop ejecuta para otras, así que el resultado es un perfil del
+proceso bajo carga real más que de una sola solicitud. Solo hay un perfil
+activo a la vez.
+
+En el CLI, perfilar_sesion() perfila toda la ejecución y la guarda en un
+archivo .prof (pstats, snakeviz).
+"""
+
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Órdenes aceptados por resumen() y texto()
+ORDENES = ('cumulative', 'tottime', 'ncalls')
+_INDICE_ORDEN = {'ncalls': 1, 'tottime': 2, 'cumulative': 3}
+
+class Perfilador:
+    """Muestreo de solicitudes con cProfile y estadísticas acumuladas"""
+
+    def __init__(self, tasa):
+        """
+        Args:
+            tasa: Fracción de solicitudes a perfilar (0 < tasa <= 1)
+        """
+        self.tasa = tasa
+        self._lock = threading.Lock()
+        self._activo = None
+        self._stats = None
+        self.desde = time.time()
+        self.muestreadas = 0
+        self.ocupado = 0  # elegidas mientras otro perfil estaba activo
+
+    def iniciar(self):
+        """
+        Decidir si se perfila esta solicitud y, si es así, empezar
+
+        Returns:
+            El cProfile.Profile activo (pasarlo a terminar()) o None
+        """
+        if random.random() >= self.tasa:
+            return None
+        with self._lock:
+            if self._activo is not None:
+                self.ocupado += 1
+                return None
+            perfil = self._activo = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Otro profiler del proceso (p. ej. un depurador) ya está activo
+            with self._lock:
+                self._activo = None
+                self.ocupado += 1
+            return None
+        return perfil
+
+    def terminar(self, perfil):
+        """Detener un perfil de iniciar() y sumarlo a las estadísticas"""
+        perfil.disable()
+        with self._lock:
+            self._activo = None
+            if self._stats is None:
+                self._stats = pstats.Stats(perfil)
+            else:
+                self._stats.add(perfil)
+            self.muestreadas += 1
+
+    def reiniciar(self):
+        with self._lock:
+            self._stats = None
+            self.desde = time.time()
+            self.muestreadas = 0
+            self.ocupado = 0
+
+    def resumen(self, orden='cumulative', limite=30):
+        """Funciones más costosas acumuladas desde el inicio (o el último reinicio)"""
+        with self._lock:
+            filas = list(self._stats.stats.items()) if self._stats is not None else []
+            datos = {
+                "sample_rate": self.tasa,
+                "since": self.desde,
+                "sampled_requests": self.muestreadas,
+                "skipped_busy": self.ocupado,
+                "sort": orden,
+            }
+        filas.sort(key=lambda fila: fila[1][_INDICE_ORDEN[orden]], reverse=True)
+        datos["functions"] = [
+            {
+                "function": funcion,
+                "file": archivo,
+                "line": linea,
+                "primitive_calls": cc,
+                "calls": nc,
+                "tottime_s": round(tt, 6),
+                "cumtime_s": round(ct, 6),
+            }
+            for (archivo, linea, funcion), (cc, nc, tt, ct, _) in filas[:limite]
+        ]
+        return datos
+
+    def texto(self, orden='cumulative', limite=30):
+        """Salida de pstats.print_stats, o None si todavía no hay muestras"""
+        with self._lock:
+            if self._stats is None:
+                return None
+            salida = io.StringIO()
+            self._stats.stream = salida
+            self._stats.sort_stats(orden).print_stats(limite)
+        return salida.getvalue()
+
+    def volcar(self):
+        """Estadísticas en el formato de archivo .prof (pstats.Stats, snakeviz)"""
+        with self._lock:
+            if self._stats is None:
+                return None
+            return marshal.dumps(self._stats.stats)
+
+def crear_perfilador(tasa):
+    """Perfilador para PROFILE_SAMPLE_RATE, o None si el perfilado está desactivado"""
+    return Perfilador(tasa) if tasa > 0 else None
+
+@contextmanager
+def perfilar_sesion(ruta, limite=25):
+    """
+    Perfilar el bloque completo y guardarlo en ruta (.prof)
+
+    Al terminar imprime las limite funciones con más tiempo acumulado.
+    """
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        perfil.dump_stats(ruta)
+        print(f"\n📈 Perfil guardado en {ruta} (ver con: python -m pstats {ruta})")
+        pstats.Stats(perfil).sort_stats('cumulative').print_stats(limite)
@@ -0,0 +1,44 @@
+"""
+Coalescencia de llamadas concurrentes (single-flight)
+
+Si varias peticiones consultan el mismo DNI al mismo tiempo, solo la primera
+llama a la API; las demás esperan y reciben el mismo resultado o el mismo error.
+Solo el wrapper tiene consultas concurrentes: el CLI consulta de a un DNI.
+"""
+
+import asyncio
+
+class AsyncSingleFlight:
+    """Single-flight para corutinas (consultar_dni_async)"""
+
+    def __init__(self):
+        self._tasks = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        """
+        Ejecutar await fn() una sola vez por key entre las corutinas concurrentes
+
+        La llamada corre en su propia tarea: si el primer solicitante se cancela
+        (p.ej. el cliente HTTP se desconecta) los demás siguen esperando el resultado.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, k=key: self._terminar(k, t))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _terminar(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Marcar la excepción como recuperada aunque todos los solicitantes se hayan cancelado
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._tasks)}
@@ -0,0 +1,211 @@
+"""
+Almacén persistente de resultados en SQLite (modo WAL)
+
+Comparte resultados entre los workers de uvicorn, entre reinicios y entre
+el CLI por lotes y el servicio HTTP. Ofrece la misma interfaz que ResultCache
+(get / put / invalidate / clear / stats, y get_async / put_async para el
+wrapper, que aquí corren en un hilo para no bloquear el event loop mientras
+SQLite espera el lock de otro worker).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from src.config import get_settings
+from src.api.resultado import Cliente, ConsultaResult, Estado
+from src.utils.cache import ResultCache, ttl_resultado
+
+logger = logging.getLogger(__name__)
+
+# Una lectura actualiza updated_at solo si pasaron estos segundos desde la
+# última vez: el orden LRU es aproximado, a cambio de no escribir en cada hit
+_TOQUE_LRU = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resultados (
+    dni TEXT PRIMARY KEY,
+    data TEXT,
+    estado TEXT NOT NULL,
+    mensaje TEXT,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    updated_at REAL NOT NULL  -- última escritura o lectura (orden LRU)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_resultados_stale_until ON resultados (stale_until);
+"""
+
+class SQLiteResultStore:
+    """
+    Almacén de resultados por DNI con TTL por categoría, respaldado por SQLite
+
+    Cada hilo usa su propia conexión. Las entradas vencidas se eliminan en
+    bloque cada purge_every escrituras (o llamando a purge_expired); si aún
+    sobran, las usadas hace más tiempo (LRU, como ResultCache).
+    """
+
+    def __init__(self, path, max_entries, ttls, stale_ttl=0, purge_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(ttls)
+        self.stale_ttl = stale_ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, dni):
+        """
+        Buscar un DNI
+
+        Returns:
+            Tupla (resultado, stale). resultado es None si no hay entrada utilizable.
+        """
+        row = self._conn().execute(
+            'SELECT data, estado, mensaje, expires_at, stale_until, updated_at FROM resultados WHERE dni = ?',
+            (dni,),
+        ).fetchone()
+        now = time.time()
+
+        if row is None or now >= row[4]:
+            with self._lock:
+                self.misses += 1
+            return None, False
+
+        resultado = ConsultaResult(
+            # Filas anteriores a ConsultaResult guardaban 'invalid: <mensaje>'
+            Estado(row[1].split(':', 1)[0]),
+            row[2],
+            cliente=Cliente.desde_api(json.loads(row[0])) if row[0] is not None else None,
+        )
+        stale = now >= row[3]
+        if now - row[5] >= _TOQUE_LRU:
+            self._conn().execute('UPDATE resultados SET updated_at = ? WHERE dni = ?', (now, dni))
+        with self._lock:
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+        return resultado, stale
+
+    async def get_async(self, dni):
+        return await asyncio.to_thread(self.get, dni)
+
+    def put(self, dni, resultado):
+        """
+        Guardar un resultado si su categoría es cacheable
+
+        Returns:
+            True si se guardó
+        """
+        ttl = ttl_resultado(resultado, self.ttls)
+        if ttl <= 0:
+            return False
+
+        cliente = resultado.cliente
+        now = time.time()
+        self._conn().execute(
+            'INSERT OR REPLACE INTO resultados '
+            '(dni, data, estado, mensaje, expires_at, stale_until, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                dni,
+                json.dumps(cliente.a_dict(), ensure_ascii=False) if cliente is not None else None,
+                resultado.estado.value,
+                resultado.mensaje,
+                now + ttl,
+                now + ttl + self.stale_ttl,
+                now,
+            ),
+        )
+
+        with self._lock:
+            self._puts += 1
+            purgar = self._puts % self.purge_every == 0
+        if purgar:
+            self.purge_expired()
+        return True
+
+    async def put_async(self, dni, resultado):
+        return await asyncio.to_thread(self.put, dni, resultado)
+
+    def purge_expired(self):
+        """
+        Eliminar en bloque las entradas vencidas y, si se supera max_entries,
+        las menos recientes
+
+        Returns:
+            Número de filas eliminadas
+        """
+        conn = self._conn()
+        eliminadas = conn.execute(
+            'DELETE FROM resultados WHERE stale_until <= ?', (time.time(),)
+        ).rowcount
+        exceso = conn.execute('SELECT COUNT(*) FROM resultados').fetchone()[0] - self.max_entries
+        if exceso > 0:
+            eliminadas += conn.execute(
+                'DELETE FROM resultados WHERE dni IN '
+                '(SELECT dni FROM resultados ORDER BY updated_at LIMIT ?)',
+                (exceso,),
+            ).rowcount
+        with self._lock:
+            self.evictions += eliminadas
+        if eliminadas:
+            logger.debug("Store: %s resultados eliminados", eliminadas)
+        return eliminadas
+
+    def invalidate(self, dni):
+        self._conn().execute('DELETE FROM resultados WHERE dni = ?', (dni,))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM resultados')
+
+    def stats(self):
+        """Contadores de uso del almacén (hits/misses son de este proceso)"""
+        size = self._conn().execute('SELECT COUNT(*) FROM resultados').fetchone()[0]
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "size": size,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+def crear_result_store():
+    """Crear el almacén de resultados configurado con RESULT_STORE ('memory' o 'sqlite')"""
+    s = get_settings()
+    ttls = {
+        "success": s.CACHE_TTL_SUCCESS,
+        "sin_credito": s.CACHE_TTL_SIN_CREDITO,
+        "no_encontrado": s.CACHE_TTL_NO_ENCONTRADO,
+    }
+    if s.RESULT_STORE == 'sqlite':
+        path = s.RESULT_STORE_PATH or os.path.join(s.OUTPUT_DIR, 'resultados.sqlite3')
+        return SQLiteResultStore(path, s.CACHE_MAX_ENTRIES, ttls, stale_ttl=s.CACHE_STALE_TTL)
+    return ResultCache(s.CACHE_MAX_ENTRIES, ttls, stale_ttl=s.CACHE_STALE_TTL)
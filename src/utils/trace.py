@@ -0,0 +1,107 @@
+"""
+Tiempos por fase de una consulta (header Server-Timing y log estructurado)
+
+Una Traza se activa por solicitud con un ContextVar: el código de la consulta
+registra sus fases con medir() o registrar() sin recibir la traza como
+argumento, y las tareas asyncio creadas durante la solicitud la heredan. Sin
+una traza activa ambas funciones no hacen nada.
+
+Fases: cache, scheduler (espera de turno en el planificador), session, login,
+governor (espera del regulador), probe, full, parse y render. Una fase que ocurre varias veces (p.ej. parse) acumula su tiempo.
+"""
+
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_actual = contextvars.ContextVar('traza', default=None)
+
+class Traza:
+    """Tiempos de las fases de una solicitud"""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.fases = {}  # fase -> segundos
+        self.datos = {}  # anotaciones para el log (p.ej. cache: hit)
+
+    def registrar(self, fase, segundos):
+        self.fases[fase] = self.fases.get(fase, 0.0) + segundos
+
+    @contextmanager
+    def activa(self):
+        """Hacer de esta la traza actual mientras dure el bloque"""
+        token = _actual.set(self)
+        try:
+            yield self
+        finally:
+            _actual.reset(token)
+            self.fin = time.perf_counter()
+
+    @property
+    def total(self):
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    def milisegundos(self):
+        """Dict fase -> ms (incluye 'total')"""
+        ms = {fase: round(s * 1000, 1) for fase, s in self.fases.items()}
+        ms['total'] = round(self.total * 1000, 1)
+        return ms
+
+    def server_timing(self):
+        """Valor del header Server-Timing"""
+        return ', '.join(f"{fase};dur={ms}" for fase, ms in self.milisegundos().items())
+
+    def texto(self):
+        """Desglose legible para el CLI"""
+        return ' | '.join(f"{fase} {ms:.0f} ms" for fase, ms in self.milisegundos().items())
+
+    def log(self, **campos):
+        """Emitir una línea JSON con el request_id, los campos dados y los tiempos"""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        registro = {'request_id': self.request_id}
+        registro.update(self.datos)
+        registro.update(campos)
+        registro['timings_ms'] = self.milisegundos()
+        # Con LOG_FORMAT=json los campos van al nivel superior de la línea (utils.logs)
+        logger.info('%s', json.dumps(registro, ensure_ascii=False), extra={'campos': registro})
+
+def actual():
+    """Traza activa en este contexto, o None"""
+    return _actual.get()
+
+def desvincular():
+    """Dejar sin traza el contexto actual (p.ej. una tarea en segundo plano)"""
+    _actual.set(None)
+
+def anotar(clave, valor):
+    """Agregar un dato al log de la traza activa, si hay una"""
+    traza = _actual.get()
+    if traza is not None:
+        traza.datos[clave] = valor
+
+def registrar(fase, segundos):
+    """Sumar segundos a una fase de la traza activa, si hay una"""
+    traza = _actual.get()
+    if traza is not None:
+        traza.registrar(fase, segundos)
+
+@contextmanager
+def medir(fase):
+    """Medir el bloque como una fase de la traza activa, si hay una"""
+    traza = _actual.get()
+    if traza is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        traza.registrar(fase, time.perf_counter() - inicio)
@@ -0,0 +1,16 @@
+"""
+Configuración común de las pruebas
+
+Las clases probadas leen get_settings() al crearse: se fijan credenciales de
+prueba para que la validación pase sin un .env.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault('CALIDDA_USUARIO', 'usuario-prueba')
+os.environ.setdefault('CALIDDA_PASSWORD', 'password-prueba')
+os.environ.setdefault('LOG_FILE', '')
@@ -0,0 +1,57 @@
+import types
+
+import pytest
+
+from src.api.resultado import Cliente, ConsultaResult, Estado
+from src.utils import cache
+from src.utils.cache import ResultCache
+
+TTLS = {'success': 10, 'sin_credito': 10, 'no_encontrado': 0}
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj monotónico controlado por la prueba (reloj.ahora en segundos)"""
+    falso = types.SimpleNamespace(ahora=1000.0)
+    falso.monotonic = lambda: falso.ahora
+    monkeypatch.setattr(cache, 'time', falso)
+    return falso
+
+def _exito(linea=1000):
+    return ConsultaResult(Estado.SUCCESS, cliente=Cliente(id=1, nombre='Cliente', linea_credito=linea,
+                                                           tiene_linea_credito=True))
+
+def test_fresco_luego_stale_luego_vencido(reloj):
+    c = ResultCache(max_entries=10, ttls=TTLS, stale_ttl=5)
+    resultado = _exito()
+    assert c.put('12345678', resultado)
+    assert c.get('12345678') == (resultado, False)
+
+    reloj.ahora += 12
+    assert c.get('12345678') == (resultado, True)
+
+    reloj.ahora += 5
+    assert c.get('12345678') == (None, False)
+    stats = c.stats()
+    assert (stats['hits'], stats['stale_hits'], stats['misses'], stats['size']) == (1, 1, 1, 0)
+
+def test_sin_stale_ttl_vence_al_terminar_el_ttl(reloj):
+    c = ResultCache(max_entries=10, ttls=TTLS)
+    c.put('12345678', _exito())
+    reloj.ahora += 10
+    assert c.get('12345678') == (None, False)
+
+def test_no_guarda_errores_ni_categorias_con_ttl_cero(reloj):
+    c = ResultCache(max_entries=10, ttls=TTLS, stale_ttl=5)
+    assert not c.put('11111111', ConsultaResult(Estado.TIMEOUT, 'Timeout'))
+    assert not c.put('22222222', ConsultaResult(Estado.INVALID, 'DNI no encontrado'))
+    assert c.stats()['size'] == 0
+
+def test_lru_descarta_la_entrada_menos_usada(reloj):
+    c = ResultCache(max_entries=2, ttls=TTLS)
+    c.put('11111111', _exito())
+    c.put('22222222', _exito())
+    c.get('11111111')
+    c.put('33333333', _exito())
+    assert c.get('22222222') == (None, False)
+    assert c.get('11111111')[0] is not None
+    assert c.stats()['evictions'] == 1
@@ -0,0 +1,59 @@
+import time
+
+from src.api.circuit import ABIERTO, CERRADO, SEMIABIERTO, CircuitBreaker
+from src.api.resultado import Cliente, ConsultaResult, Estado
+
+FALLA = ConsultaResult(Estado.TIMEOUT, 'Timeout')
+EXITO = ConsultaResult(Estado.SUCCESS, cliente=Cliente(id=1, nombre='Cliente'))
+
+def _abrir(circuito):
+    for _ in range(circuito.umbral):
+        assert circuito.permitir()
+        circuito.registrar(FALLA)
+    assert circuito.estado == ABIERTO
+
+def _circuito(segundos_abierto=0.05):
+    return CircuitBreaker(umbral=2, segundos_abierto=segundos_abierto, pruebas=1)
+
+def test_abre_tras_el_umbral_y_rechaza():
+    circuito = _circuito(segundos_abierto=60)
+    _abrir(circuito)
+    assert circuito.abierto()
+    assert not circuito.permitir()
+    assert circuito.stats()['rejected'] == 1
+
+def test_half_open_deja_salir_solo_las_pruebas_configuradas():
+    circuito = _circuito()
+    _abrir(circuito)
+    time.sleep(0.06)
+    assert circuito.permitir()
+    assert circuito.estado == SEMIABIERTO
+    assert not circuito.permitir()
+
+def test_prueba_exitosa_cierra_el_circuito():
+    circuito = _circuito()
+    _abrir(circuito)
+    time.sleep(0.06)
+    assert circuito.permitir()
+    circuito.registrar(EXITO)
+    assert circuito.estado == CERRADO
+    assert circuito.fallas_seguidas == 0
+
+def test_prueba_fallida_vuelve_a_abrir():
+    circuito = _circuito()
+    _abrir(circuito)
+    time.sleep(0.06)
+    assert circuito.permitir()
+    circuito.registrar(FALLA)
+    assert circuito.estado == ABIERTO
+    assert circuito.stats()['opened'] == 2
+
+def test_liberar_devuelve_la_prueba_sin_cerrar_ni_abrir():
+    circuito = _circuito()
+    _abrir(circuito)
+    time.sleep(0.06)
+    assert circuito.permitir()
+    # Llamada cancelada: no cuenta como éxito ni como falla
+    circuito.liberar()
+    assert circuito.estado == SEMIABIERTO
+    assert circuito.permitir()
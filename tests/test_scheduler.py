@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from src.api.scheduler import INTERACTIVA, MASIVA, Planificador
+
+async def _esperar_turno(planificador, clase, nombre, orden, clave=None):
+    await planificador.adquirir(clase, clave)
+    orden.append(nombre)
+
+async def _encolar(planificador, pedidos, orden):
+    """Encolar los pedidos (nombre, clase, clave) en orden, con el único lugar ocupado"""
+    tareas = []
+    for nombre, clase, clave in pedidos:
+        tareas.append(asyncio.create_task(_esperar_turno(planificador, clase, nombre, orden, clave)))
+        await asyncio.sleep(0)
+    return tareas
+
+async def _liberar_todos(planificador, tareas):
+    for _ in tareas:
+        planificador.liberar()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tareas)
+
+def test_interactivas_primero_con_un_turno_masivo_cada_peso():
+    async def escenario():
+        planificador = Planificador(concurrencia=1, peso=2)
+        await planificador.adquirir(INTERACTIVA)
+        orden = []
+        tareas = await _encolar(planificador, [
+            ('m1', MASIVA, None), ('m2', MASIVA, None), ('m3', MASIVA, None),
+            ('i1', INTERACTIVA, None), ('i2', INTERACTIVA, None), ('i3', INTERACTIVA, None),
+        ], orden)
+        await _liberar_todos(planificador, tareas)
+        return orden, planificador.stats()
+
+    orden, stats = asyncio.run(escenario())
+    assert orden == ['i1', 'i2', 'm1', 'i3', 'm2', 'm3']
+    assert stats['classes'][INTERACTIVA]['granted'] == 4
+    assert stats['classes'][MASIVA]['granted'] == 3
+
+def test_cancelar_en_cola_propaga_y_no_ocupa_lugar():
+    async def escenario():
+        planificador = Planificador(concurrencia=1)
+        await planificador.adquirir(INTERACTIVA)
+        tarea = asyncio.create_task(planificador.adquirir(MASIVA))
+        await asyncio.sleep(0)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        assert planificador.stats()['classes'][MASIVA]['queued'] == 0
+        planificador.liberar()
+        return planificador.stats()
+
+    stats = asyncio.run(escenario())
+    assert stats['in_use'] == 0
+
+def test_cancelar_con_el_turno_ya_concedido_lo_devuelve():
+    async def escenario():
+        planificador = Planificador(concurrencia=1)
+        await planificador.adquirir(INTERACTIVA)
+        tarea = asyncio.create_task(planificador.adquirir(INTERACTIVA))
+        await asyncio.sleep(0)
+        # El lugar pasa a la tarea, que se cancela antes de retomar
+        planificador.liberar()
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        assert planificador.stats()['in_use'] == 0
+        # El lugar devuelto se puede volver a tomar sin esperar
+        await asyncio.wait_for(planificador.adquirir(INTERACTIVA), 1)
+        return planificador.stats()
+
+    assert asyncio.run(escenario())['in_use'] == 1
+
+def test_promover_adelanta_el_turno_masivo_de_la_clave():
+    async def escenario():
+        planificador = Planificador(concurrencia=1)
+        await planificador.adquirir(INTERACTIVA)
+        orden = []
+        tareas = await _encolar(planificador, [
+            ('m1', MASIVA, '11111111'), ('m2', MASIVA, '22222222'),
+        ], orden)
+        assert planificador.promover('22222222')
+        assert not planificador.promover('33333333')
+        await _liberar_todos(planificador, tareas)
+        return orden, planificador.stats()
+
+    orden, stats = asyncio.run(escenario())
+    assert orden == ['m2', 'm1']
+    assert stats['promoted'] == 1
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from src.utils.singleflight import AsyncSingleFlight
+
+def test_llamadas_concurrentes_comparten_una_ejecucion():
+    async def escenario():
+        sf = AsyncSingleFlight()
+        liberar = asyncio.Event()
+        llamadas = []
+
+        async def consultar():
+            llamadas.append(1)
+            await liberar.wait()
+            return 'resultado'
+
+        tareas = [asyncio.create_task(sf.do('12345678', consultar)) for _ in range(3)]
+        await asyncio.sleep(0)
+        liberar.set()
+        return await asyncio.gather(*tareas), llamadas, sf.stats()
+
+    resultados, llamadas, stats = asyncio.run(escenario())
+    assert resultados == ['resultado'] * 3
+    assert len(llamadas) == 1
+    assert stats == {"calls": 1, "shared": 2, "in_flight": 0}
+
+def test_claves_distintas_no_se_comparten():
+    async def escenario():
+        sf = AsyncSingleFlight()
+
+        async def consultar(dni):
+            await asyncio.sleep(0)
+            return dni
+
+        return await asyncio.gather(
+            sf.do('11111111', lambda: consultar('11111111')),
+            sf.do('22222222', lambda: consultar('22222222')),
+        ), sf.stats()
+
+    resultados, stats = asyncio.run(escenario())
+    assert resultados == ['11111111', '22222222']
+    assert stats['calls'] == 2
+
+def test_cancelar_al_primero_no_cancela_a_los_demas():
+    async def escenario():
+        sf = AsyncSingleFlight()
+        liberar = asyncio.Event()
+
+        async def consultar():
+            await liberar.wait()
+            return 'resultado'
+
+        primero = asyncio.create_task(sf.do('12345678', consultar))
+        segundo = asyncio.create_task(sf.do('12345678', consultar))
+        await asyncio.sleep(0)
+        primero.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primero
+        liberar.set()
+        return await segundo, sf.stats()
+
+    resultado, stats = asyncio.run(escenario())
+    assert resultado == 'resultado'
+    assert stats['in_flight'] == 0
+
+def test_la_excepcion_llega_a_todos():
+    async def escenario():
+        sf = AsyncSingleFlight()
+
+        async def consultar():
+            await asyncio.sleep(0)
+            raise RuntimeError('falló')
+
+        return await asyncio.gather(
+            sf.do('12345678', consultar), sf.do('12345678', consultar), return_exceptions=True,
+        )
+
+    errores = asyncio.run(escenario())
+    assert all(isinstance(e, RuntimeError) for e in errores)
+    assert errores[0] is errores[1]
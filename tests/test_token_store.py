@@ -0,0 +1,72 @@
+import asyncio
+import fcntl
+import os
+import time
+
+import pytest
+
+from src.api.token_store import TokenStore
+
+def _store(tmp_path):
+    return TokenStore(str(tmp_path / 'token.json'), refresh_margin=60, fallback_ttl=3600)
+
+def _login_async(contador):
+    async def login():
+        contador.append(1)
+        return 'sesion', {'token': f'token-{len(contador)}', 'exp': time.time() + 3600}
+    return login
+
+def _lock_tomado(store):
+    """True si otro proceso (otra descripción de archivo) no puede tomar el lock"""
+    fd = os.open(store.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+def test_login_una_vez_y_luego_reutiliza(tmp_path):
+    store = _store(tmp_path)
+    logins = []
+
+    async def escenario():
+        primera = await store.autenticar_async(_login_async(logins), lambda info: 'reusada')
+        segunda = await store.autenticar_async(_login_async(logins), lambda info: 'reusada')
+        return primera, segunda
+
+    primera, segunda = asyncio.run(escenario())
+    assert primera[0] == 'sesion'
+    assert segunda == ('reusada', store.leer())
+    assert store.stats()['logins'] == 1 and store.stats()['reused'] == 1
+    assert not _lock_tomado(store)
+
+def test_cancelar_mientras_espera_el_lock_no_lo_deja_tomado(tmp_path):
+    store = _store(tmp_path)
+    logins = []
+    otro = os.open(store.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.flock(otro, fcntl.LOCK_EX)
+
+    async def esperar():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.autenticar_async(_login_async(logins), lambda info: None), 0.1)
+
+    try:
+        asyncio.run(esperar())
+    finally:
+        fcntl.flock(otro, fcntl.LOCK_UN)
+        os.close(otro)
+
+    assert not logins
+    assert not _lock_tomado(store)
+    sesion, _ = asyncio.run(store.autenticar_async(_login_async(logins), lambda info: None))
+    assert sesion == 'sesion'
+
+def test_forzar_hace_login_aunque_el_token_siga_vigente(tmp_path):
+    store = _store(tmp_path)
+    logins = []
+    asyncio.run(store.autenticar_async(_login_async(logins), lambda info: 'reusada'))
+    _, info = asyncio.run(store.autenticar_async(_login_async(logins), lambda info: 'reusada', forzar=True))
+    assert len(logins) == 2
+    assert store.leer()['token'] == info['token'] == 'token-2'